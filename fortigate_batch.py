@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from fortigate_cache import add_cache_arguments
+from fortigate_cli import expand_inputs, output_paths
+
+
+# 批处理任务 -> 默认输出格式与各格式的文件后缀
+BATCH_MODES = {
+    'html': ('html', {'html': '.html', 'html.gz': '.html.gz', 'packed': '.html'}),
+    'check': ('text', {'text': '.txt', 'json': '.json'}),
+}
+
+
+def _quiet_worker():
+    # 子进程的“生成完了”等输出不混进汇总，进度与汇总只由主进程输出
+    sys.stdout = open(os.devnull, "w")
+
+
+def process_file(mode, conf_path, out_file, vdoms, fmt, cache_dir=None):
+    """
+    子进程里处理一份配置。任何异常都在这里捕获并作为结果返回，不影响其他文件。
+    cache_dir 不为 None 时经解析缓存读取（'' 为默认目录）。
+    返回 {'path', 'ok', 'output', 'policies', 'issues', 'seconds', 'error'}
+    """
+    started = time.perf_counter()
+    result = {'path': conf_path, 'ok': False, 'output': out_file, 'policies': None, 'issues': None, 'error': None}
+    try:
+        from fortigate_cache import ParseCache, load_parsed
+        cache = ParseCache(cache_dir or None) if cache_dir is not None else None
+        if mode == 'html':
+            from fortigate_to_html import build_report
+            result['policies'] = build_report(conf_path, out_file, vdoms, fmt, cache)
+        else:
+            from fortigate import check_config, write_check_result
+            model, conf_text = load_parsed(conf_path, cache)
+            all_issues, summary = check_config(conf_text, vdoms, model)
+            with open(out_file, "w", encoding="utf-8") as out:
+                write_check_result(conf_path, all_issues, summary, fmt, out)
+            result['issues'] = len(all_issues)
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['traceback'] = traceback.format_exc()
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_batch(inputs, output_dir, mode='html', fmt=None, vdoms=None, jobs=None, progress=None, cache_dir=None):
+    """
+    用进程池并行处理多份配置，返回按输入顺序排列的结果列表。
+    大文件先提交（最长处理时间优先），减少最后只剩一个大文件在跑的情况。
+    progress(完成数, 总数, 结果) 在每个文件完成时调用（主进程内，按完成顺序）。
+    """
+    fmt = fmt or BATCH_MODES[mode][0]
+    targets = output_paths(inputs, output_dir, BATCH_MODES[mode][1][fmt])
+    results = {}
+    pending = []
+    for path in inputs:
+        if os.path.isfile(path):
+            pending.append(path)
+        else:
+            results[path] = {'path': path, 'ok': False, 'output': None, 'policies': None,
+                             'issues': None, 'seconds': 0, 'error': "ファイルが見つかりません"}
+    pending.sort(key=os.path.getsize, reverse=True)
+    done = len(results)
+    if progress:
+        for path in inputs:
+            if path in results:
+                progress(done, len(inputs), results[path])
+
+    workers = min(jobs or os.cpu_count() or 1, max(len(pending), 1))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_quiet_worker) as pool:
+        futures = {
+            pool.submit(process_file, mode, path, targets[path], vdoms, fmt, cache_dir): path
+            for path in pending
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # 子进程本身崩溃（内存不足被杀等）也只记为这个文件失败
+                result = {'path': path, 'ok': False, 'output': targets[path], 'policies': None,
+                          'issues': None, 'seconds': None, 'error': f"{type(e).__name__}: {e}"}
+            results[path] = result
+            done += 1
+            if progress:
+                progress(done, len(inputs), result)
+    return [results[path] for path in inputs]
+
+
+def summary_lines(results):
+    """按输入顺序的日文汇总行"""
+    lines = []
+    for r in results:
+        if r['ok']:
+            detail = []
+            if r['policies'] is not None:
+                detail.append(f"ポリシー {r['policies']}件")
+            if r['issues'] is not None:
+                detail.append(f"指摘 {r['issues']}件")
+            lines.append(f"OK  {r['path']}  {' '.join(detail)}  {r['seconds']}秒 -> {r['output']}")
+        else:
+            lines.append(f"NG  {r['path']}  {r['error']}")
+    failed = sum(1 for r in results if not r['ok'])
+    lines.append(f"合計 {len(results)}件（成功 {len(results) - failed}件 / 失敗 {failed}件）")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多数の FortiGate 設定ファイルをプロセスプールで並列処理します。")
+    parser.add_argument('paths', nargs='+', help="設定ファイル・ワイルドカード・ディレクトリ（複数可）")
+    parser.add_argument('-d', '--output-dir', default='.', help="出力ディレクトリ（既定: カレント）")
+    parser.add_argument('-m', '--mode', choices=sorted(BATCH_MODES), default='html',
+                        help="html: 可視化レポート / check: 参照・シャドウ検査結果")
+    parser.add_argument('-f', '--format', help="html: html / html.gz / packed、check: text / json")
+    parser.add_argument('--vdom', action='append', default=[], metavar='NAME', help="対象 VDOM（複数可）")
+    parser.add_argument('-j', '--jobs', type=int, help="並列プロセス数（既定: CPU コア数）")
+    add_cache_arguments(parser)
+    parser.add_argument('--summary-json', metavar='FILE', help="結果一覧を JSON でも保存")
+    parser.add_argument('-q', '--quiet', action='store_true', help="進捗を表示しない")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or BATCH_MODES[args.mode][0]
+    if fmt not in BATCH_MODES[args.mode][1]:
+        parser.error(f"--mode {args.mode} では --format {fmt} は使えません。")
+    inputs = expand_inputs(args.paths)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    def progress(done, total, result):
+        mark = "OK" if result['ok'] else "NG"
+        print(f"[{done}/{total}] {mark} {result['path']}", file=sys.stderr, flush=True)
+
+    # 子进程里按目录重建 ParseCache（'' 为默认目录）
+    cache_dir = (args.cache_dir or '') if args.cache or args.cache_dir else None
+    started = time.perf_counter()
+    results = run_batch(
+        inputs, args.output_dir, args.mode, fmt, args.vdom, args.jobs,
+        progress=None if args.quiet else progress, cache_dir=cache_dir,
+    )
+    for line in summary_lines(results):
+        print(line)
+    print(f"処理時間 {time.perf_counter() - started:.1f}秒")
+    if args.summary_json:
+        with open(args.summary_json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+    return 1 if any(not r['ok'] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import mmap
+import os
+import pickle
+import sys
+import tempfile
+
+from fortigate_groups import group_closure, remember_closure
+from fortigate_match import PolicyMatcher
+from fortigate_model import load_objects, load_policies, load_vdom_objects
+from fortigate_parser import PARSER_VERSION, open_config
+
+
+# 快照里预先计算闭包的组类别
+CLOSURE_KINDS = ('addrgrp', 'addrgrp6', 'vipgrp', 'servicegrp', 'schedulegroup')
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'fortigate-tools')
+DEFAULT_MAX_BYTES = 512 << 20
+
+# 快照文件头的魔数，载入时校验（解析器版本在文件名里）
+_MAGIC = b'FGSNAP1\n'
+_SUFFIX = '.snap'
+
+
+class ParsedConfig:
+    """
+    一份配置的解析结果（可整体序列化）:
+      vdom_objects: {vdom名(global 为 None): VdomObjects}
+      objects:      整份配置合并的 VdomObjects
+      policies:     按文档顺序的 Policy 列表（带 vdom）
+      closures:     [GroupClosure, ...]，各范围各组类别的闭包
+      rulebases:    {vdom: CompiledRulebase}，已编译的规则库（matcher() 时补齐并沿用）
+    """
+    __slots__ = ('vdom_objects', 'objects', 'policies', 'closures', 'rulebases')
+
+    def __init__(self, conf):
+        self.vdom_objects = load_vdom_objects(conf)
+        self.objects = load_objects(conf)
+        self.policies = load_policies(conf)
+        self.closures = self.build_closures()
+        self.rulebases = {}
+
+    @classmethod
+    def assemble(cls, vdom_objects, objects, policies, closures=None, rulebases=None):
+        """由已有的各部分组装（增量解析用），不读配置"""
+        model = cls.__new__(cls)
+        model.vdom_objects = vdom_objects
+        model.objects = objects
+        model.policies = policies
+        model.closures = closures if closures is not None else model.build_closures()
+        model.rulebases = rulebases or {}
+        return model
+
+    def scopes(self):
+        """闭包所在的全部对象范围；合并视图放在最后登记，闭包缓存满时先淘汰的是各 vdom 的"""
+        return (*self.vdom_objects.values(), self.objects)
+
+    def build_closures(self, known=None):
+        """各范围各组类别的闭包；known: {id(组字典): GroupClosure}，命中的直接沿用"""
+        closures = []
+        for objs in self.scopes():
+            for kind in CLOSURE_KINDS:
+                groups = objs.kind(kind)
+                if not groups:
+                    continue
+                closure = known.get(id(groups)) if known else None
+                if closure is None:
+                    closure = group_closure(groups, objs.lookup(kind))
+                closures.append(closure)
+        return closures
+
+    def matcher(self):
+        """按 vdom 编译的 PolicyMatcher；已编译的规则库直接沿用，新编译的留在 rulebases 里"""
+        matcher = PolicyMatcher(objects=self.vdom_objects, policies=self.policies, reuse=self.rulebases)
+        self.rulebases = matcher.rulebases
+        return matcher
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        # 闭包按组字典的身份缓存，载入后重新登记
+        for closure in self.closures:
+            remember_closure(closure)
+
+
+def config_digest(conf):
+    """配置内容的 sha256（十六进制）；conf 可以是 str / bytes / mmap"""
+    if isinstance(conf, str):
+        conf = conf.encode('utf-8')
+    return hashlib.sha256(conf).hexdigest()
+
+
+class ParseCache:
+    """
+    磁盘上的解析缓存。键为配置内容的哈希与 PARSER_VERSION，值为 ParsedConfig 的二进制快照。
+    载入时 mmap 快照文件直接反序列化；目录总大小超过 max_bytes 时按最近使用时间（mtime）淘汰。
+    快照用 pickle 保存，缓存目录只应由本人写入。
+    """
+    __slots__ = ('directory', 'max_bytes', 'hits', 'misses')
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or os.environ.get('FORTIGATE_CACHE_DIR') or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, digest):
+        return os.path.join(self.directory, f"{digest}.v{PARSER_VERSION}{_SUFFIX}")
+
+    def get(self, digest):
+        """命中返回 ParsedConfig，否则 None（损坏的快照直接删除）"""
+        path = self.path_for(digest)
+        try:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as snap:
+                if snap[:len(_MAGIC)] != _MAGIC:
+                    raise ValueError("bad snapshot header")
+                view = memoryview(snap)
+                try:
+                    model = pickle.loads(view[len(_MAGIC):])
+                finally:
+                    view.release()
+        except FileNotFoundError:
+            return None
+        except Exception:
+            self._remove(path)
+            return None
+        # 记录最近使用时间，供 LRU 淘汰
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return model
+
+    def put(self, digest, model):
+        """写入快照（先写临时文件再改名，多进程同时写同一份也不会读到半截），然后按大小淘汰"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_MAGIC)
+                pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path_for(digest))
+        except BaseException:
+            self._remove(tmp)
+            raise
+        self.evict(keep=self.path_for(digest))
+
+    def load(self, conf_path):
+        """
+        读取一份配置的解析结果: (ParsedConfig, 配置缓冲)。
+        配置缓冲总是返回，遮蔽分析等仍需要按段读取原文的处理可以继续使用。
+        """
+        conf = open_config(conf_path)
+        digest = config_digest(conf)
+        model = self.get(digest)
+        if model is not None:
+            self.hits += 1
+            return model, conf
+        self.misses += 1
+        model = ParsedConfig(conf)
+        self.put(digest, model)
+        return model, conf
+
+    def entries(self):
+        """缓存目录里的快照: [(mtime, 大小, 路径)]，旧的在前"""
+        result = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return result
+        for name in names:
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            result.append((st.st_mtime, st.st_size, path))
+        result.sort()
+        return result
+
+    def evict(self, keep=None):
+        """总大小超过 max_bytes 时从最久未使用的开始删除（keep 指定的文件不删）。返回删除数"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def load_parsed(conf_path, cache=None):
+    """有缓存时经缓存读取，否则直接解析: (ParsedConfig, 配置缓冲)"""
+    if cache is not None:
+        return cache.load(conf_path)
+    conf = open_config(conf_path)
+    return ParsedConfig(conf), conf
+
+
+def add_cache_arguments(parser):
+    """各工具共用的 --cache / --cache-dir 选项（--cache 是开关，目录只能用 --cache-dir 指定）"""
+    parser.add_argument('--cache', action='store_true', help="解析キャッシュを使う")
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help=f"キャッシュディレクトリ（指定すると --cache も有効。既定: $FORTIGATE_CACHE_DIR または {DEFAULT_CACHE_DIR}）")
+
+
+def cache_from_args(args):
+    """add_cache_arguments 的选项 -> ParseCache，未启用时为 None"""
+    if args.cache or args.cache_dir:
+        return ParseCache(args.cache_dir)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="解析キャッシュの状態表示・事前作成・削除を行います。")
+    parser.add_argument('paths', nargs='*', help="事前にキャッシュする設定ファイル")
+    parser.add_argument('--cache-dir', help=f"キャッシュディレクトリ（既定: $FORTIGATE_CACHE_DIR または {DEFAULT_CACHE_DIR}）")
+    parser.add_argument('--max-mb', type=int, default=DEFAULT_MAX_BYTES >> 20, help="キャッシュの上限サイズ（MB）")
+    parser.add_argument('--clear', action='store_true', help="キャッシュを全て削除")
+    args = parser.parse_args(argv)
+
+    cache = ParseCache(args.cache_dir, args.max_mb << 20)
+    if args.clear:
+        cache.clear()
+    for path in args.paths:
+        cache.load(path)
+    entries = cache.entries()
+    print(f"キャッシュ: {cache.directory}")
+    print(f"スナップショット {len(entries)}件 / {sum(size for _, size, _ in entries) / (1 << 20):.1f} MB"
+          f"（上限 {args.max_mb} MB）")
+    if args.paths:
+        print(f"ヒット {cache.hits}件 / 新規解析 {cache.misses}件")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import glob
+import os
+
+
+def expand_inputs(patterns):
+    """
+    命令行的路径/通配符/目录 -> 去重后的文件列表。
+    按参数顺序展开，每个通配符内按名字排序；目录取其中的 *.conf。
+    没有匹配到任何文件的参数原样保留，由调用方报告“找不到”。
+    """
+    result = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.conf')))
+        elif any(c in pattern for c in '*?['):
+            matches = sorted(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+            if not matches:
+                matches = [pattern]
+        else:
+            matches = [pattern]
+        for path in matches:
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                result.append(path)
+    return result
+
+
+def output_paths(inputs, output_dir, suffix):
+    """
+    每个输入文件的输出路径: {输入: 输出目录/主文件名+suffix}。
+    不同目录下的同名备份（如按日期分目录）加上父目录名区分，仍冲突时追加序号。
+    """
+    result = {}
+    used = set()
+    for path in inputs:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = stem
+        if name in used:
+            parent = os.path.basename(os.path.dirname(os.path.abspath(path)))
+            name = f"{parent}_{stem}"
+        n = 2
+        base = name
+        while name in used:
+            name = f"{base}_{n}"
+            n += 1
+        used.add(name)
+        result[path] = os.path.join(output_dir, name + suffix)
+    return result
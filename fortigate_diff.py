@@ -0,0 +1,349 @@
+import argparse
+import json
+import sys
+from html import escape
+
+from fortigate_cache import add_cache_arguments, cache_from_args, load_parsed
+from fortigate_groups import group_closure
+from fortigate_refs import FLATTEN_FIELDS, KIND_LABELS
+from fortigate_to_html import REPORT_CSS, ReportWriter
+from fortigate_vdoms import group_by_vdom
+
+
+# 比较的对象类别（按报告中的顺序）
+DIFF_KINDS = ('address', 'address6', 'vip', 'addrgrp', 'addrgrp6', 'vipgrp', 'service', 'servicegrp')
+
+DIFF_FORMATS = {'html': '.html', 'html.gz': '.html.gz', 'json': '.json'}
+
+DIFF_CSS = """
+        .row-add {background: #e6ffe6 !important;}
+        .row-eff {background: #eef3ff !important;}
+        .chg-old {color: #b00; text-decoration: line-through;}
+        .chg-new {color: #070;}
+        .chg-field {color: #555; font-weight: bold;}
+        .summary td {text-align: right;}
+        table.changelog {min-width: 900px; margin-bottom: 18px;}
+"""
+
+_EMPTY = frozenset()
+
+
+def _policy_data(pol):
+    data = pol.to_dict()
+    data.pop('vdom', None)
+    return data
+
+
+def _same_digest(old, new):
+    """解析时算好的内容哈希相同（增量解析沿用的同一个对象也算），不必再逐字段比较"""
+    return old is new or (new.digest is not None and old.digest == new.digest)
+
+
+def _field_changes(old, new):
+    """{字段: [旧值, 新值]}，只含不同的字段（旧的字段顺序在前）"""
+    changes = {}
+    for key in {**old, **new}:
+        if old.get(key) != new.get(key):
+            changes[key] = [old.get(key), new.get(key)]
+    return changes
+
+
+def diff_objects(old_objs, new_objs):
+    """
+    一个 vdom 的对象差分（按名字匹配）: {类别: {'added': [名], 'removed': [名], 'modified': [{'name', 'changes'}]}}
+    内容哈希相同的直接跳过，不同的再比较 to_dict() 的各字段；只有变化的类别出现在结果里。
+    """
+    result = {}
+    for kind in DIFF_KINDS:
+        old = old_objs.kind(kind) if old_objs is not None else {}
+        new = new_objs.kind(kind) if new_objs is not None else {}
+        added = [name for name in new if name not in old]
+        removed = [name for name in old if name not in new]
+        modified = []
+        for name, obj in new.items():
+            other = old.get(name)
+            if other is None or _same_digest(other, obj):
+                continue
+            changes = _field_changes(other.to_dict(), obj.to_dict())
+            if changes:     # 哈希不同但显示字段都相同（只差未比较的 set 项）
+                modified.append({'name': name, 'changes': changes})
+        if added or removed or modified:
+            result[kind] = {'added': added, 'removed': removed, 'modified': modified}
+    return result
+
+
+def match_policies(old_list, new_list):
+    """
+    新旧策略配对: (配对列表 [(旧, 新)], 新增列表, 删除列表)。
+    先按 uuid 配对；剩下的按 id 配对，但两边都有 uuid 且不同的视为不同策略（删除后新建）。
+    """
+    old_by_uuid = {pol.uuid: pol for pol in old_list if pol.uuid}
+    pairs = []
+    matched = set()
+    pending = []
+    for pol in new_list:
+        other = old_by_uuid.get(pol.uuid) if pol.uuid else None
+        if other is not None and id(other) not in matched:
+            pairs.append((other, pol))
+            matched.add(id(other))
+        else:
+            pending.append(pol)
+    old_by_id = {pol.id: pol for pol in old_list if id(pol) not in matched}
+    added = []
+    for pol in pending:
+        other = old_by_id.get(pol.id)
+        if other is not None and id(other) not in matched and not (other.uuid and pol.uuid):
+            pairs.append((other, pol))
+            matched.add(id(other))
+        else:
+            added.append(pol)
+    removed = [pol for pol in old_list if id(pol) not in matched]
+    return pairs, added, removed
+
+
+class _Flattener:
+    """一侧配置在一个 vdom 下的组展开（先查 vdom，再查 global），结果按名字记忆"""
+    __slots__ = ('scopes', 'memo')
+
+    def __init__(self, model, vdom):
+        glob = model.vdom_objects.get(None)
+        objs = model.vdom_objects.get(vdom) if vdom is not None else None
+        self.scopes = [s for s in (objs, glob) if s is not None] or [model.objects]
+        self.memo = {}
+
+    def leaves(self, name, kinds):
+        key = (name, kinds)
+        hit = self.memo.get(key)
+        if hit is not None:
+            return hit
+        result = None
+        for objs in self.scopes:
+            group = objs.find(name, kinds)
+            if group is not None:
+                result = group_closure(objs.kind(group.kind), objs.lookup(group.kind)).members(group.name)
+                break
+        if result is None:
+            result = _EMPTY     # 不是组：直接引用的变化已经在字段差分里
+        self.memo[key] = result
+        return result
+
+
+def _effective_changes(old_pol, new_pol, old_flat, new_flat):
+    """直接引用没变、但经由组展开后的成员变化了的字段: [{'field', 'via', 'added', 'removed'}]"""
+    result = []
+    for field, kinds in FLATTEN_FIELDS.items():
+        refs = new_pol.refs(field)
+        if refs != old_pol.refs(field):
+            continue
+        via = []
+        before, after = set(), set()
+        for name in refs:
+            old_leaves = old_flat.leaves(name, kinds)
+            new_leaves = new_flat.leaves(name, kinds)
+            if old_leaves != new_leaves:
+                via.append(name)
+                before |= old_leaves
+                after |= new_leaves
+        if via:
+            result.append({
+                'field': field, 'via': via,
+                'added': sorted(after - before), 'removed': sorted(before - after),
+            })
+    return result
+
+
+def _policy_summary(pol):
+    return {'id': pol.id, 'uuid': pol.uuid, 'name': pol.name or ''}
+
+
+def diff_policies(old_list, new_list, old_flat, new_flat):
+    """一个 vdom 的策略差分: {'added', 'removed', 'modified', 'effective'}"""
+    pairs, added, removed = match_policies(old_list, new_list)
+    modified = []
+    effective = []
+    for old_pol, new_pol in pairs:
+        if not _same_digest(old_pol, new_pol):
+            changes = _field_changes(_policy_data(old_pol), _policy_data(new_pol))
+            if changes:
+                modified.append({**_policy_summary(new_pol), 'changes': changes})
+        # 策略本身没变也可能经由组展开发生实效变化
+        for change in _effective_changes(old_pol, new_pol, old_flat, new_flat):
+            effective.append({**_policy_summary(new_pol), **change})
+    return {
+        'added': [_policy_data(pol) for pol in added],
+        'removed': [_policy_data(pol) for pol in removed],
+        'modified': modified,
+        'effective': effective,
+    }
+
+
+def diff_models(old, new):
+    """
+    两份已解析配置（ParsedConfig）的结构差分，按 vdom（global 为 None）:
+      [{'vdom', 'policies': {...}, 'objects': {...}}, ...]，只含有变化的 vdom，顺序为新配置中的顺序。
+    """
+    vdoms = list(new.vdom_objects)
+    vdoms += [vdom for vdom in old.vdom_objects if vdom not in new.vdom_objects]
+    old_policies = group_by_vdom(old.policies, None)
+    new_policies = group_by_vdom(new.policies, None)
+    for vdom in (*new_policies, *old_policies):
+        if vdom not in vdoms:
+            vdoms.append(vdom)
+
+    result = []
+    for vdom in vdoms:
+        objects = diff_objects(old.vdom_objects.get(vdom), new.vdom_objects.get(vdom))
+        policies = diff_policies(
+            old_policies.get(vdom, []), new_policies.get(vdom, []),
+            _Flattener(old, vdom), _Flattener(new, vdom),
+        )
+        if objects or any(policies.values()):
+            result.append({'vdom': vdom, 'policies': policies, 'objects': objects})
+    return result
+
+
+def diff_summary(changes):
+    """类别 -> 件数的汇总 {'policy': {'added': n, ...}, 类别: {...}}"""
+    summary = {}
+    for vdom_diff in changes:
+        for key, items in vdom_diff['policies'].items():
+            bucket = summary.setdefault('policy', {})
+            bucket[key] = bucket.get(key, 0) + len(items)
+        for kind, parts in vdom_diff['objects'].items():
+            bucket = summary.setdefault(kind, {})
+            for key, items in parts.items():
+                bucket[key] = bucket.get(key, 0) + len(items)
+    return summary
+
+
+def diff_configs(old_path, new_path, cache=None):
+    """两份配置文件的差分结果（可直接 JSON 序列化）"""
+    old, _ = load_parsed(old_path, cache)
+    new, _ = load_parsed(new_path, cache)
+    changes = diff_models(old, new)
+    return {'old': old_path, 'new': new_path, 'summary': diff_summary(changes), 'vdoms': changes}
+
+
+def _value_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value)
+    return str(value)
+
+
+def _changes_html(changes):
+    parts = []
+    for field, (before, after) in changes.items():
+        parts.append(
+            f"<div><span class='chg-field'>{escape(field)}</span>: "
+            f"<span class='chg-old'>{escape(_value_text(before))}</span> → "
+            f"<span class='chg-new'>{escape(_value_text(after))}</span></div>"
+        )
+    return "".join(parts)
+
+
+def _policy_label(pol):
+    name = pol.get('name') or ''
+    return f"ID {escape(str(pol['id']))}" + (f"（{escape(name)}）" if name else "")
+
+
+def _policy_rows(policies):
+    for pol in policies['added']:
+        fields = {k: v for k, v in pol.items() if k not in ('id', 'name')}
+        yield ('row-add', "追加", _policy_label(pol),
+               "".join(f"<div><span class='chg-field'>{escape(k)}</span>: {escape(_value_text(v))}</div>"
+                       for k, v in fields.items()))
+    for pol in policies['removed']:
+        yield ('row-del', "削除", _policy_label(pol), "")
+    for pol in policies['modified']:
+        yield ('row-mod', "変更", _policy_label(pol), _changes_html(pol['changes']))
+    for pol in policies['effective']:
+        detail = (f"<div><span class='chg-field'>{escape(pol['field'])}</span>: "
+                  f"グループ {escape(', '.join(pol['via']))} 経由で実効メンバーが変化</div>")
+        if pol['added']:
+            detail += f"<div class='chg-new'>+ {escape(', '.join(pol['added']))}</div>"
+        if pol['removed']:
+            detail += f"<div class='chg-old'>- {escape(', '.join(pol['removed']))}</div>"
+        yield ('row-eff', "実効変更", _policy_label(pol), detail)
+
+
+def _object_rows(objects):
+    for kind, parts in objects.items():
+        label = escape(KIND_LABELS.get(kind, kind))
+        for name in parts['added']:
+            yield ('row-add', f"追加（{label}）", escape(name), "")
+        for name in parts['removed']:
+            yield ('row-del', f"削除（{label}）", escape(name), "")
+        for item in parts['modified']:
+            yield ('row-mod', f"変更（{label}）", escape(item['name']), _changes_html(item['changes']))
+
+
+def write_diff_html(result, out_file, compress=None):
+    """差分结果 -> 简洁的 HTML 变更记录（流式写出，out_file/compress 规则同 ReportWriter）"""
+    with ReportWriter(out_file, compress) as html:
+        html.extend([
+            "<!DOCTYPE html><html lang='ja'><head><meta charset='UTF-8'>",
+            "<title>FortiGate設定差分</title>",
+            "<style id='report-css'>" + REPORT_CSS + DIFF_CSS + "</style>",
+            "</head><body>",
+            f"<h2>設定差分: {escape(result['old'])} → {escape(result['new'])}</h2>",
+        ])
+        if not result['vdoms']:
+            html.append("<p>差分はありません。</p>")
+        else:
+            html.append("<table class='changelog summary'><tr><th>種別</th><th>追加</th><th>削除</th>"
+                        "<th>変更</th><th>実効変更</th></tr>")
+            for kind, counts in result['summary'].items():
+                label = "ポリシー" if kind == 'policy' else KIND_LABELS.get(kind, kind)
+                cells = "".join(f"<td>{counts.get(key, 0) or ''}</td>"
+                                for key in ('added', 'removed', 'modified', 'effective'))
+                html.append(f"<tr><th>{escape(label)}</th>{cells}</tr>")
+            html.append("</table>")
+        for vdom_diff in result['vdoms']:
+            if len(result['vdoms']) > 1 or vdom_diff['vdom'] is not None:
+                html.append(f"<h3>VDOM: {escape(vdom_diff['vdom'] or 'global')}</h3>")
+            html.append("<table class='changelog'><tr><th>区分</th><th>対象</th><th>内容</th></tr>")
+            for rows in (_policy_rows(vdom_diff['policies']), _object_rows(vdom_diff['objects'])):
+                for css, action, target, detail in rows:
+                    html.append(f"<tr class='{css}'><td>{action}</td><td>{target}</td><td>{detail}</td></tr>")
+            html.append("</table>")
+        html.append("</body></html>")
+
+
+def write_diff_json(result, out_file):
+    out = sys.stdout if out_file == '-' else open(out_file, "w", encoding="utf-8")
+    try:
+        json.dump(result, out, ensure_ascii=False, indent=1)
+        out.write("\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="2 つの FortiGate 設定ファイルの構造差分（変更履歴）を出力します。")
+    parser.add_argument('old', help="変更前の設定ファイル")
+    parser.add_argument('new', help="変更後の設定ファイル")
+    parser.add_argument('-o', '--output', default='-', help="出力ファイル（既定: 標準出力）")
+    parser.add_argument('-f', '--format', choices=sorted(DIFF_FORMATS), help="html / html.gz / json（既定: 出力ファイル名から判断）")
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        fmt = next((f for f, suffix in sorted(DIFF_FORMATS.items(), key=lambda x: -len(x[1]))
+                    if args.output.endswith(suffix)), 'json')
+    cache = cache_from_args(args)
+    result = diff_configs(args.old, args.new, cache)
+    if fmt == 'json':
+        write_diff_json(result, args.output)
+    else:
+        write_diff_html(result, args.output, fmt == 'html.gz')
+    if args.output != '-':
+        print("生成完了:", args.output)
+    return 1 if result['vdoms'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import sys
+
+
+# 组类别 -> 其叶子对象类别（collect_all_objects / parse_objects_from_block 的键）
+GROUP_LEAF_KINDS = {
+    'addrgrp': 'address',
+    'addrgrp6': 'address6',
+    'servicegrp': 'service',
+    'vipgrp': 'vip',
+    'schedulegroup': 'schedule',
+}
+
+_EMPTY = frozenset()
+
+
+def _members_of(value):
+    # 组可能是成员列表、{'name':..., 'members': [...]}，或带 members 属性的模型对象
+    if isinstance(value, dict):
+        return value.get('members', [])
+    if hasattr(value, 'members'):
+        return value.members
+    return value or []
+
+
+def strongly_connected(nodes, children):
+    """
+    迭代版 Tarjan 强连通分量。返回分量列表，顺序为“被依赖的分量在前”（逆拓扑序），
+    可以直接按顺序计算闭包/深度。children: {节点: [子节点, ...]}
+    """
+    index = {}
+    low = {}
+    on_stack = set()
+    stack = []
+    result = []
+    counter = 0
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(children[root]))]
+        while work:
+            node, it = work[-1]
+            for child in it:
+                if child not in index:
+                    index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(children[child])))
+                    break
+                if child in on_stack and index[child] < low[node]:
+                    low[node] = index[child]
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if low[node] < low[parent]:
+                        low[parent] = low[node]
+                if low[node] == index[node]:
+                    comp = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        comp.append(member)
+                        if member == node:
+                            break
+                    result.append(comp)
+    return result
+
+
+class GroupClosure:
+    """
+    一类组对象的传递闭包。构建时先求强连通分量（循环引用的组归为同一分量），
+    再按逆拓扑序把每个分量展开成叶子集合（frozenset，可共享），之后查询 O(1)，全程不递归。
+      groups: {组名: 成员列表} 或 {组名: {'members': [...]}}
+      lookup: {小写名: 组名}，给出时成员按大小写不敏感匹配组；否则精确匹配
+      leaves: 允许的叶子名集合；给出时未定义的叶子被丢弃，否则所有非组成员都算叶子
+    顺带得到的诊断信息:
+      cycles: 循环引用的组（每个元素是一个分量内的组名列表）
+      depth:  {组名: 嵌套层数}（只含叶子的组为 1，循环按一层计）
+      fanout: {组名: 直接成员数}
+      parents: {成员名(组或叶子): [直接包含它的组, ...]}，反向查询（containing）用
+    """
+    __slots__ = ('groups', 'lookup', 'leaves', 'closure', 'cycles', 'depth', 'fanout', 'parents')
+
+    def __init__(self, groups, lookup=None, leaves=None):
+        self.groups = groups
+        self.lookup = lookup
+        self.leaves = leaves
+        self.closure = {}
+        self.cycles = []
+        self.depth = {}
+        self.fanout = {}
+        self.parents = {}
+        self._build()
+
+    def resolve(self, name):
+        """成员名 -> 组名（不是组时返回 None）"""
+        if not isinstance(name, str):
+            return None
+        if self.lookup is not None:
+            real = self.lookup.get(name.strip().lower())
+            return real if real in self.groups else None
+        return name if name in self.groups else None
+
+    def _leaf(self, name):
+        if self.leaves is None:
+            return sys.intern(name.strip())
+        return name if name in self.leaves else None
+
+    def _build(self):
+        children = {}
+        leaf_sets = {}
+        parents = self.parents
+        for g, value in self.groups.items():
+            kids = []
+            leaves = set()
+            members = _members_of(value)
+            for m in members:
+                real = self.resolve(m)
+                if real is not None:
+                    kids.append(real)
+                else:
+                    leaf = self._leaf(m)
+                    if leaf is not None:
+                        leaves.add(leaf)
+            children[g] = kids
+            leaf_sets[g] = leaves
+            for m in set(kids) | leaves:
+                parents.setdefault(m, []).append(g)
+            self.fanout[g] = len(members)
+
+        closure = self.closure
+        depth = self.depth
+        for comp in strongly_connected(list(self.groups), children):
+            members = set(comp)
+            if len(comp) > 1 or comp[0] in children[comp[0]]:
+                self.cycles.append(sorted(comp))
+            leaves = set()
+            kid_sets = []
+            kid_depth = 0
+            for g in comp:
+                leaves |= leaf_sets[g]
+                for k in children[g]:
+                    if k not in members:
+                        kid_sets.append(closure[k])
+                        kid_depth = max(kid_depth, depth[k])
+            result = self._union(leaves, kid_sets)
+            for g in comp:
+                closure[g] = result
+                depth[g] = kid_depth + 1
+
+    @staticmethod
+    def _union(leaves, sets):
+        if not leaves:
+            if not sets:
+                return _EMPTY
+            if all(s is sets[0] for s in sets):
+                return sets[0]      # 只有一个子组时直接共享
+        acc = set(leaves)
+        for s in sets:
+            acc |= s
+        return frozenset(acc)
+
+    def containing(self, names):
+        """
+        反向闭包: 直接或经嵌套包含任一 names 的全部组（沿 parents 反向遍历，只走到相关的组）
+        """
+        result = set()
+        stack = []
+        for name in names:
+            real = self.resolve(name)
+            stack.append(real if real is not None else self._leaf(name))
+        while stack:
+            node = stack.pop()
+            for g in self.parents.get(node, ()):
+                if g not in result:
+                    result.add(g)
+                    stack.append(g)
+        return result
+
+    def max_depth(self):
+        return max(self.depth.values(), default=0)
+
+    def is_group(self, name):
+        return self.resolve(name) is not None
+
+    def members(self, name):
+        """展开为叶子集合；不是组时返回它自身（leaves 给出时未定义则为空）"""
+        real = self.resolve(name)
+        if real is not None:
+            return self.closure[real]
+        if not isinstance(name, str):
+            return _EMPTY
+        leaf = self._leaf(name)
+        return frozenset((leaf,)) if leaf is not None else _EMPTY
+
+
+# 按组字典的身份缓存闭包（解析结果构建后不再修改）
+_closure_cache = {}
+_CACHE_LIMIT = 16
+
+
+def group_closure(groups, lookup=None, leaves=None):
+    """取（或构建）groups 对应的闭包；同一个 groups 对象只计算一次"""
+    key = (id(groups), id(lookup), id(leaves))
+    hit = _closure_cache.get(key)
+    if hit is not None and hit[0] is groups and hit[1] is lookup and hit[2] is leaves:
+        return hit[3]
+    closure = GroupClosure(groups, lookup, leaves)
+    if len(_closure_cache) >= _CACHE_LIMIT:
+        _closure_cache.pop(next(iter(_closure_cache)))
+    _closure_cache[key] = (groups, lookup, leaves, closure)
+    return closure
+
+
+def remember_closure(closure):
+    """把已构建（如从磁盘缓存载入）的闭包登记到缓存，之后 group_closure 直接命中"""
+    key = (id(closure.groups), id(closure.lookup), id(closure.leaves))
+    if key not in _closure_cache and len(_closure_cache) >= _CACHE_LIMIT:
+        _closure_cache.pop(next(iter(_closure_cache)))
+    _closure_cache[key] = (closure.groups, closure.lookup, closure.leaves, closure)
+
+
+def vdom_closures(all_objs, vdom):
+    """
+    一个 vdom 下全部组类别的闭包: {组类别: GroupClosure}，叶子限定为该 vdom 已定义的对象。
+    """
+    objs = all_objs.get(vdom, {})
+    result = {}
+    for grp_kind, leaf_kind in GROUP_LEAF_KINDS.items():
+        groups = objs.get(grp_kind)
+        if groups is None:
+            continue
+        # 没有叶子类别时用共享的空集合: 每次新建 {} 会让按身份缓存的 group_closure 永远不命中
+        result[grp_kind] = group_closure(groups, None, objs.get(leaf_kind, _EMPTY))
+    return result
+
+
+def group_report(closure):
+    """每个组的统计行: [(组名, 嵌套层数, 直接成员数, 展开后叶子数)]，按层数、成员数降序"""
+    rows = [
+        (g, closure.depth[g], closure.fanout[g], len(closure.closure[g]))
+        for g in closure.groups
+    ]
+    rows.sort(key=lambda r: (-r[1], -r[2], r[0]))
+    return rows
@@ -0,0 +1,298 @@
+import argparse
+import copy
+import hashlib
+import os
+import sys
+import time
+
+from fortigate_cache import CLOSURE_KINDS, ParseCache, ParsedConfig
+from fortigate_groups import remember_closure
+from fortigate_match import CompiledRulebase
+from fortigate_model import SECTION_CLASSES, Policy, VdomObjects
+from fortigate_parser import edit_spans, open_config, parse_edit, section_index
+from fortigate_vdoms import group_by_vdom
+
+
+POLICY_SECTION = 'firewall policy'
+
+
+def block_digest(raw):
+    """config/edit 块原文的哈希"""
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+def _section_kind(path):
+    return 'policy' if path == POLICY_SECTION else SECTION_CLASSES[path].kind
+
+
+def _build_item(entry, vdom, path):
+    if path == POLICY_SECTION:
+        return Policy.from_entry(entry, vdom)
+    return SECTION_CLASSES[path].from_entry(entry)
+
+
+class SectionState:
+    """
+    一个顶层段上次解析的结果:
+      digest:  段原文的哈希
+      items:   {edit名: 模型对象}，段内按 edit 名去重后的结果（与 ConfigNode.entries 的规则相同）
+      entries: {edit块哈希: 模型对象}，只记录生效的块（同名 edit 的最后一个），下次按哈希复用
+    """
+    __slots__ = ('vdom', 'path', 'digest', 'items', 'entries')
+
+    def __init__(self, vdom, path, digest):
+        self.vdom = vdom
+        self.path = path
+        self.digest = digest
+        self.items = {}
+        self.entries = {}
+
+
+class IncrementalState:
+    """增量解析的持久状态: 各段的 SectionState（键为 (vdom, 段路径, 同名段序号)）与组装好的 ParsedConfig"""
+    __slots__ = ('sections', 'model')
+
+    def __init__(self, sections, model):
+        self.sections = sections
+        self.model = model
+
+
+class IncrementalParser:
+    """
+    增量解析: 每个业务段和段内每个 edit 块按原文哈希与上次的状态比较，
+    只重新解析变化的块；对象范围、组闭包和各 vdom 的编译规则库只在其输入变化时重建。
+    load() 的接口与 ParseCache.load 相同，可以直接传给 build_report / check_config。
+    状态按配置文件的路径保存在 ParseCache 的目录里（同样受 LRU 大小限制），同一进程内还保留在内存。
+    """
+    __slots__ = ('cache', 'states', 'stats')
+
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else ParseCache()
+        self.states = {}
+        self.stats = {}
+
+    def state_key(self, conf_path):
+        path = os.path.abspath(conf_path).encode('utf-8')
+        return "path-" + hashlib.sha256(path).hexdigest()
+
+    def load(self, conf_path):
+        """(ParsedConfig, 配置缓冲)；顺带更新 self.stats"""
+        conf = open_config(conf_path)
+        key = self.state_key(conf_path)
+        prev = self.states.get(key)
+        if prev is None:
+            prev = self.cache.get(key)
+        state, changed = self.update(conf, prev)
+        self.states[key] = state
+        if changed or prev is None:
+            self.cache.put(key, state)
+        return state.model, conf
+
+    def update(self, conf, prev=None):
+        """由上次的状态 prev（可为 None）得到本次的 (IncrementalState, 变化的 {(vdom, 类别)})"""
+        stats = self.stats = {
+            'sections': 0, 'sections_reparsed': 0, 'edits_reparsed': 0,
+            'closures_reused': 0, 'closures_rebuilt': 0, 'rulebases_reused': 0, 'rulebases_compiled': 0,
+            'policies_resolved': 0,
+        }
+        index = section_index(conf)
+        prev_sections = prev.sections if prev is not None else {}
+
+        # 1. 逐段比较哈希，只重新解析变化的段（段内再按 edit 块复用）
+        sections = {}
+        changed = set()
+        changed_names = {}      # {vdom: {变化的对象名}}，策略的变化按对象身份判断，不记在这里
+        counts = {}
+        for start, end, vdom, path in index.order:
+            if path != POLICY_SECTION and path not in SECTION_CLASSES:
+                continue
+            n = counts[vdom, path] = counts.get((vdom, path), -1) + 1
+            key = (vdom, path, n)
+            digest = block_digest(conf[start:end])
+            old = prev_sections.get(key)
+            stats['sections'] += 1
+            if old is not None and old.digest == digest:
+                sections[key] = old
+                continue
+            section = sections[key] = self._parse_section(conf, index, key, start, end, digest, old)
+            changed.add((vdom, _section_kind(path)))
+            if path != POLICY_SECTION:
+                names = changed_names.setdefault(vdom, set())
+                old_items = old.items if old is not None else {}
+                names.update(name for name, item in section.items.items() if old_items.get(name) is not item)
+                names.update(name for name in old_items if name not in section.items)
+        for key, old in prev_sections.items():
+            if key not in sections:
+                changed.add((key[0], _section_kind(key[1])))
+                if key[1] != POLICY_SECTION:
+                    changed_names.setdefault(key[0], set()).update(old.items)
+
+        if prev is not None and not changed:
+            return prev, changed
+        model = self._assemble(index, sections, changed, changed_names, prev.model if prev is not None else None)
+        return IncrementalState(sections, model), changed
+
+    def _parse_section(self, conf, index, key, start, end, digest, old):
+        vdom, path, _ = key
+        section = SectionState(vdom, path, digest)
+        self.stats['sections_reparsed'] += 1
+        spans = edit_spans(conf, start, end)
+        last = {name: i for i, (name, _, _) in enumerate(spans)}
+        if old is None:
+            # 没有上次的结果: 整段解析一次
+            section.items = {
+                name: _build_item(entry, vdom, path) for name, entry in index.node(start, end).entries.items()
+            }
+            self.stats['edits_reparsed'] += len(section.items)
+            for name, s, e in spans:
+                if spans[last[name]][1] == s:
+                    section.entries[block_digest(conf[s:e])] = section.items[name]
+            return section
+        for i, (name, s, e) in enumerate(spans):
+            edit_digest = block_digest(conf[s:e])
+            item = old.entries.get(edit_digest)
+            if item is None:
+                entry = parse_edit(conf, s, e, path)
+                item = _build_item(entry, vdom, path)
+                self.stats['edits_reparsed'] += 1
+            # 同名 edit: 位置取第一次出现，内容取最后一个（与 ConfigNode.entries 相同）
+            section.items[name] = item
+            if last[name] == i:
+                section.entries[edit_digest] = item
+        return section
+
+    def _assemble(self, index, sections, changed, changed_names, old_model):
+        """由各段结果组装 ParsedConfig，没有变化的对象范围、闭包和规则库直接沿用"""
+        stats = self.stats
+        changed_scopes = {vdom for vdom, kind in changed if kind != 'policy'}
+        changed_kinds = {kind for _, kind in changed}
+        old_scopes = old_model.vdom_objects if old_model is not None else {}
+        known = {}
+        if old_model is not None:
+            for closure in old_model.closures:
+                known[id(closure.groups)] = closure
+
+        def carry(old_objs, new_objs, kinds):
+            # 组字典内容没变的类别: 复制上次的闭包，只换成新范围的组字典与查找视图
+            for kind in kinds:
+                groups = new_objs.kind(kind)
+                closure = known.get(id(old_objs.kind(kind))) if groups else None
+                if closure is None:
+                    continue
+                closure = copy.copy(closure)
+                closure.groups = groups
+                closure.lookup = new_objs.lookup(kind)
+                known[id(groups)] = closure
+
+        object_sections = [sec for sec in sections.values() if sec.path != POLICY_SECTION]
+        scopes = dict.fromkeys(index.vdom_spans)
+        scopes.setdefault(None)
+        for sec in object_sections:
+            scopes.setdefault(sec.vdom)
+        vdom_objects = {}
+        for scope in scopes:
+            if scope not in changed_scopes and scope in old_scopes:
+                vdom_objects[scope] = old_scopes[scope]
+                continue
+            objs = VdomObjects(scope)
+            for sec in object_sections:
+                if sec.vdom == scope:
+                    for item in sec.items.values():
+                        objs.add(item)
+            if scope in old_scopes:
+                carry(old_scopes[scope], objs,
+                      [k for k in CLOSURE_KINDS if (scope, k) not in changed])
+            vdom_objects[scope] = objs
+
+        if old_model is not None and not changed_scopes:
+            objects = old_model.objects
+        else:
+            objects = VdomObjects(None)
+            for sec in object_sections:
+                for item in sec.items.values():
+                    objects.add(item)
+            if old_model is not None:
+                carry(old_model.objects, objects, [k for k in CLOSURE_KINDS if k not in changed_kinds])
+
+        policies = [
+            item for sec in sections.values() if sec.path == POLICY_SECTION
+            for name, item in sec.items.items() if name.isdigit()
+        ]
+
+        model = ParsedConfig.assemble(vdom_objects, objects, policies, closures=[])
+        before = set(map(id, known.values()))
+        model.closures = model.build_closures(known)
+        for closure in model.closures:
+            remember_closure(closure)
+            stats['closures_reused' if id(closure) in before else 'closures_rebuilt'] += 1
+
+        # 规则库依赖本 vdom 的策略与对象，以及 global 的对象：都没变时整体沿用，
+        # 否则只重新解析引用了变化对象（或新解析出来）的策略
+        glob = vdom_objects.get(None)
+        old_rulebases = old_model.rulebases if old_model is not None else {}
+        for vdom, pols in group_by_vdom(policies, None).items():
+            old_rb = old_rulebases.get(vdom)
+            if old_rb is None:
+                continue
+            names = changed_names.get(vdom, set()) | changed_names.get(None, set())
+            if not names and (vdom, 'policy') not in changed:
+                model.rulebases[vdom] = old_rb
+                stats['rulebases_reused'] += 1
+                continue
+            rb = CompiledRulebase(vdom, pols, vdom_objects.get(vdom, glob), glob, previous=old_rb, changed=names)
+            old_ids = set(map(id, old_rb.resolutions))
+            stats['policies_resolved'] += sum(1 for r in rb.resolutions if id(r) not in old_ids)
+            model.rulebases[vdom] = rb
+            stats['rulebases_compiled'] += 1
+        compiled = len(model.rulebases)
+        model.matcher()
+        for vdom, rb in model.rulebases.items():
+            if vdom not in old_rulebases:
+                stats['policies_resolved'] += len(rb.resolutions)
+        stats['rulebases_compiled'] += len(model.rulebases) - compiled
+        return model
+
+
+def stats_line(stats, seconds):
+    return (
+        f"段 {stats['sections']}件中 {stats['sections_reparsed']}件を再解析"
+        f"（edit {stats['edits_reparsed']}件）、閉包 再利用 {stats['closures_reused']} / 再構築 {stats['closures_rebuilt']}、"
+        f"ルールベース 再利用 {stats['rulebases_reused']} / 再コンパイル {stats['rulebases_compiled']}"
+        f"（ポリシー再解決 {stats['policies_resolved']}件）  {seconds:.3f}秒"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="設定ファイルを増分解析し、変更があるたびに HTML レポートを更新します。"
+    )
+    parser.add_argument('conf', help="FortiGate 設定ファイル")
+    parser.add_argument('-o', '--output', default="policy_object_table.html", help="出力 HTML")
+    parser.add_argument('--vdom', action='append', default=[], metavar='NAME', help="対象 VDOM（複数可）")
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help="状態を保存するキャッシュディレクトリ（既定: $FORTIGATE_CACHE_DIR または ~/.cache/fortigate-tools）")
+    parser.add_argument('--watch', type=float, metavar='SEC', help="SEC 秒ごとに更新を確認し続ける")
+    args = parser.parse_args(argv)
+
+    # レポート生成は必要になってから読み込む（tkinter などを巻き込まない）
+    from fortigate_to_html import build_report
+
+    inc = IncrementalParser(ParseCache(args.cache_dir))
+    last_mtime = None
+    while True:
+        try:
+            mtime = os.stat(args.conf).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime is not None and mtime != last_mtime:
+            last_mtime = mtime
+            started = time.perf_counter()
+            build_report(args.conf, args.output, args.vdom, cache=inc)
+            print(stats_line(inc.stats, time.perf_counter() - started), flush=True)
+        if not args.watch:
+            return 0 if mtime is not None else 1
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+import argparse
+import sys
+from bisect import bisect_right
+
+from fortigate_groups import group_closure
+from fortigate_model import load_vdom_objects
+from fortigate_parser import open_config
+
+
+def ip_to_int(text):
+    """点分十进制 IPv4 -> 整数；格式不对返回 None"""
+    parts = text.strip().split('.')
+    if len(parts) != 4:
+        return None
+    value = 0
+    for p in parts:
+        if not p.isdigit():
+            return None
+        n = int(p)
+        if n > 255:
+            return None
+        value = (value << 8) | n
+    return value
+
+
+def int_to_ip(value):
+    return '.'.join(str((value >> s) & 255) for s in (24, 16, 8, 0))
+
+
+def prefix_interval(base, prefix):
+    """网络地址 + 前缀长度 -> (起, 止)，主机位清零"""
+    if not 0 <= prefix <= 32:
+        return None
+    size = 1 << (32 - prefix)
+    start = base & ~(size - 1) & 0xFFFFFFFF
+    return start, start + size - 1
+
+
+def mask_interval(base, mask):
+    """网络地址 + 点分掩码 -> (起, 止)；非连续掩码按其最高位连续部分处理"""
+    inv = ~mask & 0xFFFFFFFF
+    if inv & (inv + 1):
+        prefix = 32 - inv.bit_length()
+        return prefix_interval(base, prefix)
+    return base & mask, (base & mask) | inv
+
+
+def ip_interval(text):
+    """
+    IPv4 文本 -> 整数区间 (起, 止)。支持:
+      10.1.2.3 / 10.1.0.0/16 / 10.1.0.0/255.255.0.0 / "10.1.0.0 255.255.0.0" / 10.1.0.1-10.1.0.9
+    无法识别（FQDN、IPv6 等）时返回 None。
+    """
+    text = text.strip()
+    if not text:
+        return None
+    if '-' in text:
+        lo, _, hi = text.partition('-')
+        lo, hi = ip_to_int(lo), ip_to_int(hi)
+        if lo is None or hi is None:
+            return None
+        return (lo, hi) if lo <= hi else (hi, lo)
+    if '/' in text or ' ' in text:
+        base, _, rest = text.replace(' ', '/', 1).partition('/')
+        base = ip_to_int(base)
+        rest = rest.strip()
+        if base is None:
+            return None
+        if rest.isdigit():
+            return prefix_interval(base, int(rest))
+        mask = ip_to_int(rest)
+        return mask_interval(base, mask) if mask is not None else None
+    value = ip_to_int(text)
+    return (value, value) if value is not None else None
+
+
+def merge_intervals(intervals):
+    """把 (起, 止) 列表合并为按起点排序、互不重叠也不相邻的区间列表"""
+    merged = []
+    for lo, hi in sorted(intervals):
+        if merged and lo <= merged[-1][1] + 1:
+            if hi > merged[-1][1]:
+                merged[-1][1] = hi
+        else:
+            merged.append([lo, hi])
+    return [(lo, hi) for lo, hi in merged]
+
+
+def object_intervals(obj):
+    """
+    地址/VIP 对象的整数区间: [(字段, 起, 止), ...]
+    地址取 subnet 或 start-ip/end-ip；VIP 取 extip 与 mappedip（都可能是区间）。
+    """
+    result = []
+    if obj.kind == 'address':
+        if obj.type == 'ip' and obj.ip:
+            iv = ip_interval(obj.ip)
+            if iv:
+                result.append(('subnet', *iv))
+        elif obj.type == 'ip-range' and obj.start_ip:
+            lo, hi = ip_to_int(obj.start_ip), ip_to_int(obj.end_ip or obj.start_ip)
+            if lo is not None and hi is not None:
+                result.append(('iprange', min(lo, hi), max(lo, hi)))
+    elif obj.kind == 'vip':
+        for field in ('extip', 'mappedip'):
+            iv = ip_interval(getattr(obj, field) or '')
+            if iv:
+                result.append((field, *iv))
+    return result
+
+
+class IntervalIndex:
+    """
+    静态区间索引: 区间按起点排序，另建一棵“子树最大终点”的线段树（数组实现）。
+    overlapping(lo, hi) 先二分出起点 <= hi 的前缀，再只下探最大终点 >= lo 的子树，
+    复杂度 O(log n + k log n)，k 为命中数。
+    """
+    __slots__ = ('starts', 'ends', 'items', 'size', 'maxend')
+
+    def __init__(self, intervals):
+        # intervals: [(起, 止, 附带数据), ...]
+        ordered = sorted(intervals, key=lambda x: (x[0], x[1]))
+        self.starts = [x[0] for x in ordered]
+        self.ends = [x[1] for x in ordered]
+        self.items = [x[2] for x in ordered]
+        size = 1
+        while size < len(ordered):
+            size <<= 1
+        self.size = size
+        tree = [-1] * (2 * size)
+        tree[size:size + len(ordered)] = self.ends
+        for i in range(size - 1, 0, -1):
+            left, right = tree[2 * i], tree[2 * i + 1]
+            tree[i] = left if left > right else right
+        self.maxend = tree
+
+    def __len__(self):
+        return len(self.items)
+
+    def overlapping(self, lo, hi):
+        """与 [lo, hi] 有交集的全部区间: [(起, 止, 附带数据), ...]，按起点排序"""
+        limit = bisect_right(self.starts, hi)
+        if not limit:
+            return []
+        size, tree, ends = self.size, self.maxend, self.ends
+        found = []
+        stack = [(1, 0, size)]
+        while stack:
+            node, left, right = stack.pop()
+            if left >= limit or tree[node] < lo:
+                continue
+            if node >= size:
+                found.append(left)
+                continue
+            mid = (left + right) >> 1
+            stack.append((2 * node + 1, mid, right))
+            stack.append((2 * node, left, mid))
+        return [(self.starts[i], ends[i], self.items[i]) for i in found]
+
+    def containing(self, value):
+        return self.overlapping(value, value)
+
+
+class AddressIndex:
+    """
+    一个 vdom 的地址区间索引。query() 回答“哪些地址/VIP 包含这个 IP（或与这个网段重叠），
+    以及经嵌套间接包含它们的地址组/VIP 组有哪些”。
+    objects: VdomObjects
+    """
+    __slots__ = ('objects', 'index', 'closures', '_spellings')
+
+    def __init__(self, objects):
+        self.objects = objects
+        intervals = []
+        for kind in ('address', 'vip'):
+            for obj in objects.kind(kind).values():
+                for field, lo, hi in object_intervals(obj):
+                    intervals.append((lo, hi, (obj.name, kind, field)))
+        self.index = IntervalIndex(intervals)
+        self.closures = {
+            kind: group_closure(objects.kind(kind), objects.lookup(kind))
+            for kind in ('addrgrp', 'vipgrp')
+        }
+        # 组成员名的大小写写法可能与对象名不一致，预先按小写归并
+        self._spellings = {}
+        for closure in self.closures.values():
+            for member in closure.parents:
+                self._spellings.setdefault(member.lower(), set()).add(member)
+
+    def query(self, text):
+        """
+        text: IP / CIDR / 掩码 / 区间文本。返回 {'interval': (起, 止), 'objects': [...], 'groups': [...]}
+          objects: [(对象名, 类别, 字段, 区间文本), ...]
+          groups:  [(组类别, 组名), ...]（反向闭包，含间接嵌套）
+        无法解析时返回 None。
+        """
+        iv = ip_interval(text)
+        if iv is None:
+            return None
+        hits = self.index.overlapping(*iv)
+        objects = [
+            (name, kind, field, int_to_ip(lo) if lo == hi else f"{int_to_ip(lo)}-{int_to_ip(hi)}")
+            for lo, hi, (name, kind, field) in hits
+        ]
+        names = set()
+        for name, _, _, _ in objects:
+            names |= self._spellings.get(name.lower(), {name})
+        groups = []
+        for kind, closure in self.closures.items():
+            for g in sorted(closure.containing(names)):
+                groups.append((kind, g))
+        return {'interval': iv, 'objects': objects, 'groups': groups}
+
+
+def build_address_indexes(conf):
+    """按 vdom 建索引: {vdom名(global 为 None): AddressIndex}"""
+    return {vdom: AddressIndex(objs) for vdom, objs in load_vdom_objects(conf).items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="指定した IP / ネットワークを含む（重なる）アドレス・VIP とそれを含むグループを検索します。"
+    )
+    parser.add_argument('conf', help="FortiGate 設定ファイル")
+    parser.add_argument('query', nargs='+', help="IP・CIDR・範囲（例: 10.1.2.3 10.1.0.0/16 10.1.0.1-10.1.0.9）")
+    parser.add_argument('--vdom', help="対象 VDOM（省略時はすべて）")
+    args = parser.parse_args(argv)
+
+    indexes = build_address_indexes(open_config(args.conf))
+    if args.vdom:
+        if args.vdom not in indexes:
+            print(f"VDOM「{args.vdom}」が見つかりません。")
+            return 1
+        indexes = {args.vdom: indexes[args.vdom]}
+
+    for text in args.query:
+        print(f"==== {text} ====")
+        for vdom, index in indexes.items():
+            result = index.query(text)
+            if result is None:
+                print(f"「{text}」は IPv4 アドレスとして解釈できません。")
+                break
+            if not result['objects']:
+                continue
+            print(f"[{vdom or 'global'}]")
+            for name, kind, field, span in result['objects']:
+                print(f"  {kind} {name} ({field}: {span})")
+            for kind, name in result['groups']:
+                print(f"  {kind} {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
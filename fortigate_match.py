@@ -0,0 +1,495 @@
+import argparse
+import sys
+from bisect import bisect_right
+
+from fortigate_groups import group_closure
+from fortigate_ipindex import ip_to_int, merge_intervals, object_intervals
+from fortigate_model import load_policies, load_vdom_objects
+from fortigate_parser import open_config
+from fortigate_services import ICMP_FULL, PORT_FULL, PROTO_ANY, ServiceSet, service_terms
+
+
+IPV4_MAX = 0xFFFFFFFF
+# 服务统一映射到一条数轴上: 协议号 << 16 | 端口（ICMP 为 type），用于区间比较
+SERVICE_MAX = (256 << 16) - 1
+
+# 协议名 -> 协议号
+PROTOCOLS = {'icmp': 1, 'tcp': 6, 'udp': 17, 'sctp': 132}
+
+
+def complement(intervals, top):
+    """[0, top] 内对已合并区间取补"""
+    result = []
+    pos = 0
+    for lo, hi in intervals:
+        if lo > pos:
+            result.append((pos, lo - 1))
+        pos = hi + 1
+    if pos <= top:
+        result.append((pos, top))
+    return result
+
+
+class SegmentMasks:
+    """
+    一个维度的位向量表: 把数轴切成基本段，每段记录覆盖它的规则位掩码（Python 大整数）。
+    构建用扫描线: 每个规则的区间已合并互不重叠，在起点/终点+1 处各异或一次该规则的位。
+    查询 = 一次二分 + 取掩码。
+    """
+    __slots__ = ('bounds', 'masks')
+
+    def __init__(self, intervals):
+        # intervals: [(起, 止, 位), ...]
+        events = {}
+        for lo, hi, bit in intervals:
+            events[lo] = events.get(lo, 0) ^ bit
+            events[hi + 1] = events.get(hi + 1, 0) ^ bit
+        self.bounds = [-1]
+        self.masks = [0]
+        mask = 0
+        for point in sorted(events):
+            mask ^= events[point]
+            self.bounds.append(point)
+            self.masks.append(mask)
+
+    def lookup(self, value):
+        return self.masks[bisect_right(self.bounds, value) - 1]
+
+
+class CompiledRulebase:
+    """
+    一个 vdom 的有序策略编译结果。每个维度（入/出接口、源/目的地址、服务）各自给出
+    “可能命中的规则”位掩码，五个掩码相与后最低位就是第一条命中的策略。
+    objects: VdomObjects；fallback: 找不到对象时再查的 VdomObjects（通常是 global）
+    regions 保存每条规则的匹配区域（已应用 negate），供遮蔽/冗余分析使用:
+      (入接口集合或 None, 出接口集合或 None, 源区间, 目的区间, 服务区间)
+    接口集合里 zone 已换成成员接口；服务区间在 SERVICE_MAX 数轴上。
+    inexact: 区域比实际大的规则（服务带源端口/ICMP code 限制）的位掩码
+    indeterminate: 是否命中无法判定的规则的位掩码，查询时不当作命中，也算入 inexact:
+      被否定（*-negate）的维度里有无法解析的引用（取补后的区域包含了本应排除的地址），
+      或未否定的地址维度里有已定义但无法转换为 IP 范围的对象（FQDN 等，该维度按全部范围登记）
+    previous/changed: 增量编译。previous 为上次的编译结果，changed 为之后变化的对象名；
+    解析时没有查过 changed（及直接或经嵌套包含它们的组）的策略直接沿用上次的解析结果
+    """
+    __slots__ = (
+        'vdom', 'policies', 'intf_any', 'intf', 'src', 'dst',
+        'proto_any', 'proto_all', 'ports', 'negate_src', 'negate_dst', 'negate_svc', 'unresolved',
+        'regions', 'inexact', 'indeterminate', 'resolutions',
+    )
+
+    def __init__(self, vdom, policies, objects, fallback=None, previous=None, changed=()):
+        self.vdom = vdom
+        self.policies = [p for p in policies if p.get('status') != 'disable']
+        self.intf_any = [0, 0]
+        self.intf = [{}, {}]
+        self.proto_any = 0
+        self.proto_all = {}
+        self.negate_src = self.negate_dst = self.negate_svc = 0
+        # 无法解析为区间的名字（未定义，或 FQDN、地理位置等）: {策略ID: {名字, ...}}；
+        # 未定义的名字不参与匹配，已定义的对象见 indeterminate
+        self.unresolved = {}
+        self.regions = []
+        self.inexact = 0
+        self.indeterminate = 0
+        # 各策略的解析结果（与 policies 对应），供增量编译沿用
+        self.resolutions = []
+        scopes = [objects] + ([fallback] if fallback is not None and fallback is not objects else [])
+        self._compile(scopes, previous, changed)
+
+    # --- 编译 ---
+    def _find(self, scopes, name, kinds):
+        for objs in scopes:
+            obj = objs.find(name, kinds)
+            if obj is not None:
+                return obj
+        return None
+
+    def _leaves(self, scopes, name, grp_kinds, leaf_kinds, touched):
+        """组名展开为叶子对象（组闭包预先计算）；未定义的名字返回空。查过的名字（小写）记入 touched"""
+        touched.add(name.lower())
+        obj = self._find(scopes, name, grp_kinds + leaf_kinds)
+        if obj is None:
+            return []
+        if obj.kind in leaf_kinds:
+            return [obj]
+        objs = next(o for o in scopes if o.find(name, (obj.kind,)) is obj)
+        closure = group_closure(objs.kind(obj.kind), objs.lookup(obj.kind))
+        result = []
+        for leaf in closure.members(obj.name):
+            touched.add(leaf.lower())
+            hit = self._find(scopes, leaf, leaf_kinds)
+            if hit is not None:
+                result.append(hit)
+        return result
+
+    def _addr_intervals(self, scopes, names, unresolved, opaque, vip_field, touched):
+        """
+        地址名列表的合并区间。未定义的名字记入 unresolved；
+        已定义但无法转换为 IP 范围的对象（FQDN、地域、通配符等）同时记入 unresolved 与 opaque。
+        """
+        spans = []
+        for name in names:
+            if name.lower() == 'all':
+                return [(0, IPV4_MAX)]
+            leaves = self._leaves(scopes, name, ('addrgrp', 'vipgrp'), ('address', 'vip'), touched)
+            if not leaves:
+                unresolved.add(name)
+            for obj in leaves:
+                found = False
+                for field, lo, hi in object_intervals(obj):
+                    # VIP 在策略里按 DNAT 前的外部地址匹配
+                    if obj.kind == 'vip' and field != vip_field:
+                        continue
+                    spans.append((lo, hi))
+                    found = True
+                if not found:
+                    unresolved.add(obj.name)
+                    opaque.add(obj.name)
+        return merge_intervals(spans)
+
+    def _intf_names(self, scopes, names, touched):
+        """
+        (匹配用名字集合, 实际接口集合)，均为小写；any 时返回 None。
+        匹配用集合里 zone 名与成员接口都在，实际接口集合里有成员的 zone 只保留成员。
+        """
+        result = set()
+        physical = set()
+        for name in names:
+            if name.lower() == 'any':
+                return None
+            result.add(name.lower())
+            touched.add(name.lower())
+            zone = self._find(scopes, name, ('zone',))
+            if zone is not None and zone.interfaces:
+                members = {i.lower() for i in zone.interfaces}
+                result |= members
+                physical |= members
+            else:
+                physical.add(name.lower())
+        return result, frozenset(physical)
+
+    def _resolve(self, scopes, pol):
+        """
+        一条策略的解析结果，与它在规则库中的位置无关，可以跨编译沿用:
+          (入接口, 出接口, 源区间, 目的区间, 服务是否有源端口等限制, 服务的 (协议, lo, hi) 区间,
+           无法解析的名字, 解析时查过的全部名字（小写）, 含无法解析引用的字段,
+           含已定义但无法转换为 IP 范围的对象的字段)
+        """
+        touched = set()
+        src_unresolved, dst_unresolved, svc_unresolved = set(), set(), set()
+        src_opaque, dst_opaque = set(), set()
+        srcintf = self._intf_names(scopes, pol.refs('srcintf'), touched)
+        dstintf = self._intf_names(scopes, pol.refs('dstintf'), touched)
+        src = self._addr_intervals(scopes, pol.refs('srcaddr'), src_unresolved, src_opaque, 'mappedip', touched)
+        dst = self._addr_intervals(scopes, pol.refs('dstaddr'), dst_unresolved, dst_opaque, 'extip', touched)
+        terms = []
+        for name in pol.refs('service'):
+            leaves = self._leaves(scopes, name, ('servicegrp',), ('service',), touched)
+            if not leaves:
+                svc_unresolved.add(name)
+            for svc in leaves:
+                terms.extend(service_terms(svc))
+        sset = ServiceSet(terms)
+        partial = frozenset(
+            field for field, names in
+            (('srcaddr', src_unresolved), ('dstaddr', dst_unresolved), ('service', svc_unresolved)) if names
+        )
+        return (
+            srcintf, dstintf, src, dst, sset.src_restricted(), list(sset.dst_intervals()),
+            frozenset(src_unresolved | dst_unresolved | svc_unresolved), frozenset(touched), partial,
+            frozenset(field for field, names in (('srcaddr', src_opaque), ('dstaddr', dst_opaque)) if names),
+        )
+
+    def _affected(self, scopes, changed):
+        """变化的对象名 + 直接或经嵌套包含它们的组（小写），解析时查过其中任何一个的策略要重新解析"""
+        result = {name.lower() for name in changed}
+        for objs in scopes:
+            for kind in ('addrgrp', 'vipgrp', 'servicegrp'):
+                groups = objs.kind(kind)
+                if groups:
+                    closure = group_closure(groups, objs.lookup(kind))
+                    result.update(g.lower() for g in closure.containing(changed))
+        return result
+
+    def _compile(self, scopes, previous=None, changed=()):
+        reusable = {}
+        if previous is not None:
+            affected = self._affected(scopes, changed)
+            for pol, resolution in zip(previous.policies, previous.resolutions):
+                if affected.isdisjoint(resolution[7]):
+                    reusable[id(pol)] = resolution
+        src_spans, dst_spans = [], []
+        port_spans = {}
+        for pos, pol in enumerate(self.policies):
+            bit = 1 << pos
+            pid = pol.get('id')
+            resolution = reusable.get(id(pol))
+            if resolution is None:
+                resolution = self._resolve(scopes, pol)
+            self.resolutions.append(resolution)
+            srcintf, dstintf, src, dst, restricted, svc_intervals, unresolved, _, partial, opaque = resolution
+            intfs = []
+            for side, names in ((0, srcintf), (1, dstintf)):
+                if names is None:
+                    self.intf_any[side] |= bit
+                    intfs.append(None)
+                else:
+                    table = self.intf[side]
+                    for n in names[0]:
+                        table[n] = table.get(n, 0) | bit
+                    intfs.append(names[1])
+            if unresolved:
+                self.unresolved[pid] = set(unresolved)
+            if pol.get('srcaddr-negate') == 'enable':
+                self.negate_src |= bit
+            if pol.get('dstaddr-negate') == 'enable':
+                self.negate_dst |= bit
+            # 未取反的字段里有无法转换为 IP 范围的对象: 该维度按全部范围登记（可能命中任何地址）
+            if 'srcaddr' in opaque and not self.negate_src & bit:
+                src = [(0, IPV4_MAX)]
+            if 'dstaddr' in opaque and not self.negate_dst & bit:
+                dst = [(0, IPV4_MAX)]
+            src_spans.extend((lo, hi, bit) for lo, hi in src)
+            dst_spans.extend((lo, hi, bit) for lo, hi in dst)
+            svc = self._compile_services(restricted, svc_intervals, bit, port_spans)
+            if pol.get('service-negate') == 'enable':
+                self.negate_svc |= bit
+                svc = complement(svc, SERVICE_MAX)
+            if self.negate_src & bit:
+                src = complement(src, IPV4_MAX)
+            if self.negate_dst & bit:
+                dst = complement(dst, IPV4_MAX)
+            negated = {'srcaddr': self.negate_src, 'dstaddr': self.negate_dst, 'service': self.negate_svc}
+            if opaque or any(negated[field] & bit for field in partial):
+                # 无法解析的引用取补后变成“全部”、或无法转换的对象按全部范围登记，区域与匹配结果都不可信
+                self.indeterminate |= bit
+                self.inexact |= bit
+            self.regions.append((intfs[0], intfs[1], src, dst, svc))
+        self.src = SegmentMasks(src_spans)
+        self.dst = SegmentMasks(dst_spans)
+        self.ports = {proto: SegmentMasks(spans) for proto, spans in port_spans.items()}
+
+    def _compile_services(self, restricted, intervals, bit, port_spans):
+        """
+        登记服务维度的掩码，返回该规则在服务数轴上的合并区间。
+        源端口/ICMP code 不参与匹配，有这类限制的规则记入 inexact（区域是放大后的近似）。
+        """
+        if restricted:
+            self.inexact |= bit
+        line = []
+        for proto, lo, hi in intervals:
+            if proto == PROTO_ANY:
+                self.proto_any |= bit
+                line.append((0, SERVICE_MAX))
+                continue
+            if proto == 58:
+                continue    # ICMP6 不参与 IPv4 匹配
+            if (lo, hi) == (ICMP_FULL if proto == 1 else PORT_FULL):
+                self.proto_all[proto] = self.proto_all.get(proto, 0) | bit
+            else:
+                port_spans.setdefault(proto, []).append((lo, hi, bit))
+            line.append(((proto << 16) | lo, (proto << 16) | hi))
+        return merge_intervals(line)
+
+    # --- 查询 ---
+    def _intf_mask(self, side, name):
+        return self.intf_any[side] | self.intf[side].get(name.lower(), 0)
+
+    def _candidates(self, srcintf, dstintf, src, dst, proto, port):
+        """五个维度都可能命中的规则位掩码（含 indeterminate 的规则）"""
+        src, dst, proto, port = query_values(src, dst, proto, port)
+        mask = self._intf_mask(0, srcintf) & self._intf_mask(1, dstintf)
+        if not mask:
+            return 0
+        mask &= self.src.lookup(src) ^ self.negate_src
+        if not mask:
+            return 0
+        mask &= self.dst.lookup(dst) ^ self.negate_dst
+        if not mask:
+            return 0
+        svc = self.proto_any | self.proto_all.get(proto, 0)
+        ports = self.ports.get(proto)
+        if ports is not None and port is not None:
+            svc |= ports.lookup(port)
+        return mask & (svc ^ self.negate_svc)
+
+    def lookup(self, srcintf, dstintf, src, dst, proto, port):
+        """
+        (第一条确定命中的策略或 None, 排在它前面、是否命中无法判定的策略列表)。
+        参数同 match；值不合法时抛出 ValueError。
+        """
+        mask = self._candidates(srcintf, dstintf, src, dst, proto, port)
+        definite = mask & ~self.indeterminate
+        pol = None
+        if definite:
+            low = definite & -definite
+            pol = self.policies[low.bit_length() - 1]
+            mask &= low - 1
+        pending = []
+        mask &= self.indeterminate
+        while mask:
+            low = mask & -mask
+            pending.append(self.policies[low.bit_length() - 1])
+            mask ^= low
+        return pol, pending
+
+    def match(self, srcintf, dstintf, src, dst, proto, port):
+        """
+        第一条确定命中的策略（Policy），没有命中（隐式拒绝）时返回 None。
+        src/dst 为整数或点分 IP；proto 为协议号或 tcp/udp/sctp/icmp；port 为目的端口或 ICMP type。
+        是否命中无法判定的策略（见 indeterminate）被跳过，需要知道时用 lookup()。
+        """
+        return self.lookup(srcintf, dstintf, src, dst, proto, port)[0]
+
+
+def query_values(src, dst, proto, port):
+    """查询参数转换为 (源, 目的, 协议号, 端口) 整数；不合法时抛出 ValueError（日文说明）"""
+    values = []
+    for label, ip in (("送信元IP", src), ("宛先IP", dst)):
+        value = ip_to_int(ip) if isinstance(ip, str) else ip
+        if value is None or not 0 <= value <= IPV4_MAX:
+            raise ValueError(f"{label}が不正です: {ip}")
+        values.append(value)
+    number = proto
+    if isinstance(proto, str):
+        number = int(proto) if proto.isdigit() else PROTOCOLS.get(proto.lower())
+    if number is None or not 0 <= number <= 255:
+        raise ValueError(f"プロトコルが不正です: {proto}")
+    if port is not None:
+        if isinstance(port, str):
+            if not port.isdigit():
+                raise ValueError(f"ポートが不正です: {port}")
+            port = int(port)
+        if not 0 <= port <= 0xFFFF:
+            raise ValueError(f"ポートが不正です: {port}")
+    return values[0], values[1], number, port
+
+
+class PolicyMatcher:
+    """整份配置的查询入口: 按 vdom 编译规则库，vdom 为 None 表示没有启用 vdom 的配置"""
+    __slots__ = ('rulebases',)
+
+    def __init__(self, conf=None, objects=None, policies=None, reuse=None):
+        # objects/policies 可以直接给出已解析的结果（如解析缓存），此时不再读 conf；
+        # reuse: {vdom: CompiledRulebase}，输入没有变化、可以直接沿用的编译结果（增量解析）
+        if objects is None:
+            objects = load_vdom_objects(conf)
+        if policies is None:
+            policies = load_policies(conf)
+        by_vdom = {}
+        for pol in policies:
+            by_vdom.setdefault(pol.vdom, []).append(pol)
+        glob = objects.get(None)
+        reuse = reuse or {}
+        self.rulebases = {
+            vdom: reuse[vdom] if vdom in reuse else CompiledRulebase(vdom, pols, objects.get(vdom, glob), glob)
+            for vdom, pols in by_vdom.items()
+        }
+
+    def rulebase(self, vdom=None):
+        if vdom in self.rulebases:
+            return self.rulebases[vdom]
+        if vdom is None and len(self.rulebases) == 1:
+            return next(iter(self.rulebases.values()))
+        return None
+
+    def match(self, srcintf, dstintf, src, dst, proto, port, vdom=None):
+        rb = self.rulebase(vdom)
+        return rb.match(srcintf, dstintf, src, dst, proto, port) if rb is not None else None
+
+
+def parse_tuple_line(line):
+    """
+    批量查询文件的一行: 入接口 出接口 源IP 目的IP 协议 端口 [vdom]（空白或逗号分隔，# 开头为注释）
+    返回 (入接口, 出接口, 源, 目的, 协议, 端口, vdom)；空行/注释返回 None，项目不足时抛出 ValueError。
+    """
+    fields = line.split('#', 1)[0].replace(',', ' ').split()
+    if not fields:
+        return None
+    if len(fields) < 6:
+        raise ValueError("入IF 出IF 送信元IP 宛先IP プロトコル ポート の 6 項目が必要です")
+    vdom = fields[6] if len(fields) > 6 else None
+    return fields[0], fields[1], fields[2], fields[3], fields[4], fields[5], vdom
+
+
+def run_batch(matcher, lines, out, default_vdom=None):
+    """
+    逐行查询并写出 “元组 -> 策略ID/implicit-deny”，返回处理的行数。
+    不合法的行写出 “-> error: 说明” 后继续；前面有无法判定的策略时附上 “(indeterminate: ID,...)”。
+    """
+    count = 0
+    for raw in lines:
+        try:
+            item = parse_tuple_line(raw)
+        except ValueError as e:
+            out.write(f"{raw.strip()} -> error: {e}\n")
+            count += 1
+            continue
+        if item is None:
+            continue
+        srcintf, dstintf, src, dst, proto, port, vdom = item
+        vdom = vdom or default_vdom
+        rb = matcher.rulebase(vdom)
+        try:
+            if rb is None:
+                raise ValueError(f"VDOM「{vdom}」のポリシーが見つかりません")
+            pol, pending = rb.lookup(srcintf, dstintf, src, dst, proto, port)
+        except ValueError as e:
+            result = f"error: {e}"
+        else:
+            result = f"{pol.id} {pol.get('action', 'deny')}" if pol is not None else "implicit-deny"
+            if pending:
+                result += f" (indeterminate: {','.join(p.id for p in pending)})"
+        out.write(f"{' '.join(x for x in item if x)} -> {result}\n")
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="5タプルに最初にマッチするポリシーを検索します。")
+    parser.add_argument('conf', help="FortiGate 設定ファイル")
+    parser.add_argument('tuple', nargs='*', help="入IF 出IF 送信元IP 宛先IP プロトコル ポート")
+    parser.add_argument('--vdom', help="対象 VDOM")
+    parser.add_argument('--batch', help="タプルを 1 行ずつ記載したファイル（- は標準入力）")
+    parser.add_argument('-o', '--output', help="バッチ結果の出力先（省略時は標準出力）")
+    args = parser.parse_args(argv)
+
+    matcher = PolicyMatcher(open_config(args.conf))
+    if args.batch:
+        src = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+        out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            run_batch(matcher, src, out, args.vdom)
+        finally:
+            if src is not sys.stdin:
+                src.close()
+            if out is not sys.stdout:
+                out.close()
+        return 0
+    if len(args.tuple) != 6:
+        parser.error("入IF 出IF 送信元IP 宛先IP プロトコル ポート の 6 項目を指定してください。")
+    rb = matcher.rulebase(args.vdom)
+    if rb is None:
+        print(f"VDOM「{args.vdom}」のポリシーが見つかりません。")
+        return 1
+    try:
+        pol, pending = rb.lookup(*args.tuple)
+    except ValueError as e:
+        parser.error(str(e))
+    for other in pending:
+        print(f"※ ポリシーID {other.id} 「{other.get('name')}」: 否定指定（negate）のオブジェクトを IP 範囲に変換できないため、"
+              "マッチするかどうか判定できません。")
+    if pol is None:
+        print("マッチするポリシーはありません（暗黙の拒否）。")
+    else:
+        print(f"ポリシーID {pol.id} 「{pol.get('name')}」 action={pol.get('action', 'deny')}")
+    unresolved = {pid: names for pid, names in rb.unresolved.items()}
+    if unresolved:
+        print("※ 次のオブジェクトは IP 範囲に変換できないため判定対象外です:")
+        for pid, names in unresolved.items():
+            print(f"  ポリシーID {pid}: {', '.join(sorted(names))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
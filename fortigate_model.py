@@ -0,0 +1,544 @@
+import hashlib
+import sys
+
+from fortigate_parser import iter_sections, split_values, split_vdoms
+
+
+def _intern(name):
+    return sys.intern(name.strip())
+
+
+def _names(entry, key):
+    return tuple(_intern(v) for v in entry.values(key))
+
+
+def entry_digest(entry):
+    """edit 块内容（名字与全部 set 的原始值）的哈希，解析时算一次，差分时先比它"""
+    h = hashlib.blake2b(entry.name.encode('utf-8'), digest_size=16)
+    for key, value in entry.settings.items():
+        h.update(f"\n{key} {value}".encode('utf-8'))
+    return h.digest()
+
+
+class Address:
+    """IPv4 地址对象（firewall address）"""
+    __slots__ = ('name', 'type', 'ip', 'fqdn', 'start_ip', 'end_ip', 'comment', 'digest')
+    kind = 'address'
+
+    def __init__(self, name, type='', ip='', fqdn='', start_ip='', end_ip='', comment=''):
+        self.name = name
+        self.type = type
+        self.ip = ip
+        self.fqdn = fqdn
+        self.start_ip = start_ip
+        self.end_ip = end_ip
+        self.comment = comment
+        self.digest = None
+
+    @classmethod
+    def from_entry(cls, entry):
+        obj = cls(_intern(entry.name))
+        subnet = entry.values('subnet')
+        if subnet:
+            obj.type = 'ip'
+            if len(subnet) >= 2:
+                obj.ip = f"{subnet[0]}/{sum(bin(int(x)).count('1') for x in subnet[1].split('.'))}"
+            else:
+                obj.ip = subnet[0]
+        if fqdn := entry.value('fqdn'):
+            obj.type = 'fqdn'
+            obj.fqdn = fqdn
+        if start_ip := entry.value('start-ip'):
+            obj.type = 'ip-range'
+            obj.start_ip = start_ip
+            obj.end_ip = entry.value('end-ip')
+        obj.comment = entry.value('comment')
+        obj.digest = entry_digest(entry)
+        return obj
+
+    def to_dict(self):
+        return {
+            'name': self.name, 'type': self.type, 'ip': self.ip, 'fqdn': self.fqdn,
+            'start-ip': self.start_ip, 'end-ip': self.end_ip, 'comment': self.comment
+        }
+
+
+class Address6:
+    """IPv6 地址对象（firewall address6）"""
+    __slots__ = ('name', 'ip', 'comment', 'digest')
+    kind = 'address6'
+
+    def __init__(self, name, ip='', comment=''):
+        self.name = name
+        self.ip = ip
+        self.comment = comment
+        self.digest = None
+
+    @classmethod
+    def from_entry(cls, entry):
+        obj = cls(_intern(entry.name), entry.value('ip6'), entry.value('comment'))
+        obj.digest = entry_digest(entry)
+        return obj
+
+    def to_dict(self):
+        return {'name': self.name, 'ip': self.ip, 'comment': self.comment}
+
+
+class VIP:
+    """虚拟IP（firewall vip）"""
+    __slots__ = ('name', 'extip', 'extintf', 'mappedip', 'type', 'comment', 'digest')
+    kind = 'vip'
+
+    def __init__(self, name, extip='', extintf='', mappedip='', type='', comment=''):
+        self.name = name
+        self.extip = extip
+        self.extintf = extintf
+        self.mappedip = mappedip
+        self.type = type
+        self.comment = comment
+        self.digest = None
+
+    @classmethod
+    def from_entry(cls, entry):
+        obj = cls(
+            _intern(entry.name), entry.value('extip'), entry.value('extintf'),
+            entry.value('mappedip'), entry.value('type'), entry.value('comment')
+        )
+        obj.digest = entry_digest(entry)
+        return obj
+
+    def to_dict(self):
+        return {
+            'name': self.name, 'extip': self.extip, 'extintf': self.extintf,
+            'mappedip': self.mappedip, 'type': self.type, 'comment': self.comment
+        }
+
+
+class Service:
+    """
+    自定义服务（firewall service custom）。
+    protocol 只保留数字协议号（显示用）；匹配用的原始字段另存:
+    protocol_type（TCP/UDP/SCTP、ICMP、IP 等，未设置时为 TCP/UDP/SCTP）、protocol_number、
+    sctp_port、icmptype、icmpcode。
+    """
+    __slots__ = (
+        'name', 'protocol', 'tcp_port', 'udp_port', 'comment',
+        'protocol_type', 'protocol_number', 'sctp_port', 'icmptype', 'icmpcode', 'digest',
+    )
+    kind = 'service'
+
+    def __init__(self, name, protocol='', tcp_port='', udp_port='', comment='',
+                 protocol_type='TCP/UDP/SCTP', protocol_number='', sctp_port='', icmptype='', icmpcode=''):
+        self.name = name
+        self.protocol = protocol
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self.comment = comment
+        self.protocol_type = protocol_type
+        self.protocol_number = protocol_number
+        self.sctp_port = sctp_port
+        self.icmptype = icmptype
+        self.icmpcode = icmpcode
+        self.digest = None
+
+    @classmethod
+    def from_entry(cls, entry):
+        protocol = entry.value('protocol')
+        obj = cls(
+            _intern(entry.name),
+            protocol if protocol.isdigit() else '',
+            ' '.join(entry.values('tcp-portrange')),
+            ' '.join(entry.values('udp-portrange')),
+            entry.value('comment'),
+            sys.intern(protocol.upper()) if protocol else 'TCP/UDP/SCTP',
+            entry.value('protocol-number'),
+            ' '.join(entry.values('sctp-portrange')),
+            entry.value('icmptype'),
+            entry.value('icmpcode'),
+        )
+        obj.digest = entry_digest(entry)
+        return obj
+
+    def to_dict(self):
+        return {
+            'name': self.name, 'protocol': self.protocol, 'tcp_port': self.tcp_port,
+            'udp_port': self.udp_port, 'comment': self.comment
+        }
+
+
+class AddressGroup:
+    """地址组（firewall addrgrp），members 为成员名元组"""
+    __slots__ = ('name', 'members', 'digest')
+    kind = 'addrgrp'
+
+    def __init__(self, name, members=()):
+        self.name = name
+        self.members = members
+        self.digest = None
+
+    @classmethod
+    def from_entry(cls, entry):
+        obj = cls(_intern(entry.name), _names(entry, 'member'))
+        obj.digest = entry_digest(entry)
+        return obj
+
+    def to_dict(self):
+        return {'name': self.name, 'members': list(self.members)}
+
+
+class AddressGroup6(AddressGroup):
+    __slots__ = ()
+    kind = 'addrgrp6'
+
+
+class ServiceGroup(AddressGroup):
+    __slots__ = ()
+    kind = 'servicegrp'
+
+
+class VIPGroup(AddressGroup):
+    __slots__ = ()
+    kind = 'vipgrp'
+
+
+class Zone:
+    """安全区域（system zone）"""
+    __slots__ = ('name', 'interfaces')
+    kind = 'zone'
+
+    def __init__(self, name, interfaces=()):
+        self.name = name
+        self.interfaces = interfaces
+
+    @property
+    def members(self):
+        return self.interfaces
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(_intern(entry.name), _names(entry, 'interface'))
+
+    def to_dict(self):
+        return list(self.interfaces)
+
+
+class Interface:
+    """接口（system interface）"""
+    __slots__ = ('name', 'ip', 'mask', 'type')
+    kind = 'interface'
+
+    def __init__(self, name, ip='', mask='', type=''):
+        self.name = name
+        self.ip = ip
+        self.mask = mask
+        self.type = type
+
+    @classmethod
+    def from_entry(cls, entry):
+        obj = cls(_intern(entry.name))
+        ip = entry.values('ip')
+        if len(ip) >= 2:
+            obj.ip, obj.mask = ip[0], ip[1]
+        obj.type = entry.value('type')
+        return obj
+
+    def to_dict(self):
+        props = {'name': self.name}
+        if self.ip:
+            props['ip'] = self.ip
+            props['mask'] = self.mask
+        if self.type:
+            props['type'] = self.type
+        return props
+
+
+class Schedule:
+    """调度（firewall schedule recurring / onetime）"""
+    __slots__ = ('name', 'day', 'start', 'end')
+    kind = 'schedule'
+
+    def __init__(self, name, day='', start='', end=''):
+        self.name = name
+        self.day = day
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(
+            _intern(entry.name), ' '.join(entry.values('day')),
+            entry.value('start'), entry.value('end')
+        )
+
+    def to_dict(self):
+        return {'name': self.name, 'day': self.day, 'start': self.start, 'end': self.end}
+
+
+class ScheduleGroup(AddressGroup):
+    __slots__ = ()
+    kind = 'schedulegroup'
+
+
+class IPPool:
+    """IP 池（firewall ippool）"""
+    __slots__ = ('name', 'type', 'startip', 'endip', 'comment')
+    kind = 'ippool'
+
+    def __init__(self, name, type='', startip='', endip='', comment=''):
+        self.name = name
+        self.type = type
+        self.startip = startip
+        self.endip = endip
+        self.comment = comment
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(
+            _intern(entry.name), entry.value('type'), entry.value('startip'),
+            entry.value('endip'), entry.value('comments') or entry.value('comment')
+        )
+
+    def to_dict(self):
+        return {
+            'name': self.name, 'type': self.type, 'startip': self.startip,
+            'endip': self.endip, 'comment': self.comment
+        }
+
+
+# 策略里常用的字段用 slot 存，其余 set 键放进 extra
+POLICY_FIELDS = (
+    'name', 'uuid', 'action', 'status', 'srcintf', 'dstintf', 'srcaddr', 'dstaddr',
+    'service', 'schedule', 'logtraffic', 'comments', 'nat', 'policyid',
+)
+# 引用对象名的字段，值统一为名字元组
+POLICY_REF_FIELDS = ('srcintf', 'dstintf', 'srcaddr', 'dstaddr', 'service', 'schedule')
+
+
+class Policy:
+    """
+    防火墙策略。get() 与原来的策略 dict 用法一致：
+    引号值有多个时为 list，单个时为 str，未加引号的值保持原样。
+    """
+    __slots__ = ('id', 'vdom', 'extra', 'digest') + POLICY_FIELDS
+    kind = 'policy'
+
+    def __init__(self, id, vdom=None):
+        self.id = id
+        self.vdom = vdom
+        self.extra = None
+        self.digest = None
+        for f in POLICY_FIELDS:
+            setattr(self, f, None)
+
+    @classmethod
+    def from_entry(cls, entry, vdom=None):
+        pol = cls(sys.intern(entry.name), vdom)
+        for key, value in entry.settings.items():
+            if value.startswith('"'):
+                items = [_intern(v) for v in split_values(value) if v]
+                if len(items) > 1:
+                    value = tuple(items)
+                elif items:
+                    value = items[0]
+                else:
+                    value = value.strip('"')
+            pol.set(key, value)
+        pol.digest = entry_digest(entry)
+        return pol
+
+    def set(self, key, value):
+        if key in _POLICY_SLOTS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def get(self, key, default=None):
+        if key == 'id':
+            return self.id
+        if key == 'vdom':
+            return self.vdom if self.vdom is not None else default
+        if key in _POLICY_SLOTS:
+            value = getattr(self, key)
+        elif self.extra:
+            value = self.extra.get(key)
+        else:
+            value = None
+        if value is None:
+            return '' if key == 'name' else default
+        return list(value) if isinstance(value, tuple) else value
+
+    def refs(self, key):
+        """引用字段的名字元组（单值也返回元组）"""
+        value = getattr(self, key, None) if key in _POLICY_SLOTS else (self.extra or {}).get(key)
+        if not value:
+            return ()
+        return value if isinstance(value, tuple) else (value,)
+
+    def to_dict(self):
+        pol = {'id': self.id}
+        for f in POLICY_FIELDS:
+            value = getattr(self, f)
+            if value is not None:
+                pol[f] = list(value) if isinstance(value, tuple) else value
+        if self.extra:
+            for key, value in self.extra.items():
+                pol[key] = list(value) if isinstance(value, tuple) else value
+        if 'name' not in pol:
+            pol['name'] = ''
+        if self.vdom:
+            pol['vdom'] = self.vdom
+        return pol
+
+
+_POLICY_SLOTS = frozenset(POLICY_FIELDS)
+
+# 段路径 -> 对象类
+SECTION_CLASSES = {
+    'firewall address': Address,
+    'firewall address6': Address6,
+    'firewall vip': VIP,
+    'firewall addrgrp': AddressGroup,
+    'firewall addrgrp6': AddressGroup6,
+    'firewall vipgrp': VIPGroup,
+    'firewall service custom': Service,
+    'firewall service group': ServiceGroup,
+    'system zone': Zone,
+    'system interface': Interface,
+    'firewall schedule recurring': Schedule,
+    'firewall schedule onetime': Schedule,
+    'firewall schedule group': ScheduleGroup,
+    'firewall ippool': IPPool,
+}
+
+# 同名对象的查找优先级（与原 render_obj_branch 的判断顺序一致，VIP 与地址并列）
+KIND_ORDER = (
+    'address', 'vip', 'addrgrp', 'service', 'servicegrp',
+    'address6', 'addrgrp6', 'vipgrp', 'zone', 'interface',
+    'schedule', 'schedulegroup', 'ippool',
+)
+_KIND_RANK = {k: i for i, k in enumerate(KIND_ORDER)}
+
+
+class _KindLookup:
+    """按类别过滤的小写名查找，接口同原来的 {小写名: 名} 字典（只用到 get）"""
+    __slots__ = ('objects', 'kind')
+
+    def __init__(self, objects, kind):
+        self.objects = objects
+        self.kind = kind
+
+    def get(self, key, default=None):
+        for obj in self.objects.bucket(key):
+            if obj.kind == self.kind:
+                return obj.name
+        return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+
+class VdomObjects:
+    """
+    一个 vdom（或整份配置）的全部对象。
+      by_kind: {类别: {名字: 对象}}
+      index:   {小写名: 对象}，唯一的大小写不敏感索引；跨类别重名时值为按 KIND_ORDER 排序的列表
+    """
+    __slots__ = ('name', 'by_kind', 'index', '_lookups')
+
+    def __init__(self, name=None):
+        self.name = name
+        self.by_kind = {k: {} for k in KIND_ORDER}
+        self.index = {}
+        self._lookups = {}
+
+    def add(self, obj):
+        self.by_kind[obj.kind][obj.name] = obj
+        key = obj.name.lower()
+        bucket = self.index.get(key)
+        if bucket is None:
+            self.index[key] = obj       # 不重名时直接存对象，省掉一层列表
+            return
+        if not isinstance(bucket, list):
+            bucket = self.index[key] = [bucket]
+        for i, other in enumerate(bucket):
+            if other.kind == obj.kind and other.name == obj.name:
+                bucket[i] = obj
+                return
+        bucket.append(obj)
+        bucket.sort(key=lambda o: _KIND_RANK[o.kind])
+
+    def bucket(self, key):
+        """小写名对应的全部对象（按优先级）"""
+        hit = self.index.get(key)
+        if hit is None:
+            return ()
+        return hit if isinstance(hit, list) else (hit,)
+
+    def kind(self, kind):
+        return self.by_kind[kind]
+
+    def find(self, name, kinds=None):
+        """大小写不敏感查找，一次字典命中；kinds 可限定类别"""
+        if not isinstance(name, str):
+            return None
+        hit = self.index.get(name.strip().lower())
+        if hit is None:
+            return None
+        if not isinstance(hit, list):
+            return hit if kinds is None or hit.kind in kinds else None
+        if kinds is None:
+            return hit[0]
+        for obj in hit:
+            if obj.kind in kinds:
+                return obj
+        return None
+
+    def lookup(self, kind):
+        """某类别的 {小写名: 名} 视图，供 GroupClosure 等沿用旧接口"""
+        if kind not in self._lookups:
+            self._lookups[kind] = _KindLookup(self, kind)
+        return self._lookups[kind]
+
+    def names(self, *kinds):
+        """指定类别全部对象名的小写集合"""
+        return {key for key in self.index if any(o.kind in kinds for o in self.bucket(key))}
+
+
+def load_objects(conf, vdom=None, all_vdoms=True):
+    """
+    把配置里的对象装进 VdomObjects。all_vdoms 为 True 时合并整份配置（原 main 的行为），
+    否则只取指定 vdom（None 为 global）的对象。
+    """
+    objects = VdomObjects(None if all_vdoms else vdom)
+    for scope, sec in iter_sections(conf, SECTION_CLASSES):
+        if not all_vdoms and scope != vdom:
+            continue
+        cls = SECTION_CLASSES[sec.name]
+        for entry in sec.entries.values():
+            objects.add(cls.from_entry(entry))
+    return objects
+
+
+def load_vdom_objects(conf):
+    """按 vdom 分别装载对象: {vdom名(global 为 None): VdomObjects}"""
+    result = {vdom: VdomObjects(vdom) for vdom in split_vdoms(conf)}
+    result.setdefault(None, VdomObjects(None))
+    for scope, sec in iter_sections(conf, SECTION_CLASSES):
+        if scope not in result:
+            result[scope] = VdomObjects(scope)
+        cls = SECTION_CLASSES[sec.name]
+        for entry in sec.entries.values():
+            result[scope].add(cls.from_entry(entry))
+    return result
+
+
+def load_policies(conf):
+    """按文档顺序装载全部策略（edit 名为数字的条目）"""
+    policies = []
+    for vdom, sec in iter_sections(conf, ('firewall policy',)):
+        for id, entry in sec.entries.items():
+            if id.isdigit():
+                policies.append(Policy.from_entry(entry, vdom))
+    return policies
@@ -0,0 +1,170 @@
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+
+from fortigate_cli import expand_inputs
+from fortigate_groups import GroupClosure
+from fortigate_model import SECTION_CLASSES, Policy, VdomObjects
+from fortigate_parser import edit_spans, open_config, parse_edit, section_index
+from fortigate_refs import FLATTEN_FIELDS
+
+
+POLICY_SECTION = 'firewall policy'
+
+
+def iter_edits(conf, start, end, path):
+    """
+    逐个解析一个段内的 edit 块: (edit名, 节点)。不建整段的树，内存只与单个块有关。
+    同名 edit 只在最后一次出现时给出（内容与 ConfigNode.entries 的规则相同）。
+    """
+    spans = edit_spans(conf, start, end)
+    last = {name: i for i, (name, _, _) in enumerate(spans)}
+    for i, (name, s, e) in enumerate(spans):
+        if last[name] != i:
+            continue
+        entry = parse_edit(conf, s, e, path)
+        if entry is not None:
+            yield name, entry
+
+
+class _ScopeLeaves:
+    """
+    流式处理中一个范围（vdom 或 global）已读到的对象与组展开。
+    对象段陆续加入，组闭包在该类别有新对象后作废，下次用到时重建。
+    """
+    __slots__ = ('objects', 'closures')
+
+    def __init__(self, vdom):
+        self.objects = VdomObjects(vdom)
+        self.closures = {}
+
+    def add(self, obj):
+        self.objects.add(obj)
+        self.closures.pop(obj.kind, None)
+
+    def members(self, name, kinds):
+        """组名 -> 叶子集合；不是本范围的组时返回 None"""
+        group = self.objects.find(name, kinds)
+        if group is None:
+            return None
+        closure = self.closures.get(group.kind)
+        if closure is None:
+            closure = self.closures[group.kind] = GroupClosure(
+                self.objects.kind(group.kind), self.objects.lookup(group.kind)
+            )
+        return closure.members(group.name)
+
+
+def _leaves(pol, scopes):
+    """策略各展开字段的叶子名列表（先查本 vdom 再查 global，不是组的名字原样保留）"""
+    result = {}
+    for field, kinds in FLATTEN_FIELDS.items():
+        leaves = set()
+        for name in pol.refs(field):
+            for scope in scopes:
+                members = scope.members(name, kinds)
+                if members is not None:
+                    leaves |= members
+                    break
+            else:
+                leaves.add(name)
+        result[field] = sorted(leaves)
+    return result
+
+
+def iter_records(conf, flatten=False, objects=True, source=None):
+    """
+    按文档顺序逐条生成记录（dict），边解析边产出:
+      {'record': 'object', 'config', 'vdom', 'kind', 'data': 对象的 to_dict()}
+      {'record': 'policy', 'config', 'vdom', 'data': parse_firewall_policy 的原始字段[, 'leaves']}
+    对象和策略自身的字段都放在 data 里，不会与外层的键冲突（如地址的 type）。
+    flatten 为 True 时为展开组保留已读到的对象（只与对象数有关，与策略数无关）。
+    """
+    scopes = {}
+
+    def scope(vdom):
+        if vdom not in scopes:
+            scopes[vdom] = _ScopeLeaves(vdom)
+        return scopes[vdom]
+
+    for start, end, vdom, path in section_index(conf).order:
+        if path == POLICY_SECTION:
+            chain = [scope(v) for v in dict.fromkeys((vdom, None))] if flatten else ()
+            for name, entry in iter_edits(conf, start, end, path):
+                if not name.isdigit():
+                    continue
+                pol = Policy.from_entry(entry, vdom)
+                record = {'record': 'policy', 'config': source, 'vdom': vdom, 'data': pol.to_dict()}
+                if flatten:
+                    record['leaves'] = _leaves(pol, chain)
+                yield record
+        elif path in SECTION_CLASSES and (objects or flatten):
+            cls = SECTION_CLASSES[path]
+            for _, entry in iter_edits(conf, start, end, path):
+                obj = cls.from_entry(entry)
+                if flatten:
+                    scope(vdom).add(obj)
+                if objects:
+                    data = obj.to_dict()
+                    if isinstance(data, list):
+                        data = {'name': obj.name, 'members': data}
+                    yield {'record': 'object', 'config': source, 'vdom': vdom, 'kind': obj.kind, 'data': data}
+
+
+def write_ndjson(inputs, out, flatten=False, objects=True):
+    """逐条写出多份配置的记录（每行一个 JSON，解析到哪写到哪，不等整份配置解析完），返回 {类型: 条数}"""
+    counts = {'object': 0, 'policy': 0}
+    for path in inputs:
+        conf = open_config(path)
+        try:
+            for record in iter_records(conf, flatten, objects, path):
+                out.write(json.dumps(record, ensure_ascii=False))
+                out.write('\n')
+                counts[record['record']] += 1
+        finally:
+            # 多份配置依次处理，写完一份就释放其映射（空文件时为 b''）
+            if isinstance(conf, mmap.mmap):
+                conf.close()
+    out.flush()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="ポリシーとオブジェクトを 1 行 1 レコードの JSON（NDJSON）として逐次出力します。"
+    )
+    parser.add_argument('paths', nargs='+', help="設定ファイル・ワイルドカード・ディレクトリ（複数可）")
+    parser.add_argument('-o', '--output', help="出力ファイル（省略時は標準出力）")
+    parser.add_argument('--flatten', action='store_true',
+                        help="ポリシーに srcaddr / dstaddr / service のグループ展開結果（leaves）を付ける")
+    parser.add_argument('--no-objects', action='store_true', help="オブジェクトのレコードを出力しない")
+    args = parser.parse_args(argv)
+
+    inputs = expand_inputs(args.paths)
+    missing = [path for path in inputs if not os.path.isfile(path)]
+    if missing:
+        for path in missing:
+            print(f"ファイルが見つかりません: {path}", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        counts = write_ndjson(inputs, out, args.flatten, not args.no_objects)
+    except BrokenPipeError:
+        # 读取方（jq / head 等）先退出了：后续输出丢弃，避免退出时再报错
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"ポリシー {counts['policy']}件 / オブジェクト {counts['object']}件"
+          f"  処理時間 {time.perf_counter() - started:.1f}秒", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,496 @@
+import codecs
+import mmap
+import re
+import weakref
+
+
+# 解析器/对象模型的版本号。解析结果或模型类的结构有变化时递增，磁盘上的解析缓存随之失效
+PARSER_VERSION = 5
+
+
+class ConfigNode:
+    """
+    配置树节点。kind 为 'root' / 'config' / 'edit'：
+      - config 节点: name 为段路径（如 'firewall address'），entries 为 {edit名: 节点}
+      - edit 节点:   name 为对象名，settings 为 {键: 原始值}
+    两者都可以通过 sections 挂嵌套的 config 段。start/end 为在原文中的字符偏移。
+    """
+    __slots__ = ('kind', 'name', 'settings', 'entries', 'sections', 'start', 'end')
+
+    def __init__(self, kind, name, start=0):
+        self.kind = kind
+        self.name = name
+        self.settings = {}
+        self.entries = {}
+        self.sections = []
+        self.start = start
+        self.end = start
+
+    def get(self, key, default=''):
+        """取 set 值的原始文本"""
+        return self.settings.get(key, default)
+
+    def values(self, key):
+        """取 set 值拆分后的列表（去引号）"""
+        raw = self.settings.get(key)
+        return split_values(raw) if raw else []
+
+    def value(self, key, default=''):
+        """取 set 值的第一个元素（去引号）"""
+        vals = self.values(key)
+        return vals[0] if vals else default
+
+    def __repr__(self):
+        return f"<ConfigNode {self.kind} {self.name!r}>"
+
+
+_VALUE_RE = re.compile(r'"((?:[^"\\]|\\.)*)"|\'([^\']*)\'|(\S+)', re.DOTALL)
+
+
+def split_values(raw):
+    """把 set 的值拆成列表: '"a b" "c" d' -> ['a b', 'c', 'd']，'' 视为空值"""
+    out = []
+    for m in _VALUE_RE.finditer(raw):
+        dq, sq, bare = m.groups()
+        if dq is not None:
+            out.append(dq.replace('\\"', '"').replace('\\\\', '\\') if '\\' in dq else dq)
+        elif sq is not None:
+            if sq:
+                out.append(sq)
+        else:
+            out.append(bare)
+    return out
+
+
+def _open_quote(value, quote='"', escaped='\\"'):
+    # 未闭合的双引号（证书、替换消息等跨行值）
+    return (value.count(quote) - value.count(escaped)) % 2 == 1
+
+
+_STR_TOKENS = ('\n', ' ', '#', '"', '\\"', '\n')
+_BYTES_TOKENS = (b'\n', b' ', b'#'[0], b'"', b'\\"', b'\n')
+_BYTES_KEYWORDS = {
+    b'config': 'config', b'edit': 'edit', b'next': 'next', b'end': 'end',
+    b'set': 'set', b'append': 'append', b'unset': 'unset',
+}
+
+
+def _iter_statements(conf_text, start=0, end=None):
+    """
+    逐行切分语句，返回 (关键字, 其余部分, 行首偏移, 下一行偏移)。
+    跨行的引号值（证书、替换消息等）合并为一条 set 语句。
+    conf_text 也可以是 bytes/mmap：此时关键字解码为 str，其余部分保持 bytes，偏移为字节偏移。
+    """
+    is_str = isinstance(conf_text, str)
+    nl_tok, sp, hash_tok, quote, escaped, joiner = _STR_TOKENS if is_str else _BYTES_TOKENS
+    pos = start
+    n = len(conf_text) if end is None else end
+    find = conf_text.find
+    while pos < n:
+        line_start = pos
+        nl = find(nl_tok, pos, n)
+        if nl < 0:
+            nl = n
+        pos = nl + 1
+        line = conf_text[line_start:nl].strip()
+        if not line or line[0] == hash_tok:
+            continue
+        kw, _, rest = line.partition(sp)
+        if not is_str:
+            kw = _BYTES_KEYWORDS.get(kw, '')
+        if (kw == 'set' or kw == 'append') and quote in rest and _open_quote(rest, quote, escaped):
+            parts = [rest]
+            while pos < n:
+                nl = find(nl_tok, pos, n)
+                if nl < 0:
+                    nl = n
+                parts.append(conf_text[pos:nl])
+                pos = nl + 1
+                if _open_quote(parts[-1], quote, escaped):
+                    break
+            rest = joiner.join(parts).rstrip()
+        yield kw, rest, line_start, min(pos, n)
+
+
+def parse_config(conf_text):
+    """
+    单趟扫描整份配置，构建 config/edit/set/next/end 树，返回 root 节点。
+    同一份文本的重复调用直接命中缓存（见 _derived）。
+    """
+    cache = _derived(conf_text)
+    if 'tree' not in cache:
+        cache['tree'] = build_tree(_decode_span(conf_text))
+    return cache['tree']
+
+
+def build_tree(conf_text, start=0, end=None, base=0):
+    """
+    把 conf_text[start:end] 解析成树（不复制文本，偏移为原文中的绝对位置）。
+    base 用于解码后的片段：节点偏移 = 片段内偏移 + base。
+    """
+    n = len(conf_text) if end is None else end
+    root = ConfigNode('root', '', start + base)
+    stack = [root]
+    for kw, rest, line_start, pos in _iter_statements(conf_text, start, n):
+        line_start += base
+        pos += base
+        node = stack[-1]
+        if kw == 'set' or kw == 'append':
+            key, _, value = rest.partition(' ')
+            if kw == 'append' and key in node.settings:
+                node.settings[key] += ' ' + value
+            else:
+                node.settings[key] = value
+        elif kw == 'unset':
+            node.settings.pop(rest.strip(), None)
+        elif kw == 'config':
+            child = ConfigNode('config', rest.strip(), line_start)
+            node.sections.append(child)
+            stack.append(child)
+        elif kw == 'edit':
+            if node.kind != 'config':
+                continue
+            names = split_values(rest)
+            child = ConfigNode('edit', names[0] if names else rest.strip(), line_start)
+            node.entries[child.name] = child
+            stack.append(child)
+        elif kw == 'next':
+            if node.kind == 'edit':
+                node.end = pos
+                stack.pop()
+        elif kw == 'end':
+            # 缺少 next 的 edit 也一并关闭
+            while len(stack) > 1 and stack[-1].kind == 'edit':
+                stack.pop().end = line_start
+            if len(stack) > 1:
+                stack.pop().end = pos
+    while len(stack) > 1:
+        stack.pop().end = n + base
+    root.end = n + base
+    return root
+
+
+def edit_spans(conf_text, start, end):
+    """
+    一个顶层段 [start, end) 内的顶层 edit 块: [(edit名, 起点, 终点)]，文档顺序，不解析 set 值。
+    块的划分与 build_tree 一致（缺少 next 的 edit 到 end 行为止）。
+    """
+    spans = []
+    stack = []     # 'c' = config, 'e' = edit
+    current = None
+    for kw, rest, line_start, pos in _iter_statements(conf_text, start, end):
+        if kw == 'config':
+            stack.append('c')
+        elif kw == 'edit':
+            if not stack or stack[-1] != 'c':
+                continue
+            stack.append('e')
+            if len(stack) == 2:
+                names = split_values(_decode(rest))
+                current = [names[0] if names else _decode(rest).strip(), line_start]
+        elif kw == 'next':
+            if stack and stack[-1] == 'e':
+                stack.pop()
+                if len(stack) == 1 and current is not None:
+                    spans.append((current[0], current[1], pos))
+                    current = None
+        elif kw == 'end':
+            while stack and stack[-1] == 'e':
+                stack.pop()
+                if len(stack) == 1 and current is not None:
+                    spans.append((current[0], current[1], line_start))
+                    current = None
+            if stack:
+                stack.pop()
+    if current is not None:
+        spans.append((current[0], current[1], end))
+    return spans
+
+
+def parse_edit(conf_text, start, end, path=''):
+    """单独解析一个 edit 块（edit_spans 给出的区间），返回 edit 节点；偏移仍为原文中的位置"""
+    prefix = f"config {path}\n"
+    root = build_tree(prefix + _decode_span(conf_text, start, end) + "\nend\n", base=start - len(prefix))
+    sec = root.sections[0]
+    return next(iter(sec.entries.values()), None)
+
+
+class SectionIndex:
+    """
+    段偏移索引: {vdom名(global 为 None): {段路径: [(start, end), ...]}}。
+    只记录 global / 各 vdom 下的顶层业务段，段内容在首次访问时才解析成树。
+    mmap 只弱引用（索引缓存在 _derived 里，不能反过来让 mmap 一直活着），使用期间由调用方持有。
+    """
+    __slots__ = ('_conf', 'spans', 'order', 'vdom_spans', '_nodes')
+
+    def __init__(self, conf_text):
+        self._conf = weakref.ref(conf_text) if isinstance(conf_text, mmap.mmap) else (lambda: conf_text)
+        self.spans = {None: {}}
+        self.order = []     # [(start, end, vdom, 段路径)]，文档顺序
+        self.vdom_spans = {None: []}
+        self._nodes = {}
+
+    def add(self, vdom, path, start, end):
+        self.spans.setdefault(vdom, {}).setdefault(path, []).append((start, end))
+        self.order.append((start, end, vdom, path))
+
+    @property
+    def conf_text(self):
+        return self._conf()
+
+    def vdoms(self):
+        return [v for v in self.spans if v is not None]
+
+    def get(self, path, vdom=None):
+        """O(1) 取某 vdom 下某段的全部 (start, end)"""
+        return self.spans.get(vdom, {}).get(path, [])
+
+    def text(self, path, vdom=None):
+        """取某 vdom 下某段的原文切片（bytes/mmap 时解码为 str）"""
+        return [_decode_span(self.conf_text, s, e) for s, e in self.get(path, vdom)]
+
+    def node(self, start, end):
+        """解析单个段并缓存，返回对应的 config 节点"""
+        key = (start, end)
+        if key not in self._nodes:
+            conf_text = self.conf_text
+            if isinstance(conf_text, str):
+                root = build_tree(conf_text, start, end)
+            else:
+                # 只解码这一段，偏移仍为原文件中的字节偏移
+                root = build_tree(_decode_span(conf_text, start, end), base=start)
+            self._nodes[key] = root.sections[0] if root.sections else ConfigNode('config', '', start)
+        return self._nodes[key]
+
+    def sections(self, names=None):
+        """按文档顺序返回 (vdom名, 段节点)，names 为 None 时返回全部"""
+        for start, end, vdom, path in self.order:
+            if names is None or path in names:
+                yield vdom, self.node(start, end)
+
+
+def _decode(raw):
+    return raw if isinstance(raw, str) else raw.decode('utf-8', 'replace')
+
+
+def _decode_span(conf_text, start=0, end=None):
+    """conf_text[start:end] 解码为 str；bytes/mmap 经 memoryview 直接解码，不先复制出一份 bytes"""
+    if isinstance(conf_text, str):
+        return conf_text[start:end]
+    with memoryview(conf_text) as view:
+        return codecs.decode(view[start:end], 'utf-8', 'replace')
+
+
+# 按配置缓冲的身份缓存派生结果（段索引、整棵树）: {种类: 结果}。
+# mmap 以弱引用为键，释放后条目随之消失，缓存本身不延长其生命期；
+# str/bytes 不能弱引用，只记住最近的一份
+_by_buffer = weakref.WeakKeyDictionary()
+_recent = [None, {}]
+
+
+def _derived(conf_text):
+    if isinstance(conf_text, mmap.mmap):
+        cache = _by_buffer.get(conf_text)
+        if cache is None:
+            cache = _by_buffer[conf_text] = {}
+        return cache
+    if _recent[0] is not conf_text:
+        _recent[:] = [conf_text, {}]
+    return _recent[1]
+
+
+def open_config(path):
+    """
+    以只读 mmap 方式打开配置文件，返回可直接交给各解析函数的字节缓冲。
+    页面由操作系统按需换入换出，内存占用基本与文件大小无关；空文件返回 b''。
+    """
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b''
+
+
+def section_index(conf_text):
+    """构建（并缓存，见 _derived）整份配置的段偏移索引，conf_text 可以是 str / bytes / mmap"""
+    cache = _derived(conf_text)
+    if 'index' not in cache:
+        cache['index'] = build_section_index(conf_text)
+    return cache['index']
+
+
+def build_section_index(conf_text):
+    """
+    轻量扫描一遍，只跟踪 config/edit/next/end 的层次，记录业务段位置，不构建 set 值。
+    'config global' 视为容器；'config vdom' 下每个 edit 的内容归属该 vdom。
+    同一趟里顺带记录各 vdom 正文的区间（见 split_vdoms）。
+    """
+    index = SectionIndex(conf_text)
+    n = len(conf_text)
+    # 栈元素: [类型, 名称, 起始偏移, 所属vdom, 层级]
+    # 层级: 'top' 业务顶层段 / 'global' / 'vdom' 容器 / 'vdom-edit' / 'inner' 其他
+    # vdom-edit 的起始偏移记录的是 edit 行之后的正文起点
+    stack = []
+    root_cursor = 0     # 'config vdom' 容器之外（root 部分）的当前起点
+
+    def close_edit(frame, body_end):
+        if frame[4] == 'vdom-edit' and body_end > frame[2]:
+            index.vdom_spans.setdefault(frame[1], []).append((frame[2], body_end))
+
+    for kw, rest, line_start, pos in _iter_statements(conf_text):
+        if kw == 'config':
+            parent = stack[-1] if stack else None
+            name = _decode(rest).strip()
+            vdom = parent[3] if parent else None
+            if parent is None or parent[4] in ('global', 'vdom-edit'):
+                level = name if name in ('global', 'vdom') else 'top'
+            else:
+                level = 'inner'
+            if level == 'vdom' and line_start > root_cursor:
+                index.vdom_spans[None].append((root_cursor, line_start))
+            stack.append(['config', name, line_start, vdom, level])
+        elif kw == 'edit':
+            if not stack or stack[-1][0] != 'config':
+                continue
+            parent = stack[-1]
+            if parent[4] == 'vdom':
+                names = split_values(_decode(rest))
+                vdom = names[0] if names else _decode(rest).strip()
+                index.spans.setdefault(vdom, {})
+                index.vdom_spans.setdefault(vdom, [])
+                stack.append(['edit', vdom, pos, vdom, 'vdom-edit'])
+            else:
+                stack.append(['edit', '', line_start, parent[3], 'inner'])
+        elif kw == 'next':
+            if stack and stack[-1][0] == 'edit':
+                close_edit(stack.pop(), line_start)
+        elif kw == 'end':
+            while stack and stack[-1][0] == 'edit':
+                close_edit(stack.pop(), line_start)
+            if stack:
+                _, name, start, vdom, level = stack.pop()
+                if level == 'top':
+                    index.add(vdom, name, start, pos)
+                elif level == 'vdom':
+                    root_cursor = pos
+    while stack:
+        frame = stack.pop()
+        if frame[0] == 'edit':
+            close_edit(frame, n)
+        elif frame[4] == 'top':
+            index.add(frame[3], frame[1], frame[2], n)
+        elif frame[4] == 'vdom':
+            root_cursor = n
+    if n > root_cursor:
+        index.vdom_spans[None].append((root_cursor, n))
+    index.order.sort()
+    return index
+
+
+def split_vdoms(conf):
+    """
+    VDOM 切分（不复制文本）: 返回 {vdom名: [(start, end), ...]}，
+    各区间为 'config vdom' 下 edit 与 next 之间的正文；'config vdom' 容器之外的部分键为 None。
+    """
+    return section_index(conf).vdom_spans
+
+
+def vdom_slices(conf, spans):
+    """
+    把 split_vdoms 的区间变成原缓冲上的切片: bytes/mmap 返回 memoryview（零拷贝），str 返回子串。
+    """
+    if isinstance(conf, str):
+        return [conf[s:e] for s, e in spans]
+    view = memoryview(conf)
+    return [view[s:e] for s, e in spans]
+
+
+def get_tree(conf):
+    """接受配置文本或已解析的节点，统一返回节点"""
+    if isinstance(conf, ConfigNode):
+        return conf
+    return parse_config(conf)
+
+
+def walk_sections(node, vdom=None):
+    """
+    按文档顺序遍历所有业务 config 段，返回 (vdom名, 段节点)。
+    'config global' 透明展开；'config vdom' 下每个 edit 的内容归属该 vdom（global 部分 vdom 为 None）。
+    """
+    for sec in node.sections:
+        if sec.name == 'global':
+            yield from walk_sections(sec, None)
+        elif sec.name == 'vdom':
+            for entry in sec.entries.values():
+                yield from walk_sections(entry, entry.name)
+        else:
+            yield vdom, sec
+
+
+def iter_sections(conf, names=None):
+    """
+    返回 (vdom名, 段节点)。传入文本时走段偏移索引，只解析 names 指定的段；
+    传入节点时直接遍历树。
+    """
+    if isinstance(conf, ConfigNode):
+        for vdom, sec in walk_sections(conf):
+            if names is None or sec.name in names:
+                yield vdom, sec
+    else:
+        yield from section_index(conf).sections(names)
+
+
+def find_sections(conf, name):
+    """按精确段名取出全部 config 段（不会把 address6 当成 address）"""
+    return [sec for _, sec in iter_sections(conf, (name,))]
+
+
+def iter_entries(conf, name):
+    """遍历指定段下的所有 edit 条目"""
+    for sec in find_sections(conf, name):
+        yield from sec.entries.values()
+
+
+def vdom_scopes(conf, names=None):
+    """
+    按 vdom 拆分，返回 {vdom名: 节点}，global（含非 vdom 配置）键为 None。
+    同一 vdom 出现多次（先声明后定义）时合并其段；names 可限定只取哪些段。
+    """
+    scopes = {None: ConfigNode('root', 'global')}
+    if not isinstance(conf, ConfigNode):
+        for vdom in section_index(conf).vdoms():
+            scopes[vdom] = ConfigNode('root', vdom)
+    for vdom, sec in iter_sections(conf, names):
+        if vdom not in scopes:
+            scopes[vdom] = ConfigNode('root', vdom)
+        scopes[vdom].sections.append(sec)
+    return scopes
+
+
+# 段路径 -> 对象类别
+OBJECT_SECTIONS = {
+    'firewall address': 'address',
+    'firewall addrgrp': 'addrgrp',
+    'firewall address6': 'address6',
+    'firewall addrgrp6': 'addrgrp6',
+    'firewall vip': 'vip',
+    'firewall vipgrp': 'vipgrp',
+    'firewall service custom': 'service',
+    'firewall service group': 'servicegrp',
+    'firewall schedule recurring': 'schedule',
+    'firewall schedule onetime': 'schedule',
+    'firewall schedule group': 'schedulegroup',
+    'firewall ippool': 'ippool',
+    'system zone': 'zone',
+    'system interface': 'interface',
+}
+
+# 组类对象 -> 成员所在的 set 键
+GROUP_MEMBER_KEYS = {
+    'addrgrp': 'member',
+    'addrgrp6': 'member',
+    'vipgrp': 'member',
+    'servicegrp': 'member',
+    'schedulegroup': 'member',
+    'zone': 'interface',
+}
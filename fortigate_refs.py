@@ -0,0 +1,248 @@
+import argparse
+import sys
+
+from fortigate_model import load_vdom_objects
+from fortigate_parser import iter_sections, open_config
+
+
+ADDR_KINDS = ('address', 'addrgrp', 'vip', 'vipgrp')
+ADDR6_KINDS = ('address6', 'addrgrp6')
+SERVICE_KINDS = ('service', 'servicegrp')
+SCHEDULE_KINDS = ('schedule', 'schedulegroup')
+INTF_KINDS = ('zone', 'interface')
+
+# 组类别 -> 成员可以是的类别
+GROUP_MEMBER_KINDS = {
+    'addrgrp': ('address', 'addrgrp'),
+    'addrgrp6': ADDR6_KINDS,
+    'vipgrp': ('vip',),
+    'servicegrp': SERVICE_KINDS,
+    'schedulegroup': ('schedule',),
+    'zone': ('interface',),
+}
+
+# 策略中按组展开（差分、NDJSON 的 --flatten）的字段 -> 可以引用的组类别
+FLATTEN_FIELDS = {
+    'srcaddr': ('addrgrp', 'vipgrp'),
+    'dstaddr': ('addrgrp', 'vipgrp'),
+    'service': ('servicegrp',),
+}
+
+# 会引用对象的各类策略表，以及其中引用对象的字段
+REFERENCE_SECTIONS = (
+    'firewall policy', 'firewall policy6', 'firewall local-in-policy', 'firewall proxy-policy',
+    'firewall shaping-policy', 'firewall multicast-policy', 'firewall central-snat-map',
+    'firewall DoS-policy', 'firewall interface-policy',
+)
+REFERENCE_FIELDS = {
+    'srcaddr': ADDR_KINDS, 'dstaddr': ADDR_KINDS,
+    'orig-addr': ADDR_KINDS, 'dst-addr': ADDR_KINDS,
+    'srcaddr6': ADDR6_KINDS, 'dstaddr6': ADDR6_KINDS,
+    'service': SERVICE_KINDS,
+    'schedule': SCHEDULE_KINDS,
+    'poolname': ('ippool',), 'nat-ippool': ('ippool',),
+    'srcintf': INTF_KINDS, 'dstintf': INTF_KINDS, 'intf': INTF_KINDS, 'interface': INTF_KINDS,
+}
+
+# 未使用报告不包括接口（路由、DHCP 等处也会引用，这里没有索引）
+UNUSED_KINDS = (
+    'address', 'addrgrp', 'vip', 'vipgrp', 'address6', 'addrgrp6',
+    'service', 'servicegrp', 'schedule', 'schedulegroup', 'ippool', 'zone',
+)
+
+KIND_LABELS = {
+    'address': "アドレス", 'addrgrp': "アドレスグループ", 'vip': "VIP", 'vipgrp': "VIPグループ",
+    'address6': "IPv6アドレス", 'addrgrp6': "IPv6グループ", 'service': "サービス",
+    'servicegrp': "サービスグループ", 'schedule': "スケジュール", 'schedulegroup': "スケジュールグループ",
+    'ippool': "IPプール", 'zone': "ゾーン", 'interface': "インターフェース",
+}
+
+
+class ReferenceIndex:
+    """
+    反向引用索引，一次遍历建成:
+      referrers: {对象键: [引用者, ...]}
+        对象键 = (vdom, 类别, 名字)，vdom 为定义所在的范围（global 为 None）
+        引用者 = ('group', 组的对象键) 或 ('policy', vdom, 段名, 条目名, 字段)
+      members:   {组的对象键: [成员对象键, ...]}
+      used:      从各策略表出发沿组成员向下能到达的对象键集合
+    名字先在引用方所在 vdom 查找，找不到再查 global。
+    """
+    __slots__ = ('scopes', 'referrers', 'members', 'used')
+
+    def __init__(self, conf):
+        self.scopes = load_vdom_objects(conf)
+        self.referrers = {}
+        self.members = {}
+        self.used = set()
+        self._build(conf)
+
+    def _resolve(self, vdom, name, kinds):
+        for scope in (vdom, None) if vdom is not None else (None,):
+            objs = self.scopes.get(scope)
+            if objs is None:
+                continue
+            obj = objs.find(name, kinds)
+            if obj is not None:
+                return (scope, obj.kind, obj.name)
+        return None
+
+    def _add(self, key, referrer):
+        self.referrers.setdefault(key, []).append(referrer)
+
+    def _build(self, conf):
+        # 组成员
+        for vdom, objs in self.scopes.items():
+            for gkind, member_kinds in GROUP_MEMBER_KINDS.items():
+                for group in objs.kind(gkind).values():
+                    gkey = (vdom, gkind, group.name)
+                    kids = []
+                    for m in group.members:
+                        key = self._resolve(vdom, m, member_kinds)
+                        if key is not None:
+                            self._add(key, ('group', gkey))
+                            kids.append(key)
+                    self.members[gkey] = kids
+        # 策略表
+        roots = []
+        for vdom, sec in iter_sections(conf, REFERENCE_SECTIONS):
+            for entry_name, entry in sec.entries.items():
+                for field, kinds in REFERENCE_FIELDS.items():
+                    if field not in entry.settings:
+                        continue
+                    for name in entry.values(field):
+                        key = self._resolve(vdom, name, kinds)
+                        if key is not None:
+                            self._add(key, ('policy', vdom, sec.name, entry_name, field))
+                            roots.append(key)
+        # 向下可达 = 实际在用
+        used = self.used
+        stack = roots
+        while stack:
+            key = stack.pop()
+            if key in used:
+                continue
+            used.add(key)
+            stack.extend(self.members.get(key, ()))
+
+    def find(self, name, vdom=None):
+        """名字 -> 匹配的对象键列表（所有类别；vdom 给出时只看该 vdom 与 global）"""
+        keys = []
+        for scope, objs in self.scopes.items():
+            if vdom is not None and scope not in (vdom, None):
+                continue
+            for obj in objs.bucket(name.strip().lower()):
+                keys.append((scope, obj.kind, obj.name))
+        return keys
+
+    def where_used(self, key):
+        """
+        一个对象在哪里被用到: (直接引用者列表, 经由的祖先组列表, [(策略引用者, 经由的组键或 None), ...])
+        沿引用者向上走（组 -> 包含它的组 -> ...），收集所有引用这些组的策略。
+        """
+        direct = self.referrers.get(key, [])
+        groups = []
+        policies = []
+        seen = {key}
+        queue = [(key, None)]
+        while queue:
+            node, via = queue.pop(0)
+            for ref in self.referrers.get(node, ()):
+                if ref[0] == 'group':
+                    gkey = ref[1]
+                    if gkey not in seen:
+                        seen.add(gkey)
+                        groups.append(gkey)
+                        queue.append((gkey, gkey))
+                else:
+                    policies.append((ref, via))
+        return direct, groups, policies
+
+    def unused(self, vdom=...):
+        """
+        未使用的对象: [(对象键, 原因)]，原因为 'unreferenced'（没有任何引用）
+        或 'unused-groups'（只被同样未使用的组引用）。vdom 默认全部范围。
+        """
+        result = []
+        for scope, objs in self.scopes.items():
+            if vdom is not ... and scope != vdom:
+                continue
+            for kind in UNUSED_KINDS:
+                for name in objs.kind(kind):
+                    key = (scope, kind, name)
+                    if key in self.used:
+                        continue
+                    reason = 'unused-groups' if key in self.referrers else 'unreferenced'
+                    result.append((key, reason))
+        return result
+
+
+def describe_key(key):
+    scope, kind, name = key
+    prefix = f"[{scope}] " if scope else ""
+    return f"{prefix}{KIND_LABELS.get(kind, kind)}「{name}」"
+
+
+def describe_referrer(ref):
+    if ref[0] == 'group':
+        return describe_key(ref[1])
+    _, vdom, section, entry, field = ref
+    prefix = f"[{vdom}] " if vdom else ""
+    return f"{prefix}{section} {entry}（{field}）"
+
+
+def unused_report(index, vdom=...):
+    """未使用对象的日文报告行"""
+    lines = []
+    for key, reason in index.unused(vdom):
+        note = "どこからも参照されていません" if reason == 'unreferenced' else "未使用のグループからのみ参照されています"
+        lines.append(f"{describe_key(key)}: {note}")
+    return lines
+
+
+def where_used_report(index, name, vdom=None):
+    """“X 在哪里被用到” 的日文报告行"""
+    keys = index.find(name, vdom)
+    if not keys:
+        return [f"「{name}」という名前のオブジェクトは定義されていません。"]
+    lines = []
+    for key in keys:
+        direct, groups, policies = index.where_used(key)
+        lines.append(f"{describe_key(key)}:")
+        if not direct:
+            lines.append("  参照なし")
+            continue
+        for gkey in groups:
+            lines.append(f"  含まれるグループ: {describe_key(gkey)}")
+        for ref, via in policies:
+            suffix = f" ← {describe_key(via)} 経由" if via is not None else ""
+            lines.append(f"  ポリシー: {describe_referrer(ref)}{suffix}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="オブジェクトの参照元検索と未使用オブジェクトの一覧を出力します。")
+    parser.add_argument('conf', help="FortiGate 設定ファイル")
+    parser.add_argument('--where', action='append', default=[], metavar='NAME', help="参照元を調べるオブジェクト名（複数可）")
+    parser.add_argument('--unused', action='store_true', help="未使用オブジェクトを一覧表示")
+    parser.add_argument('--vdom', help="対象 VDOM")
+    args = parser.parse_args(argv)
+    if not args.where and not args.unused:
+        parser.error("--where または --unused を指定してください。")
+
+    index = ReferenceIndex(open_config(args.conf))
+    for name in args.where:
+        print(f"==== {name} ====")
+        for line in where_used_report(index, name, args.vdom):
+            print(line)
+    if args.unused:
+        print("==== 未使用オブジェクト ====")
+        lines = unused_report(index, args.vdom if args.vdom else ...)
+        for line in lines:
+            print(line)
+        print(f"合計 {len(lines)} 件")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
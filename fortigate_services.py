@@ -0,0 +1,237 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import groupby
+
+from fortigate_groups import group_closure
+from fortigate_ipindex import merge_intervals
+
+
+PORT_FULL = (0, 65535)
+ICMP_FULL = (0, 255)
+PROTO_ANY = 0       # protocol IP + protocol-number 0: 任意协议
+
+PROTOCOL_NAMES = {1: 'ICMP', 6: 'TCP', 17: 'UDP', 58: 'ICMP6', 132: 'SCTP'}
+_PORT_ATTRS = (('tcp_port', 6), ('udp_port', 17), ('sctp_port', 132))
+
+
+def _range(text, full):
+    lo, _, hi = text.partition('-')
+    if not lo.isdigit():
+        return None
+    lo = int(lo)
+    hi = int(hi) if hi.isdigit() else lo
+    if lo > hi:
+        lo, hi = hi, lo
+    return max(lo, full[0]), min(hi, full[1])
+
+
+def parse_portrange_terms(text, proto):
+    """
+    "80-90:1024-65535 443" -> [(proto, 80, 90, 1024, 65535), (proto, 443, 443, 0, 65535)]
+    每项为 目的端口[-止][:源端口[-止]]，源端口省略时为全部。
+    """
+    terms = []
+    for item in text.split():
+        dst, _, src = item.partition(':')
+        d = _range(dst, PORT_FULL)
+        if d is None:
+            continue
+        s = _range(src, PORT_FULL) if src else PORT_FULL
+        if s is None:
+            s = PORT_FULL
+        terms.append((proto, d[0], d[1], s[0], s[1]))
+    return terms
+
+
+def service_terms(svc):
+    """
+    Service -> [(协议号, 目的起, 目的止, 源起, 源止), ...]
+    ICMP/ICMP6 的“目的”为 type，“源”为 code；protocol IP 时整个协议（号为 0 时任意协议）。
+    explicit proxy 等无法表示的类型返回空列表。
+    """
+    ptype = svc.protocol_type
+    if ptype == 'IP':
+        number = int(svc.protocol_number) if svc.protocol_number.isdigit() else 0
+        return [(number, *PORT_FULL, *PORT_FULL)]
+    if ptype in ('ICMP', 'ICMP6'):
+        proto = 1 if ptype == 'ICMP' else 58
+        t = _range(svc.icmptype, ICMP_FULL) if svc.icmptype else ICMP_FULL
+        c = _range(svc.icmpcode, ICMP_FULL) if svc.icmpcode else ICMP_FULL
+        return [(proto, *(t or ICMP_FULL), *(c or ICMP_FULL))]
+    if ptype.startswith('TCP'):
+        terms = []
+        for attr, proto in _PORT_ATTRS:
+            terms.extend(parse_portrange_terms(getattr(svc, attr), proto))
+        return terms
+    return []
+
+
+def _full_for(proto):
+    return ICMP_FULL if proto in (1, 58) else PORT_FULL
+
+
+def canonical_terms(terms):
+    """
+    把一组 (协议, 目的区间, 源区间) 矩形规范化: 按协议沿目的端口切成基本段，
+    每段的源区间合并，相邻且源区间相同的段再合并。相同的端口集合必然得到相同结果，可直接比较/哈希。
+    返回 ((协议, ((目的起, 目的止, ((源起, 源止), ...)), ...)), ...)
+    """
+    if any(t[0] == PROTO_ANY for t in terms):
+        return ((PROTO_ANY, ((*PORT_FULL, (PORT_FULL,)),)),)
+    result = []
+    terms = sorted(terms)
+    for proto, group in groupby(terms, key=lambda t: t[0]):
+        rects = [t[1:] for t in group]
+        points = sorted({r[0] for r in rects} | {r[1] + 1 for r in rects})
+        segments = []
+        for i in range(len(points) - 1):
+            lo, hi = points[i], points[i + 1] - 1
+            src = merge_intervals([(r[2], r[3]) for r in rects if r[0] <= lo and r[1] >= hi])
+            if not src:
+                continue
+            src = tuple(src)
+            if segments and segments[-1][2] == src and segments[-1][1] + 1 == lo:
+                segments[-1] = (segments[-1][0], hi, src)
+            else:
+                segments.append((lo, hi, src))
+        if segments:
+            result.append((proto, tuple(segments)))
+    return tuple(result)
+
+
+class ServiceSet:
+    """规范化后的服务端口集合；相等即表示两个服务放行的流量完全一样"""
+    __slots__ = ('terms', '_hash')
+
+    def __init__(self, terms):
+        self.terms = canonical_terms(terms)
+        self._hash = hash(self.terms)
+
+    @classmethod
+    def from_service(cls, svc):
+        return cls(service_terms(svc))
+
+    def __eq__(self, other):
+        return isinstance(other, ServiceSet) and self.terms == other.terms
+
+    def __hash__(self):
+        return self._hash
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def rectangles(self):
+        """展开为 (协议, 目的起, 目的止, 源起, 源止) 列表"""
+        return [
+            (proto, lo, hi, slo, shi)
+            for proto, segments in self.terms
+            for lo, hi, src in segments
+            for slo, shi in src
+        ]
+
+    def dst_intervals(self):
+        """(协议, 目的起, 目的止) 列表，忽略源端口"""
+        return [(proto, lo, hi) for proto, segments in self.terms for lo, hi, _ in segments]
+
+    def src_restricted(self):
+        """是否有源端口（或 ICMP code）限制"""
+        return any(
+            src != (_full_for(proto),)
+            for proto, segments in self.terms
+            for _, _, src in segments
+        )
+
+    def describe(self):
+        """日文报告用的简短文字，如 TCP:80-90(src 1024-65535) UDP:53"""
+        parts = []
+        for proto, segments in self.terms:
+            if proto == PROTO_ANY:
+                parts.append('ALL')
+                continue
+            name = PROTOCOL_NAMES.get(proto, f"proto{proto}")
+            full = _full_for(proto)
+            for lo, hi, src in segments:
+                if (lo, hi) == full and src == (full,):
+                    parts.append(name)
+                    continue
+                text = f"{name}:{lo}" if lo == hi else f"{name}:{lo}-{hi}"
+                if src != (full,):
+                    label = 'code' if proto in (1, 58) else 'src'
+                    text += f"({label} " + ','.join(f"{a}-{b}" if a != b else f"{a}" for a, b in src) + ")"
+                parts.append(text)
+        return ' '.join(parts)
+
+
+def flatten_service(objects, name):
+    """服务或服务组名 -> ServiceSet（组按闭包展开后合并）。objects: VdomObjects"""
+    obj = objects.find(name, ('service', 'servicegrp'))
+    if obj is None:
+        return ServiceSet([])
+    if obj.kind == 'service':
+        return ServiceSet.from_service(obj)
+    closure = group_closure(objects.kind('servicegrp'), objects.lookup('servicegrp'))
+    terms = []
+    for leaf in closure.members(obj.name):
+        svc = objects.find(leaf, ('service',))
+        if svc is not None:
+            terms.extend(service_terms(svc))
+    return ServiceSet(terms)
+
+
+def duplicate_services(objects):
+    """端口集合完全相同的自定义服务: [[服务名, ...], ...]（按规范形排序后一次分组）"""
+    keyed = []
+    for svc in objects.kind('service').values():
+        sset = ServiceSet.from_service(svc)
+        if sset:
+            keyed.append((sset.terms, svc.name))
+    keyed.sort()
+    dups = []
+    for _, group in groupby(keyed, key=lambda x: x[0]):
+        names = [name for _, name in group]
+        if len(names) > 1:
+            dups.append(names)
+    return dups
+
+
+def overlapping_services(objects):
+    """
+    目的端口部分重叠（互不包含）的自定义服务对: [(服务A, 服务B, 协议, 重叠起, 重叠止), ...]
+    每个协议按起点排序扫描一遍，活动区间按终点有序保存，只取终点落在当前区间内的，
+    复杂度 O(n log n + 结果数)。被完全包含的（如 HTTP 与 ALL_TCP）不算。
+    """
+    by_proto = {}
+    for svc in objects.kind('service').values():
+        for proto, lo, hi in ServiceSet.from_service(svc).dst_intervals():
+            if proto != PROTO_ANY:
+                by_proto.setdefault(proto, []).append((lo, hi, svc.name))
+    found = {}
+    for proto, items in by_proto.items():
+        items.sort()
+        active = []     # [(终点, 起点, 名字)]，按终点排序
+        for lo, hi, name in items:
+            cut = bisect_left(active, (lo,))
+            if cut:
+                del active[:cut]
+            # 终点在 [lo, hi) 内且起点 < lo 的活动区间与当前区间部分重叠
+            end = bisect_right(active, (hi - 1, float('inf')))
+            for a_hi, a_lo, a_name in active[:end]:
+                if a_lo < lo and a_name != name:
+                    key = (a_name, name, proto)
+                    if key not in found:
+                        found[key] = (lo, a_hi)
+            insort(active, (hi, lo, name))
+    return [(a, b, proto, lo, hi) for (a, b, proto), (lo, hi) in found.items()]
+
+
+def service_issues(objects, vdom=None):
+    """重复/部分重叠服务的日文说明行"""
+    prefix = f"[{vdom}] " if vdom else ""
+    lines = []
+    for names in duplicate_services(objects):
+        desc = ServiceSet.from_service(objects.kind('service')[names[0]]).describe()
+        lines.append(f"{prefix}サービス重複: {', '.join(names)} は同じポート定義です（{desc}）")
+    for a, b, proto, lo, hi in sorted(overlapping_services(objects)):
+        name = PROTOCOL_NAMES.get(proto, f"proto{proto}")
+        span = f"{lo}" if lo == hi else f"{lo}-{hi}"
+        lines.append(f"{prefix}サービス重なり: {a} と {b} が {name}:{span} で部分的に重なっています")
+    return lines
@@ -0,0 +1,290 @@
+from bisect import bisect_left, bisect_right
+
+from fortigate_match import SegmentMasks
+
+
+# 多条规则联合遮蔽的检查按基本段逐段划分，单条规则最多访问这么多段，超过则放弃（不报告）
+UNION_BUDGET = 20000
+
+
+class _OrFenwick:
+    """只做 OR 插入的树状数组，前缀 OR 查询 O(log n)"""
+    __slots__ = ('tree',)
+
+    def __init__(self, n):
+        self.tree = [0] * (n + 1)
+
+    def add(self, i, bit):
+        i += 1
+        tree = self.tree
+        n = len(tree)
+        while i < n:
+            tree[i] |= bit
+            i += i & -i
+
+    def prefix(self, i):
+        # [0, i] 的 OR
+        i += 1
+        acc = 0
+        tree = self.tree
+        while i > 0:
+            acc |= tree[i]
+            i -= i & -i
+        return acc
+
+
+def dominance_or(intervals, queries):
+    """
+    扫描线 + 树状数组: 对每个查询 (a, b) 求所有 起点 <= a 且 终点 >= b 的区间的位 OR。
+      包含 [lo, hi] 的区间: 查询 (lo, hi)
+      与 [lo, hi] 相交的区间: 查询 (hi, lo)
+    intervals: [(起, 止, 位), ...]；总复杂度 O((n + q) log n) 次大整数运算。
+    """
+    ends = sorted({hi for _, hi, _ in intervals})
+    rank = {e: len(ends) - 1 - i for i, e in enumerate(ends)}     # 终点越大排名越靠前
+    by_start = sorted(intervals, key=lambda x: x[0])
+    fenwick = _OrFenwick(len(ends))
+    order = sorted(range(len(queries)), key=lambda q: queries[q][0])
+    result = [0] * len(queries)
+    p = 0
+    for q in order:
+        a, b = queries[q]
+        while p < len(by_start) and by_start[p][0] <= a:
+            fenwick.add(rank[by_start[p][1]], by_start[p][2])
+            p += 1
+        k = len(ends) - bisect_left(ends, b)     # 终点 >= b 的个数
+        if k:
+            result[q] = fenwick.prefix(k - 1)
+    return result
+
+
+def _interval_masks(regions, dim, full):
+    """一个区间维度上每条规则的 (包含它的规则掩码, 与它相交的规则掩码)"""
+    intervals = []
+    queries = []
+    owners = []
+    for pos, region in enumerate(regions):
+        for lo, hi in region[dim]:
+            intervals.append((lo, hi, 1 << pos))
+            queries.append((lo, hi))
+            queries.append((hi, lo))
+            owners.append(pos)
+    answers = dominance_or(intervals, queries)
+    cover = [full] * len(regions)
+    overlap = [0] * len(regions)
+    for i, pos in enumerate(owners):
+        cover[pos] &= answers[2 * i]
+        overlap[pos] |= answers[2 * i + 1]
+    return cover, overlap
+
+
+def _intf_tables(regions, dim):
+    any_mask = 0
+    table = {}
+    for pos, region in enumerate(regions):
+        names = region[dim]
+        if names is None:
+            any_mask |= 1 << pos
+        else:
+            for n in names:
+                table[n] = table.get(n, 0) | (1 << pos)
+    return any_mask, table
+
+
+def _intf_masks(regions, dim, full):
+    any_mask, table = _intf_tables(regions, dim)
+    cover = []
+    overlap = []
+    for region in regions:
+        names = region[dim]
+        if names is None:
+            cover.append(any_mask)
+            overlap.append(full)
+        else:
+            c = full
+            o = any_mask
+            for n in names:
+                c &= any_mask | table[n]
+                o |= table[n]
+            cover.append(c)
+            overlap.append(o)
+    return cover, overlap
+
+
+class _UnionCheck:
+    """
+    联合遮蔽检查: 沿各维度按全局基本段划分规则 j 的区域，每一块都必须被至少一条先行规则覆盖。
+    同一维度上候选掩码相同的块是同一个子问题，按 (维度, 掩码) 记忆化。
+    """
+    __slots__ = ('regions', 'segments', 'intf', 'budget', 'memo')
+
+    def __init__(self, regions):
+        self.regions = regions
+        self.segments = {
+            dim: SegmentMasks((lo, hi, 1 << pos) for pos, r in enumerate(regions) for lo, hi in r[dim])
+            for dim in (2, 3, 4)
+        }
+        self.intf = {dim: _intf_tables(regions, dim) for dim in (0, 1)}
+        self.budget = 0
+        self.memo = {}
+
+    def covered(self, j, mask):
+        """True: 规则 j 被 mask 中的规则联合覆盖；False: 未覆盖；None: 超出预算"""
+        self.budget = UNION_BUDGET
+        self.memo = {}
+        try:
+            return self._covered(j, (2, 3, 4, 0, 1), mask)
+        except _Exhausted:
+            return None
+
+    def _pieces(self, j, dim, mask):
+        region = self.regions[j][dim]
+        if dim in (0, 1):
+            any_mask, table = self.intf[dim]
+            if region is None:
+                yield mask & any_mask            # 未出现在任何规则里的接口
+                for m in table.values():
+                    yield mask & (any_mask | m)
+            else:
+                for n in region:
+                    yield mask & (any_mask | table.get(n, 0))
+            return
+        seg = self.segments[dim]
+        bounds, masks = seg.bounds, seg.masks
+        for lo, hi in region:
+            i = bisect_right(bounds, lo) - 1
+            while i < len(bounds) and bounds[i] <= hi:
+                self.budget -= 1
+                if self.budget < 0:
+                    raise _Exhausted
+                yield mask & masks[i]
+                i += 1
+
+    def _covered(self, j, dims, mask):
+        if not mask:
+            return False
+        if not dims:
+            return True
+        dim = dims[0]
+        key = (dim, mask)
+        if key in self.memo:
+            return self.memo[key]
+        result = True
+        seen = set()
+        for piece in self._pieces(j, dim, mask):
+            if piece in seen:
+                continue
+            seen.add(piece)
+            if not self._covered(j, dims[1:], piece):
+                result = False
+                break
+        self.memo[key] = result
+        return result
+
+
+class _Exhausted(Exception):
+    pass
+
+
+def _bits(mask, limit=None):
+    """掩码中的位序号（从低到高）"""
+    result = []
+    while mask and (limit is None or len(result) < limit):
+        low = mask & -mask
+        result.append(low.bit_length() - 1)
+        mask ^= low
+    return result
+
+
+def analyze_rulebase(rb):
+    """
+    一个 vdom 的遮蔽/冗余分析。rb: CompiledRulebase。返回发现列表:
+      ('shadowed', 策略ID, [遮蔽它的先行策略ID])     先行的一条策略完全包含它
+      ('shadowed-union', 策略ID, [相关先行策略ID])   多条先行策略合起来完全覆盖它
+      ('redundant', 策略ID, [后续策略ID])            后续同 action 策略包含它，且中间没有相交的异 action 策略
+    各维度的“包含/相交”掩码用扫描线一次求出，不做两两比较。
+    """
+    regions = rb.regions
+    n = len(regions)
+    if not n:
+        return []
+    full = (1 << n) - 1
+    cover = [full] * n
+    overlap = [full] * n
+    for dim in (0, 1):
+        c, o = _intf_masks(regions, dim, full)
+        for i in range(n):
+            cover[i] &= c[i]
+            overlap[i] &= o[i]
+    for dim in (2, 3, 4):
+        c, o = _interval_masks(regions, dim, full)
+        for i in range(n):
+            cover[i] &= c[i]
+            overlap[i] &= o[i]
+
+    # 区域被放大近似的规则（含 negate 了无法解析引用的 indeterminate 规则）不能拿来证明遮蔽/包含别人
+    exact = full & ~getattr(rb, 'inexact', 0)
+    cover = [c & exact for c in cover]
+    unresolved = getattr(rb, 'unresolved', {})
+
+    actions = {}
+    for pos, pol in enumerate(rb.policies):
+        act = pol.get('action') or 'deny'
+        actions[act] = actions.get(act, 0) | (1 << pos)
+
+    union = None
+    findings = []
+    for j, region in enumerate(regions):
+        if not all(region[d] for d in (2, 3, 4)) or frozenset() in (region[0], region[1]):
+            continue    # 区域为空（对象未定义/无法解析），由引用检查报告
+        pid = rb.policies[j].id
+        if pid in unresolved:
+            continue    # 部分引用无法解析，区域不完整
+        own = 1 << j
+        before = own - 1
+        earlier = cover[j] & before
+        if earlier:
+            findings.append(('shadowed', pid, [rb.policies[k].id for k in _bits(earlier, 1)]))
+            continue
+        candidates = overlap[j] & before & exact
+        if candidates:
+            if union is None:
+                union = _UnionCheck(regions)
+            if union.covered(j, candidates):
+                findings.append(('shadowed-union', pid, [rb.policies[k].id for k in _bits(candidates)]))
+                continue
+        act = rb.policies[j].get('action') or 'deny'
+        later = cover[j] & ~(own | before) & actions[act]
+        if later:
+            k = _bits(later, 1)[0]
+            between = ((1 << k) - 1) & ~(own | before)
+            if not (overlap[j] & between & ~actions[act]):
+                findings.append(('redundant', pid, [rb.policies[k].id]))
+    return findings
+
+
+def policy_anomalies(matcher):
+    """整份配置: {vdom: 发现列表}（只含有发现的 vdom）。matcher: PolicyMatcher"""
+    result = {}
+    for vdom, rb in matcher.rulebases.items():
+        findings = analyze_rulebase(rb)
+        if findings:
+            result[vdom] = findings
+    return result
+
+
+def anomaly_messages(anomalies):
+    """发现列表 -> 日文说明行（多 vdom 时带 vdom 前缀）"""
+    lines = []
+    multi = len(anomalies) > 1 or any(v is not None for v in anomalies)
+    for vdom, findings in anomalies.items():
+        prefix = f"[{vdom or 'global'}] " if multi else ""
+        for kind, pid, others in findings:
+            ids = ", ".join(others[:5]) + (" …" if len(others) > 5 else "")
+            if kind == 'shadowed':
+                lines.append(f"{prefix}ポリシーID {pid}: 先行するポリシーID {ids} に完全に包含されているため到達しません（シャドウ）")
+            elif kind == 'shadowed-union':
+                lines.append(f"{prefix}ポリシーID {pid}: 先行するポリシーID {ids} の組み合わせで完全に覆われているため到達しません（シャドウ）")
+            else:
+                lines.append(f"{prefix}ポリシーID {pid}: 後続のポリシーID {ids}（同じ action）に包含されており冗長です")
+    return lines
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from fortigate_cache import add_cache_arguments, cache_from_args, load_parsed
+from fortigate_cli import expand_inputs
+from fortigate_groups import group_closure
+from fortigate_model import KIND_ORDER, POLICY_FIELDS, POLICY_REF_FIELDS
+from fortigate_refs import GROUP_MEMBER_KINDS, REFERENCE_FIELDS
+
+
+# 策略表里单独成列的字段（引用字段另有 policy_refs 表，完整内容在 data 列的 JSON 里）
+POLICY_COLUMNS = tuple(f for f in POLICY_FIELDS if f not in POLICY_REF_FIELDS or f == 'schedule')
+
+SCHEMA = f"""
+CREATE TABLE configs (
+    config_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    loaded_at TEXT NOT NULL
+);
+CREATE TABLE objects (
+    config_id INTEGER NOT NULL,
+    vdom TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT
+);
+CREATE TABLE members (
+    config_id INTEGER NOT NULL,
+    vdom TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    member TEXT NOT NULL,
+    member_kind TEXT
+);
+CREATE TABLE flat_members (
+    config_id INTEGER NOT NULL,
+    vdom TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    leaf TEXT NOT NULL
+);
+CREATE TABLE policies (
+    config_id INTEGER NOT NULL,
+    vdom TEXT NOT NULL,
+    policy_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    {", ".join(f'"{c}" TEXT' for c in POLICY_COLUMNS)},
+    data TEXT
+);
+CREATE TABLE policy_refs (
+    config_id INTEGER NOT NULL,
+    vdom TEXT NOT NULL,
+    policy_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    scope TEXT,
+    kind TEXT
+);
+CREATE VIEW policy_leaves AS
+    SELECT r.config_id, r.vdom, r.policy_id, r.field, r.name AS ref, COALESCE(f.leaf, r.name) AS leaf
+    FROM policy_refs r
+    LEFT JOIN flat_members f
+      ON f.config_id = r.config_id AND f.vdom = r.scope AND f.kind = r.kind AND f.grp = r.name;
+"""
+
+# 数据全部写入后再建索引（比边插入边维护索引快）
+INDEXES = """
+CREATE INDEX objects_name ON objects (config_id, vdom, name COLLATE NOCASE);
+CREATE INDEX objects_kind ON objects (kind);
+CREATE INDEX members_grp ON members (config_id, vdom, kind, grp);
+CREATE INDEX members_member ON members (config_id, vdom, member);
+CREATE INDEX flat_members_grp ON flat_members (config_id, vdom, kind, grp);
+CREATE INDEX flat_members_leaf ON flat_members (config_id, vdom, leaf);
+CREATE INDEX policies_id ON policies (config_id, vdom, policy_id);
+CREATE INDEX policies_action ON policies (action, logtraffic);
+CREATE INDEX policy_refs_policy ON policy_refs (config_id, vdom, policy_id);
+CREATE INDEX policy_refs_name ON policy_refs (config_id, scope, kind, name);
+"""
+
+
+def _scope_name(vdom):
+    return vdom if vdom is not None else 'global'
+
+
+def _json(data):
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _object_data(obj):
+    data = obj.to_dict()
+    return {'members': data} if isinstance(data, list) else data
+
+
+def _find(model, vdom, name, kinds):
+    """引用名 -> (定义所在范围, 对象)；先查本 vdom 再查 global，未定义为 (None, None)"""
+    for scope in (vdom, None) if vdom is not None else (None,):
+        objs = model.vdom_objects.get(scope)
+        obj = objs.find(name, kinds) if objs is not None else None
+        if obj is not None:
+            return scope, obj
+    return None, None
+
+
+def _resolve(model, vdom, name, kinds):
+    """引用名 -> (定义所在范围名, 类别)，未定义为 (None, None)"""
+    scope, obj = _find(model, vdom, name, kinds)
+    return (_scope_name(scope), obj.kind) if obj is not None else (None, None)
+
+
+def object_rows(config_id, model):
+    for vdom, objs in model.vdom_objects.items():
+        scope = _scope_name(vdom)
+        for kind in KIND_ORDER:
+            for name, obj in objs.kind(kind).items():
+                yield config_id, scope, kind, name, _json(_object_data(obj))
+
+
+def member_rows(config_id, model):
+    for vdom, objs in model.vdom_objects.items():
+        scope = _scope_name(vdom)
+        for kind, member_kinds in GROUP_MEMBER_KINDS.items():
+            for name, group in objs.kind(kind).items():
+                for i, member in enumerate(group.members):
+                    _, obj = _find(model, vdom, member, member_kinds)
+                    yield config_id, scope, kind, name, i, member, obj.kind if obj is not None else None
+
+
+def flat_member_rows(config_id, model):
+    for vdom, objs in model.vdom_objects.items():
+        scope = _scope_name(vdom)
+        for kind in GROUP_MEMBER_KINDS:
+            groups = objs.kind(kind)
+            if not groups or kind == 'zone':
+                continue
+            closure = group_closure(groups, objs.lookup(kind))
+            for name in groups:
+                for leaf in sorted(closure.members(name)):
+                    yield config_id, scope, kind, name, leaf
+
+
+def policy_rows(config_id, model):
+    for position, pol in enumerate(model.policies):
+        data = pol.to_dict()
+        data.pop('vdom', None)
+        cells = [_json(v) if isinstance(v, list) else v for v in (data.get(c) for c in POLICY_COLUMNS)]
+        yield (config_id, _scope_name(pol.vdom), pol.id, position, *cells, _json(data))
+
+
+def policy_ref_rows(config_id, model):
+    for pol in model.policies:
+        scope = _scope_name(pol.vdom)
+        for field in POLICY_REF_FIELDS:
+            kinds = REFERENCE_FIELDS[field]
+            for i, name in enumerate(pol.refs(field)):
+                yield (config_id, scope, pol.id, field, i, name, *_resolve(model, pol.vdom, name, kinds))
+
+
+def _insert(conn, table, rows):
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    marks = ", ".join("?" * len(first))
+    conn.executemany(f"INSERT INTO {table} VALUES ({marks})", _chain(first, rows))
+
+
+def _chain(first, rows):
+    yield first
+    yield from rows
+
+
+def export_sqlite(inputs, db_path, cache=None, append=False, progress=None):
+    """
+    多份配置写进一个 SQLite 数据库，返回 {表名: 行数}。
+    全部插入在一个事务里用 executemany 完成，索引在插入之后建立。
+    新建（append 为 False 或数据库还不存在）时先写到 db_path + '.tmp'，成功后才替换 db_path；
+    追加时直接写入已有的数据库，保留回滚日志，失败时整体回滚。
+    """
+    building = not (append and os.path.exists(db_path))
+    target = db_path + '.tmp' if building else db_path
+    if building and os.path.exists(target):
+        os.remove(target)
+    conn = sqlite3.connect(target, isolation_level=None)
+    try:
+        fresh = not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'configs'").fetchone()
+        if building:
+            # 临时文件失败时整个丢弃，不需要回滚日志与同步落盘
+            conn.execute("PRAGMA journal_mode = OFF")
+        if fresh:
+            conn.executescript(SCHEMA)
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("BEGIN")
+        try:
+            next_id = conn.execute("SELECT COALESCE(MAX(config_id), 0) + 1 FROM configs").fetchone()[0]
+            for config_id, path in enumerate(inputs, next_id):
+                model, _ = load_parsed(path, cache)
+                conn.execute("INSERT INTO configs VALUES (?, ?, ?)",
+                             (config_id, path, time.strftime('%Y-%m-%d %H:%M:%S')))
+                _insert(conn, 'objects', object_rows(config_id, model))
+                _insert(conn, 'members', member_rows(config_id, model))
+                _insert(conn, 'flat_members', flat_member_rows(config_id, model))
+                _insert(conn, 'policies', policy_rows(config_id, model))
+                _insert(conn, 'policy_refs', policy_ref_rows(config_id, model))
+                if progress:
+                    progress(path, len(model.policies))
+            if fresh:
+                for statement in INDEXES.strip().splitlines():
+                    conn.execute(statement)
+            conn.execute("COMMIT")
+        except BaseException:
+            if not building and conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        tables = ('configs', 'objects', 'members', 'flat_members', 'policies', 'policy_refs')
+        counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in tables}
+    except BaseException:
+        conn.close()
+        if building and os.path.exists(target):
+            os.remove(target)
+        raise
+    conn.close()
+    if building:
+        os.replace(target, db_path)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="解析結果（オブジェクト・グループ・ポリシー・参照）を SQLite データベースに書き出します。"
+    )
+    parser.add_argument('paths', nargs='+', help="設定ファイル・ワイルドカード・ディレクトリ（複数可）")
+    parser.add_argument('-o', '--output', default='fortigate.sqlite', help="出力データベース（既定: fortigate.sqlite）")
+    parser.add_argument('--append', action='store_true', help="既存のデータベースに追加する")
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+
+    inputs = expand_inputs(args.paths)
+    missing = [path for path in inputs if not os.path.isfile(path)]
+    if missing:
+        for path in missing:
+            print(f"ファイルが見つかりません: {path}", file=sys.stderr)
+        return 1
+    cache = cache_from_args(args)
+
+    def progress(path, count):
+        print(f"{path}: ポリシー {count}件", file=sys.stderr, flush=True)
+
+    started = time.perf_counter()
+    counts = export_sqlite(inputs, args.output, cache, args.append, progress)
+    print("生成完了:", args.output)
+    print("  ".join(f"{table} {n}件" for table, n in counts.items()))
+    print(f"処理時間 {time.perf_counter() - started:.1f}秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
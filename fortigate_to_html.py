@@ -1,10 +1,31 @@
-import re
-import tkinter as tk
-from tkinter import filedialog
-from collections import defaultdict
+import argparse
+import base64
+import gzip
+import io
+import json
+import os
+import sys
+import zlib
+from fortigate_cache import add_cache_arguments, cache_from_args
+from fortigate_cli import expand_inputs, output_paths
+from fortigate_groups import group_closure, vdom_closures
+from fortigate_incremental import IncrementalParser
+from fortigate_match import PolicyMatcher
+from fortigate_model import (
+    VIP, Address, AddressGroup, Interface, Service, ServiceGroup, Zone,
+    load_objects, load_policies,
+)
+from fortigate_parser import (
+    OBJECT_SECTIONS, GROUP_MEMBER_KEYS,
+    iter_entries, iter_sections, open_config, split_vdoms, vdom_scopes,
+)
+from fortigate_shadow import anomaly_messages, policy_anomalies
+from fortigate_vdoms import map_vdoms, vdom_spans
 
 
 def choose_conf_file():
+    import tkinter as tk
+    from tkinter import filedialog
     root = tk.Tk()
     root.withdraw()
     conf_path = filedialog.askopenfilename(
@@ -21,15 +42,9 @@ def parse_firewall_zone(conf_text):
     采集所有 zone（安全区域）与其成员接口，返回: {zone_name: [interface1, interface2, ...], ...}
     """
     zones = {}
-    for m in re.finditer(r'config system zone(.*?)(?:^end$)', conf_text, re.DOTALL | re.MULTILINE):
-        for g in re.finditer(r'edit "([^"]+)"(.*?)next', m.group(1), re.DOTALL):
-            zone_name = g.group(1)
-            member_match = re.search(r'set interface (.+)', g.group(2))
-            if member_match:
-                members = [x.strip('"') for x in member_match.group(1).split()]
-                zones[zone_name] = members
-            else:
-                zones[zone_name] = []
+    for entry in iter_entries(conf_text, 'system zone'):
+        zone = Zone.from_entry(entry)
+        zones[zone.name] = zone.to_dict()
     return zones
 
 def parse_firewall_interface(conf_text):
@@ -37,70 +52,21 @@ def parse_firewall_interface(conf_text):
     采集所有接口定义，返回 {接口名: 属性dict, ...}
     """
     interfaces = {}
-    # 只抓名字，你也可以顺便抓IP等属性
-    for m in re.finditer(r'config system interface(.*?)(?:^end$)', conf_text, re.DOTALL | re.MULTILINE):
-        for g in re.finditer(r'edit "([^"]+)"(.*?)next', m.group(1), re.DOTALL):
-            name = g.group(1)
-            props = {"name": name}
-            if m_ip := re.search(r'set ip ([\d\.]+) ([\d\.]+)', g.group(2)):
-                props["ip"] = m_ip.group(1)
-                props["mask"] = m_ip.group(2)
-            if m_type := re.search(r'set type (\S+)', g.group(2)):
-                props["type"] = m_type.group(1)
-            interfaces[name] = props
+    for entry in iter_entries(conf_text, 'system interface'):
+        iface = Interface.from_entry(entry)
+        interfaces[iface.name] = iface.to_dict()
     return interfaces
 
 
 
 def extract_vdom_blocks(conf_text):
-    vdom_blocks = defaultdict(str)
-    current_vdom = None
-    vdom_re = re.compile(r'^edit\s+("?)(\S+)\1$')
-    in_vdom = False
-    vdom_name = ""
-    root_lines = []
-    lines = conf_text.splitlines()
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        if line.strip() == 'config vdom':
-            # 进 vdom 区，前面都进root
-            in_vdom = True
-            i += 1
-            break
-        root_lines.append(line)
-        i += 1
-
-    # vdom区
-    while in_vdom and i < len(lines):
-        line = lines[i]
-        if line.strip().startswith('edit '):
-            vdom_name = line.strip().split(" ",1)[1].strip('"')
-            current_vdom = vdom_name
-            vdom_blocks[vdom_name] = ""
-            i += 1
-            while i < len(lines):
-                l2 = lines[i]
-                if l2.strip() == "next":
-                    current_vdom = None
-                    i += 1
-                    break
-                vdom_blocks[vdom_name] += l2 + '\n'
-                i += 1
-        elif line.strip() == 'end':
-            # vdom段结束，跳出去处理剩下的root
-            in_vdom = False
-            i += 1
-            break
-        else:
-            i += 1
-
-    # 处理 vdom段之后的所有内容，也加到root
-    while i < len(lines):
-        root_lines.append(lines[i])
-        i += 1
-
-    vdom_blocks["root"] = "\n".join(root_lines)
+    """
+    按 vdom 切分，返回 {vdom名: [(start, end), ...]}，'config vdom' 之外的部分记为 root。
+    只返回原文中的偏移区间，不复制文本；需要内容时用 vdom_slices 取切片。
+    """
+    vdom_blocks = {}
+    for vdom, spans in split_vdoms(conf_text).items():
+        vdom_blocks[vdom or "root"] = spans
     return vdom_blocks
 
 
@@ -110,101 +76,17 @@ def parse_objects_from_block(conf_block):
     """
     全面采集各类对象，包括IPv4、IPv6、VIP、VIP组、服务、服务组、调度、调度组、IP池。
     """
-    objs = {
-        "address": {}, "addrgrp": {},
-        "address6": {}, "addrgrp6": {},
-        "vip": {}, "vipgrp": {},
-        "service": {}, "servicegrp": {},
-        "schedule": {}, "schedulegroup": {},
-        "ippool": {}
-    }
-
-    # IPv4 地址对象
-    for m in re.finditer(r'config firewall address(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for m2 in re.finditer(r'edit "([^"]+)"', m.group(1)):
-            objs['address'][m2.group(1)] = True
-
-    # IPv4 地址组
-    for m in re.finditer(r'config firewall addrgrp(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for g in re.finditer(r'edit "([^"]+)"(.*?)next', m.group(1), re.DOTALL):
-            group_name = g.group(1)
-            member_match = re.search(r'set member (.+)', g.group(2))
-            members = [x.strip('\"') for x in member_match.group(1).split()] if member_match else []
-            objs['addrgrp'][group_name] = members
-
-    # IPv6 地址对象
-    for m in re.finditer(r'config firewall address6(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for m2 in re.finditer(r'edit "([^"]+)"', m.group(1)):
-            objs['address6'][m2.group(1)] = True
-
-    # IPv6 地址组
-    for m in re.finditer(r'config firewall addrgrp6(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for g in re.finditer(r'edit "([^"]+)"(.*?)next', m.group(1), re.DOTALL):
-            group_name = g.group(1)
-            member_match = re.search(r'set member (.+)', g.group(2))
-            members = [x.strip('\"') for x in member_match.group(1).split()] if member_match else []
-            objs['addrgrp6'][group_name] = members
-
-    # VIP
-    for m in re.finditer(r'config firewall vip(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for m2 in re.finditer(r'edit "([^"]+)"', m.group(1)):
-            objs['vip'][m2.group(1)] = True
-
-    # VIP组
-    for m in re.finditer(r'config firewall vipgrp(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for g in re.finditer(r'edit "([^"]+)"(.*?)next', m.group(1), re.DOTALL):
-            group_name = g.group(1)
-            member_match = re.search(r'set member (.+)', g.group(2))
-            members = [x.strip('\"') for x in member_match.group(1).split()] if member_match else []
-            objs['vipgrp'][group_name] = members
-
-    # 服务对象
-    for m in re.finditer(r'config firewall service custom(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for m2 in re.finditer(r'edit "([^"]+)"', m.group(1)):
-            objs['service'][m2.group(1)] = True
-
-    # 服务组
-    for m in re.finditer(r'config firewall service group(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for g in re.finditer(r'edit "([^"]+)"(.*?)next', m.group(1), re.DOTALL):
-            group_name = g.group(1)
-            member_match = re.search(r'set member (.+)', g.group(2))
-            members = [x.strip('\"') for x in member_match.group(1).split()] if member_match else []
-            objs['servicegrp'][group_name] = members
-
-    # 调度
-    for m in re.finditer(r'config firewall schedule(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for m2 in re.finditer(r'edit "([^"]+)"', m.group(1)):
-            objs['schedule'][m2.group(1)] = True
-
-    # 调度组
-    for m in re.finditer(r'config firewall schedule group(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for g in re.finditer(r'edit "([^"]+)"(.*?)next', m.group(1), re.DOTALL):
-            group_name = g.group(1)
-            member_match = re.search(r'set member (.+)', g.group(2))
-            members = [x.strip('\"') for x in member_match.group(1).split()] if member_match else []
-            objs['schedulegroup'][group_name] = members
-
-    # IP池
-    for m in re.finditer(r'config firewall ippool(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for m2 in re.finditer(r'edit "([^"]+)"', m.group(1)):
-            objs['ippool'][m2.group(1)] = True
-        # Zone
-    objs['zone'] = {}
-    for m in re.finditer(r'config system zone(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for g in re.finditer(r'edit "([^"]+)"(.*?)next', m.group(1), re.DOTALL):
-            zone_name = g.group(1)
-            iface_match = re.search(r'set interface (.+)', g.group(2))
-            interfaces = [x.strip('\"') for x in iface_match.group(1).split()] if iface_match else []
-            objs['zone'][zone_name] = interfaces
-
-    # 接口 interface
-    objs['interface'] = {}
-    for m in re.finditer(r'config system interface(.*?)(?:^end$)', conf_block, re.DOTALL | re.MULTILINE):
-        for g in re.finditer(r'edit "([^"]+)"', m.group(1)):
-            iface_name = g.group(1)
-            objs['interface'][iface_name] = True
-
-
+    objs = {key: {} for key in OBJECT_SECTIONS.values()}
+    for _, sec in iter_sections(conf_block, OBJECT_SECTIONS):
+        key = OBJECT_SECTIONS[sec.name]
+        target = objs[key]
+        if key in GROUP_MEMBER_KEYS:
+            member_key = GROUP_MEMBER_KEYS[key]
+            for entry in sec.entries.values():
+                target[entry.name] = entry.values(member_key)
+        else:
+            for entry in sec.entries.values():
+                target[entry.name] = True
     return objs
 
 
@@ -212,63 +94,24 @@ def collect_all_objects(conf_text):
     """全局和各VDOM的所有对象都采集一遍，返回大字典"""
     all_objs = {}
     # 1. 先处理global段（如果有）
-    global_addrs, global_addrgrps, global_srvs, global_srvgrps = parse_objects_from_block(conf_text)
-    all_objs['global'] = {
-        "address": global_addrs,
-        "addrgrp": global_addrgrps,
-        "service": global_srvs,
-        "servicegrp": global_srvgrps
-    }
-    # 2. 各vdom
-    vdom_blocks = extract_vdom_blocks(conf_text)
-    for vdom, vblock in vdom_blocks.items():
-        addrs, addrgrps, srvs, srvgrps = parse_objects_from_block(vblock)
-        all_objs[vdom] = {
-            "address": addrs,
-            "addrgrp": addrgrps,
-            "service": srvs,
-            "servicegrp": srvgrps
-        }
+    all_objs['global'] = parse_objects_from_block(conf_text)
+    # 2. 各vdom（global 以外的部分记为 root）
+    for vdom, scope in vdom_scopes(conf_text, OBJECT_SECTIONS).items():
+        all_objs[vdom or 'root'] = parse_objects_from_block(scope)
     return all_objs
 
-def resolve_addr(addr_name, all_objs, vdom='global', resolved=None):
-    """递归查找地址组成员，返回所有底层地址对象"""
-    if resolved is None:
-        resolved = set()
-    if addr_name in resolved:
-        return set()  # 避免循环嵌套
-    resolved.add(addr_name)
-    addrgrp = all_objs[vdom].get('addrgrp', {})
-    address = all_objs[vdom].get('address', {})
-    # 递归：组
-    if addr_name in addrgrp:
-        all_members = set()
-        for m in addrgrp[addr_name]:
-            all_members |= resolve_addr(m, all_objs, vdom, resolved)
-        return all_members
-    # 原子对象
-    elif addr_name in address:
-        return {addr_name}
-    else:
-        return set()  # 未定义，或在别的vdom
-
-def resolve_service(svc_name, all_objs, vdom='global', resolved=None):
-    if resolved is None:
-        resolved = set()
-    if svc_name in resolved:
+def resolve_addr(addr_name, all_objs, vdom='global'):
+    """展开地址组，返回所有底层地址对象（闭包按 vdom 预先计算，循环嵌套安全）"""
+    closures = vdom_closures(all_objs, vdom)
+    if 'addrgrp' not in closures:
         return set()
-    resolved.add(svc_name)
-    grp = all_objs[vdom].get('servicegrp', {})
-    single = all_objs[vdom].get('service', {})
-    if svc_name in grp:
-        all_members = set()
-        for m in grp[svc_name]:
-            all_members |= resolve_service(m, all_objs, vdom, resolved)
-        return all_members
-    elif svc_name in single:
-        return {svc_name}
-    else:
+    return closures['addrgrp'].members(addr_name)
+
+def resolve_service(svc_name, all_objs, vdom='global'):
+    closures = vdom_closures(all_objs, vdom)
+    if 'servicegrp' not in closures:
         return set()
+    return closures['servicegrp'].members(svc_name)
 
 def find_policy_reference_issues(policy_list, all_objs, vdom):
     issues = []
@@ -302,440 +145,426 @@ def find_policy_reference_issues(policy_list, all_objs, vdom):
     return issues
 
 
-def parse_firewall_vip(conf_text):
+def _parse_dicts(conf_text, path, cls):
+    # 旧接口: 返回 ({名字: dict}, {小写名: 名字})，字段解析统一走 fortigate_model
     results, lookup = {}, {}
-    for m in re.finditer(
-        r'config firewall vip(.*?)(?:^end$)',
-        conf_text, re.DOTALL | re.MULTILINE | re.IGNORECASE
-    ):
-        segment = m.group(1)
-        for m2 in re.finditer(r'edit "([^"]+)"(.*?)next', segment, re.DOTALL | re.IGNORECASE):
-            name, block = m2.group(1), m2.group(2)
-            obj = {
-                'name': name.strip(),
-                'extip': '', 'extintf': '', 'mappedip': '', 'type': '', 'comment': ''
-            }
-            if m3 := re.search(r'set extip ([\d\.]+)', block):
-                obj['extip'] = m3.group(1)
-            if m3 := re.search(r'set extintf "([^"]+)"', block):
-                obj['extintf'] = m3.group(1)
-            if m3 := re.search(r'set mappedip "([^"]+)"', block):
-                obj['mappedip'] = m3.group(1)
-            if m3 := re.search(r'set type (\w+)', block):
-                obj['type'] = m3.group(1)
-            if m3 := re.search(r'set comment "([^"]+)"', block):
-                obj['comment'] = m3.group(1)
-            results[obj['name']] = obj
-            lookup[obj['name'].lower()] = obj['name']
+    for entry in iter_entries(conf_text, path):
+        obj = cls.from_entry(entry)
+        results[obj.name] = obj.to_dict()
+        lookup[obj.name.lower()] = obj.name
     return results, lookup
 
+def parse_firewall_vip(conf_text):
+    return _parse_dicts(conf_text, 'firewall vip', VIP)
 
 def parse_firewall_address(conf_text):
-    results, lookup = {}, {}
-    # 能抓到所有独立块
-    for m in re.finditer(
-        r'config firewall address(.*?)(?:^end$)', 
-        conf_text, re.DOTALL | re.MULTILINE | re.IGNORECASE
-    ):
-        segment = m.group(1)
-        for m2 in re.finditer(r'edit "([^"]+)"(.*?)next', segment, re.DOTALL | re.IGNORECASE):
-            name, block = m2.group(1), m2.group(2)
-            obj = {
-                'name': name.strip(),
-                'type': '', 'ip': '', 'fqdn': '', 'start-ip': '', 'end-ip': '', 'comment': ''
-            }
-            if m3 := re.search(r'set subnet ([\d\.]+) ([\d\.]+)', block):
-                obj['type'] = 'ip'
-                obj['ip'] = f"{m3.group(1)}/{sum(bin(int(x)).count('1') for x in m3.group(2).split('.'))}"
-            if m3 := re.search(r'set fqdn "([^"]+)"', block):
-                obj['type'] = 'fqdn'
-                obj['fqdn'] = m3.group(1)
-            if m3 := re.search(r'set start-ip ([\d\.]+)', block):
-                obj['type'] = 'ip-range'
-                obj['start-ip'] = m3.group(1)
-                if m4 := re.search(r'set end-ip ([\d\.]+)', block):
-                    obj['end-ip'] = m4.group(1)
-            if m3 := re.search(r'set comment "([^"]+)"', block):
-                obj['comment'] = m3.group(1)
-            results[obj['name']] = obj
-            lookup[obj['name'].lower()] = obj['name']
-    return results, lookup
-
+    return _parse_dicts(conf_text, 'firewall address', Address)
 
 def parse_firewall_addrgrp(conf_text):
-    results, lookup = {}, {}
-    section = re.search(r'config firewall addrgrp(.*?)end', conf_text, re.DOTALL)
-    if not section:
-        return results, lookup
-    blocks = re.findall(r'edit "([^"]+)"(.*?)next', section.group(1), re.DOTALL)
-    for name, block in blocks:
-        obj = {'name': name.strip(), 'members': []}
-        for m in re.finditer(r'set member((?: [^\n]+)+)', block):
-            line = m.group(1).replace('\n', ' ')
-            obj['members'] += [n.strip() for n in re.findall(r'"([^"]+)"', line)]
-        results[obj['name']] = obj
-        lookup[obj['name'].lower()] = obj['name']
-    return results, lookup
+    return _parse_dicts(conf_text, 'firewall addrgrp', AddressGroup)
 
 def parse_firewall_service_custom(conf_text):
-    results, lookup = {}, {}
-    section = re.search(r'config firewall service custom(.*?)end', conf_text, re.DOTALL)
-    if not section:
-        return results, lookup
-    blocks = re.findall(r'edit "([^"]+)"(.*?)next', section.group(1), re.DOTALL)
-    for name, block in blocks:
-        obj = {
-            'name': name.strip(),
-            'protocol': '', 'tcp_port': '', 'udp_port': '', 'comment': ''
-        }
-        if m := re.search(r'set protocol (\d+)', block):
-            obj['protocol'] = m.group(1)
-        if m := re.search(r'set tcp-portrange "([^"]+)"', block):
-            obj['tcp_port'] = m.group(1)
-        if m := re.search(r'set udp-portrange "([^"]+)"', block):
-            obj['udp_port'] = m.group(1)
-        if m := re.search(r'set comment "([^"]+)"', block):
-            obj['comment'] = m.group(1)
-        results[obj['name']] = obj
-        lookup[obj['name'].lower()] = obj['name']
-    return results, lookup
+    return _parse_dicts(conf_text, 'firewall service custom', Service)
 
 def parse_firewall_service_group(conf_text):
-    results, lookup = {}, {}
-    section = re.search(r'config firewall service group(.*?)end', conf_text, re.DOTALL)
-    if not section:
-        return results, lookup
-    blocks = re.findall(r'edit "([^"]+)"(.*?)next', section.group(1), re.DOTALL)
-    for name, block in blocks:
-        obj = {'name': name.strip(), 'members': []}
-        if m := re.search(r'set member (.+)', block):
-            obj['members'] = [n.strip() for n in re.findall(r'"([^"]+)"', m.group(1))]
-        results[obj['name']] = obj
-        lookup[obj['name'].lower()] = obj['name']
-    return results, lookup
+    return _parse_dicts(conf_text, 'firewall service group', ServiceGroup)
 
 def parse_firewall_policy(conf_text):
-    results = []
-    section = re.search(r'config firewall policy(.*?)end', conf_text, re.DOTALL)
-    if not section:
-        return results
-    blocks = re.findall(r'edit (\d+)(.*?)next', section.group(1), re.DOTALL)
-    for id, block in blocks:
-        pol = {'id': id}
-        for line in block.strip().splitlines():
-            line = line.strip()
-            if m := re.match(r'set (\w+) (.+)', line):
-                key, value = m.group(1), m.group(2)
-                if value.startswith('"'):
-                    items = re.findall(r'"([^"]+)"', value)
-                    if len(items) > 1:
-                        value = items
-                    elif items:
-                        value = items[0]
-                    else:
-                        value = value.strip('"')
-                pol[key] = value
-        if 'name' not in pol:
-            pol['name'] = ''
-        results.append(pol)
-    return results
-
-# --- 递归展开地址组成员
-def get_all_members(name, groups, group_lookup, _visited=None):
-    if _visited is None:
-        _visited = set()
-    name_key = name.strip().lower()
-    if name_key in _visited:
-        return set()  # 防止死循环
-    _visited.add(name_key)
-    if name_key in group_lookup:
-        real_name = group_lookup[name_key]
-        group = groups.get(real_name)
-        if group:
-            all_members = set()
-            for member in group.get('members', []):
-                all_members |= get_all_members(member, groups, group_lookup, _visited)
-            return all_members
-    return {name.strip()}
-
-# --- 递归展开服务组成员
-def get_all_service_members(name, svc_groups, svc_lookup, _visited=None):
-    if _visited is None:
-        _visited = set()
-    name_key = name.strip().lower()
-    if name_key in _visited:
-        return set()
-    _visited.add(name_key)
-    if name_key in svc_lookup:
-        real_name = svc_lookup[name_key]
-        group = svc_groups.get(real_name)
-        if group:
-            all_members = set()
-            for member in group.get('members', []):
-                all_members |= get_all_service_members(member, svc_groups, svc_lookup, _visited)
-            return all_members
-    return {name.strip()}
-
-# --- 智能查找对象
-def smart_obj_lookup(obj_name, obj_dict, obj_lookup):
-    if not obj_name or not isinstance(obj_name, str):
-        return None
-    key = obj_name.strip().lower()
-    if key in obj_lookup:
-        real_name = obj_lookup[key]
-        return obj_dict.get(real_name)
-    return None
-
-def render_obj_branch(
-    obj_name,
-    addresses, address_lookup,
-    address_groups, addrgrp_lookup,
-    services, service_lookup,
-    service_groups, svcgrp_lookup,
-    addresses6=None, address6_lookup=None,
-    address_groups6=None, addrgrp6_lookup=None,
-    vips=None, vip_lookup=None,
-    vipgrps=None, vipgrp_lookup=None,
-    zones=None, interfaces=None,
-    depth=0, seen=None
-):
-    if seen is None:
-        seen = set()
-    key = (obj_name.strip().lower() if isinstance(obj_name, str) else str(obj_name))
-    if key in seen:
-        return ""
-    seen.add(key)
+    return [pol.to_dict() for pol in load_policies(conf_text)]
+
+# --- 展开地址组成员（查预先计算的闭包）
+def get_all_members(name, groups, group_lookup):
+    return group_closure(groups, group_lookup).members(name)
+
+# --- 展开服务组成员（查预先计算的闭包）
+def get_all_service_members(name, svc_groups, svc_lookup):
+    return group_closure(svc_groups, svc_lookup).members(name)
+
+# 可展开对象（组/zone）的显示: 类别 -> (标签, CSS 类)
+_BRANCH_STYLES = {
+    'addrgrp': ('IPv4グループ', 'grp-addr'),
+    'servicegrp': ('服务组', 'grp-svc'),
+    'addrgrp6': ('IPv6グループ', 'grp-addr6'),
+    'vipgrp': ('VIP组', 'grp-vip'),
+    'zone': ('Zone', 'grp-zone'),
+}
+
+# 对象树里展示的类别（调度、IP 池不在策略的地址/服务/接口列里展开）
+RENDER_KINDS = (
+    'address', 'vip', 'addrgrp', 'service', 'servicegrp',
+    'address6', 'addrgrp6', 'vipgrp', 'zone', 'interface',
+)
+
+# 策略数达到这个值时 main 改用 JSON 对象图按需展开（lazy 模式）
+LAZY_POLICY_THRESHOLD = 2000
+
+# 策略数达到这个值时 main 改用分页显示（windowed 模式），每页行数
+WINDOWED_POLICY_THRESHOLD = 5000
+WINDOW_PAGE_SIZE = 200
+
+# 每行末尾的审核输入（{pid} 为策略 ID；windowed 模式下由 JS 按同一模板生成）
+REVIEW_CELLS = """<td class='review-cell'>
+                <select class="review-action" data-id="{pid}">
+                  <option value="">--選択--</option>
+                  <option value="allow">許可（残す）</option>
+                  <option value="delete">削除</option>
+                  <option value="modify">修正</option>
+                </select>
+            </td>
+            <td class='review-cell'>
+                <input class="review-comment" data-id="{pid}" placeholder="理由や補足" style="width:120px">
+            </td>"""
 
+# 主页面与提交后的打印页面共用的样式
+REPORT_CSS = """
+        table { border-collapse: collapse; font-family: Consolas, monospace; font-size: 14px; min-width:1200px; }
+        th, td { border: 1px solid #ccc; padding: 6px 10px; vertical-align: top; }
+        th { background: #eee; font-weight: bold; }
+        .object-branch { display:none; margin-top:6px; margin-left:6px; border-left:2px solid #999; padding-left:8px; background:#f9f9f9;}
+        .object-level { margin-left:12px; }
+        .cell-flex {
+            display: flex;
+            flex-direction: row;
+            justify-content: space-between;
+            align-items: center;
+            min-width: 120px;
+        }
+        .obj-name { flex: 1; overflow: hidden; text-overflow: ellipsis; white-space: nowrap; }
+        .toggle-btn { flex-shrink: 0; margin-left: 10px; color: blue; cursor: pointer; }
+        .obj-ref { min-width: 120px; cursor: pointer; }
+        .obj-ref::after { content: "[+]"; float: right; margin-left: 10px; color: blue; }
+        .obj-any { color:green; }
+        .obj-undef { color:red; }
+        .obj-vip { color:#06b; background:#e7f3ff; }
+        .tag { color:#999; }
+        .tag-vip { color:#06b; font-weight:bold; }
+        .tag-ipv6 { color:#0a6; }
+        .obj-comment { color:#aaa; }
+        .obj-intf { color:#2a6; }
+        .intf-ip { color:#555; }
+        .intf-type { color:#777; }
+        .obj-group { font-weight:bold; color:#148; }
+        .obj-group .grp-label { color:#888; }
+        .grp-addr6 { color:#176; }
+        .grp-vip { color:#05b; }
+        .grp-zone, .grp-zone .grp-label { color:#c60; }
+        .review-row {background:#f6f6fa;}
+        .review-cell {padding:6px 4px 10px 4px; border-bottom:1px solid #eee;}
+        .row-del {background: #ffdddd !important; color: red !important; text-decoration: line-through;}
+        .row-mod {background: #fff7cc !important;}
+        .warnbox {background:#ffeeee;border:2px solid #f44;padding:14px 16px;font-size:16px;margin:18px 0;}
+        .pager { margin:8px 0; text-align:center; }
+"""
+
+def render_obj_node(obj_name, obj, members_ref=None):
+    """
+    单个对象节点的 HTML（不含组成员）。obj 为 None 表示未定义；
+    组/zone 的成员列表放在编号为 members_ref 的模板里，点开时由 JS 克隆进来。
+    """
     # === 处理 any/all ===
     if isinstance(obj_name, str) and obj_name.strip().lower() in {"any", "all"}:
-        return f"<div class='object-level' style='color:green'><b>any</b></div>"
+        return "<div class='object-level obj-any'><b>any</b></div>"
 
-    # --- IPv4 地址对象/VIP ---
-    obj = smart_obj_lookup(obj_name, addresses, address_lookup)
-    if obj:
-        # VIP 特殊展示
-        if obj.get('extip') and obj.get('mappedip'):
+    if obj is None:
+        # --- 未定义对象 ---
+        return f"<div class='object-level obj-undef'><b>[未定義]</b>{obj_name}</div>"
+    kind = obj.kind
+
+    # --- VIP 特殊展示 ---
+    if kind == 'vip':
+        if obj.extip and obj.mappedip:
             info = (
-                f"{obj['name']} <span style='color:#06b;font-weight:bold'>[VIP]</span> "
-                f"外部:{obj['extip']} → 内部:{obj['mappedip']} "
+                f"{obj.name} <span class='tag-vip'>[VIP]</span> "
+                f"外部:{obj.extip} → 内部:{obj.mappedip} "
             )
-            if obj.get('comment'):
-                info += f"<span style='color:#aaa'>#{obj['comment']}</span>"
-            return f"<div class='object-level' style='color:#06b;background:#e7f3ff;'>{info}</div>"
-        # 普通地址对象
-        info = f"{obj['name']} <span style='color:#999'>[{obj.get('type','')}]</span> "
-        if obj.get('ip'): info += obj['ip'] + " "
-        if obj.get('fqdn'): info += obj['fqdn'] + " "
-        if obj.get('start-ip'): info += f"{obj['start-ip']}-{obj.get('end-ip','')}" + " "
-        if obj.get('comment'): info += f"<span style='color:#aaa'>#{obj['comment']}</span>"
+            if obj.comment:
+                info += f"<span class='obj-comment'>#{obj.comment}</span>"
+            return f"<div class='object-level obj-vip'>{info}</div>"
+        info = f"{obj.name} <span class='tag'>[{obj.type}]</span> "
+        if obj.comment: info += f"<span class='obj-comment'>#{obj.comment}</span>"
         return f"<div class='object-level'>{info}</div>"
 
-    # --- IPv4 地址组 ---
-    grp = smart_obj_lookup(obj_name, address_groups, addrgrp_lookup)
-    if grp:
-        html = f"<div class='object-level cell-flex' style='font-weight:bold;color:#148;'>"
-        html += f"<span class='obj-name'>{grp['name']} <span style='color:#888'>(IPv4グループ)</span></span>"
-        cell_id = f"obj-addrgrp-{grp['name']}"
-        html += f"<span class='toggle-btn' onclick=\"toggleBranch('{cell_id}')\">[+]</span></div>"
-        html += f"<div class='object-branch' id='{cell_id}'>"
-        for member in grp['members']:
-            html += render_obj_branch(
-                member,
-                addresses, address_lookup,
-                address_groups, addrgrp_lookup,
-                services, service_lookup,
-                service_groups, svcgrp_lookup,
-                addresses6, address6_lookup,
-                address_groups6, addrgrp6_lookup,
-                vips, vip_lookup,
-                vipgrps, vipgrp_lookup,
-                zones, interfaces,
-                depth+1, seen
-            )
-        html += "</div>"
-        return html
+    # --- IPv4 地址对象 ---
+    if kind == 'address':
+        info = f"{obj.name} <span class='tag'>[{obj.type}]</span> "
+        if obj.ip: info += obj.ip + " "
+        if obj.fqdn: info += obj.fqdn + " "
+        if obj.start_ip: info += f"{obj.start_ip}-{obj.end_ip}" + " "
+        if obj.comment: info += f"<span class='obj-comment'>#{obj.comment}</span>"
+        return f"<div class='object-level'>{info}</div>"
 
     # --- 服务对象 ---
-    svc = smart_obj_lookup(obj_name, services, service_lookup)
-    if svc:
-        info = f"{svc['name']} <span style='color:#999'>[服务]</span> "
-        if svc.get('protocol'): info += f"proto:{svc['protocol']} "
-        if svc.get('tcp_port'): info += f"TCP:{svc['tcp_port']} "
-        if svc.get('udp_port'): info += f"UDP:{svc['udp_port']} "
-        if svc.get('comment'): info += f"<span style='color:#aaa'>#{svc['comment']}</span>"
+    if kind == 'service':
+        info = f"{obj.name} <span class='tag'>[服务]</span> "
+        if obj.protocol: info += f"proto:{obj.protocol} "
+        if obj.tcp_port: info += f"TCP:{obj.tcp_port} "
+        if obj.udp_port: info += f"UDP:{obj.udp_port} "
+        if obj.comment: info += f"<span class='obj-comment'>#{obj.comment}</span>"
         return f"<div class='object-level'>{info}</div>"
 
-    # --- 服务组 ---
-    svcgrp = smart_obj_lookup(obj_name, service_groups, svcgrp_lookup)
-    if svcgrp:
-        html = f"<div class='object-level cell-flex' style='font-weight:bold;color:#148;'>"
-        html += f"<span class='obj-name'>{svcgrp['name']} <span style='color:#888'>(服务组)</span></span>"
-        cell_id = f"obj-svcgrp-{svcgrp['name']}"
-        html += f"<span class='toggle-btn' onclick=\"toggleBranch('{cell_id}')\">[+]</span></div>"
-        html += f"<div class='object-branch' id='{cell_id}'>"
-        for member in svcgrp['members']:
-            html += render_obj_branch(
-                member,
-                addresses, address_lookup,
-                address_groups, addrgrp_lookup,
-                services, service_lookup,
-                service_groups, svcgrp_lookup,
-                addresses6, address6_lookup,
-                address_groups6, addrgrp6_lookup,
-                vips, vip_lookup,
-                vipgrps, vipgrp_lookup,
-                zones, interfaces,
-                depth+1, seen
-            )
-        html += "</div>"
-        return html
-
     # --- IPv6 地址对象 ---
-    if addresses6 and address6_lookup:
-        obj6 = smart_obj_lookup(obj_name, addresses6, address6_lookup)
-        if obj6:
-            info = f"{obj6['name']} <span style='color:#0a6'>[IPv6]</span> "
-            if obj6.get('ip'): info += obj6['ip'] + " "
-            if obj6.get('comment'): info += f"<span style='color:#aaa'>#{obj6['comment']}</span>"
-            return f"<div class='object-level'>{info}</div>"
-
-    # --- IPv6 地址组 ---
-    if address_groups6 and addrgrp6_lookup:
-        grp6 = smart_obj_lookup(obj_name, address_groups6, addrgrp6_lookup)
-        if grp6:
-            html = f"<div class='object-level cell-flex' style='font-weight:bold;color:#176;'>"
-            html += f"<span class='obj-name'>{grp6['name']} <span style='color:#888'>(IPv6グループ)</span></span>"
-            cell_id = f"obj-addrgrp6-{grp6['name']}"
-            html += f"<span class='toggle-btn' onclick=\"toggleBranch('{cell_id}')\">[+]</span></div>"
-            html += f"<div class='object-branch' id='{cell_id}'>"
-            for member in grp6['members']:
-                html += render_obj_branch(
-                    member,
-                    addresses, address_lookup,
-                    address_groups, addrgrp_lookup,
-                    services, service_lookup,
-                    service_groups, svcgrp_lookup,
-                    addresses6, address6_lookup,
-                    address_groups6, addrgrp6_lookup,
-                    vips, vip_lookup,
-                    vipgrps, vipgrp_lookup,
-                    zones, interfaces,
-                    depth+1, seen
-                )
-            html += "</div>"
-            return html
-
-    # --- VIP组 ---
-    if vipgrps and vipgrp_lookup:
-        vipgrp = smart_obj_lookup(obj_name, vipgrps, vipgrp_lookup)
-        if vipgrp:
-            html = f"<div class='object-level cell-flex' style='font-weight:bold;color:#05b;'>"
-            html += f"<span class='obj-name'>{vipgrp['name']} <span style='color:#888'>(VIP组)</span></span>"
-            cell_id = f"obj-vipgrp-{vipgrp['name']}"
-            html += f"<span class='toggle-btn' onclick=\"toggleBranch('{cell_id}')\">[+]</span></div>"
-            html += f"<div class='object-branch' id='{cell_id}'>"
-            for member in vipgrp['members']:
-                html += render_obj_branch(
-                    member,
-                    addresses, address_lookup,
-                    address_groups, addrgrp_lookup,
-                    services, service_lookup,
-                    service_groups, svcgrp_lookup,
-                    addresses6, address6_lookup,
-                    address_groups6, addrgrp6_lookup,
-                    vips, vip_lookup,
-                    vipgrps, vipgrp_lookup,
-                    zones, interfaces,
-                    depth+1, seen
-                )
-            html += "</div>"
-            return html
-
-    # --- zone（安全区域）对象 ---
-    if zones and obj_name in zones:
-        html = f"<div class='object-level cell-flex' style='font-weight:bold;color:#c60;'>"
-        html += f"<span class='obj-name'>{obj_name} <span style='color:#c60'>(Zone)</span></span>"
-        cell_id = f"obj-zone-{obj_name}"
-        html += f"<span class='toggle-btn' onclick=\"toggleBranch('{cell_id}')\">[+]</span></div>"
-        html += f"<div class='object-branch' id='{cell_id}'>"
-        for member in zones[obj_name]:
-            html += render_obj_branch(
-                member,
-                addresses, address_lookup,
-                address_groups, addrgrp_lookup,
-                services, service_lookup,
-                service_groups, svcgrp_lookup,
-                addresses6, address6_lookup,
-                address_groups6, addrgrp6_lookup,
-                vips, vip_lookup,
-                vipgrps, vipgrp_lookup,
-                zones, interfaces,
-                depth+1, seen
-            )
-        html += "</div>"
-        return html
+    if kind == 'address6':
+        info = f"{obj.name} <span class='tag-ipv6'>[IPv6]</span> "
+        if obj.ip: info += obj.ip + " "
+        if obj.comment: info += f"<span class='obj-comment'>#{obj.comment}</span>"
+        return f"<div class='object-level'>{info}</div>"
 
     # --- 接口对象 ---
-    if interfaces and obj_name in interfaces:
-        iface = interfaces[obj_name]
-        info = f"<b>{iface['name']}</b>"
-        if 'ip' in iface: info += f" <span style='color:#555'>IP:{iface['ip']}</span>"
-        if 'type' in iface: info += f" <span style='color:#777'>type:{iface['type']}</span>"
-        return f"<div class='object-level' style='margin-left:12px;color:#2a6;'>{info}</div>"
-
-    # --- 未定义对象 ---
-    return f"<div class='object-level' style='color:red;'><b>[未定義]</b>{obj_name}</div>"
-
-
-def collect_undefined_objs(policies,
-    addresses, address_lookup,
-    address_groups, addrgrp_lookup,
-    services, service_lookup,
-    service_groups, svcgrp_lookup):
-    # 叶子对象名
-    all_address_names = set([k.strip().lower() for k in addresses.keys()])
-    all_service_names = set([k.strip().lower() for k in services.keys()])
+    if kind == 'interface':
+        info = f"<b>{obj.name}</b>"
+        if obj.ip: info += f" <span class='intf-ip'>IP:{obj.ip}</span>"
+        if obj.type: info += f" <span class='intf-type'>type:{obj.type}</span>"
+        return f"<div class='object-level obj-intf'>{info}</div>"
+
+    # --- 地址组/服务组/IPv6组/VIP组/zone：成员引用共享模板 ---
+    label, css = _BRANCH_STYLES[kind]
+    return (
+        f"<div class='object-level cell-flex obj-group {css}'>"
+        f"<span class='obj-name'>{obj.name} <span class='grp-label'>({label})</span></span>"
+        f"<span class='toggle-btn'>[+]</span></div>"
+        f"<div class='object-branch' data-ref='{members_ref}'></div>"
+    )
 
-    undefined_addr = set()
-    undefined_svc = set()
 
+class ObjectTree:
+    """
+    对象树的共享定义: 每个对象的节点 HTML 只生成一次，组的成员列表也只记录一次；
+    表格单元格和组节点只带编号（data-ref: n节点号 / m成员表号），点开时由 JS 填入。
+    两种输出方式:
+      templates() 每个编号一个 <template>，展开时克隆
+      graph()     紧凑的 JSON 对象图 {'nodes': [节点HTML], 'members': [[节点号, ...]]}，展开时才拼出 DOM
+    输出大小 ∝ 对象数 + 引用数，与组被多少条策略引用无关。
+    objects: VdomObjects
+    """
+    __slots__ = ('objects', 'keys', 'index', 'nodes', 'cell_refs', 'members', 'pending')
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.keys = {}          # 单元格里的原始写法 -> 节点号
+        self.index = {}         # 对象键 -> 节点号
+        self.nodes = []         # 节点号 -> 节点 HTML
+        self.cell_refs = {}     # 单元格直接引用的节点号（有序去重）
+        self.members = []       # 成员表号 -> [成员节点号, ...]
+        self.pending = []       # 待解析成员的 (成员表号, 组)
+
+    def _node_index(self, name):
+        i = self.keys.get(name)
+        if i is not None:
+            return i
+        if name.strip().lower() in {"any", "all"}:
+            obj, key = None, ('any',)
+        else:
+            obj = self.objects.find(name, RENDER_KINDS)
+            key = (obj.kind, obj.name) if obj is not None else ('undefined', name)
+        i = self.index.get(key)
+        if i is None:
+            members_ref = None
+            if obj is not None and obj.kind in _BRANCH_STYLES:
+                members_ref = f"m{len(self.members)}"
+                self.pending.append((len(self.members), obj))
+                self.members.append(None)
+            i = self.index[key] = len(self.nodes)
+            self.nodes.append(render_obj_node(name, obj, members_ref))
+        self.keys[name] = i
+        return i
+
+    def node(self, name):
+        """对象节点 HTML（缓存）"""
+        return self.nodes[self._node_index(name)]
+
+    def ref(self, name):
+        """单元格引用的节点编号"""
+        i = self._node_index(name)
+        self.cell_refs[i] = None
+        return f"n{i}"
+
+    def _resolve(self):
+        # 组成员里的嵌套组在处理过程中继续加入队列
+        while self.pending:
+            j, obj = self.pending.pop()
+            self.members[j] = [self._node_index(m) for m in obj.members]
+
+    def templates(self):
+        """生成全部 <template>"""
+        self._resolve()
+        for i in self.cell_refs:
+            yield f"<template id='n{i}'>{self.nodes[i]}</template>"
+        for j, kids in enumerate(self.members):
+            body = ''.join(self.nodes[k] for k in kids)
+            yield f"<template id='m{j}'>{body}</template>"
+
+    def graph(self):
+        """JSON 对象图（节点 HTML 各一份，成员只存节点号）"""
+        self._resolve()
+        return {'nodes': self.nodes, 'members': self.members}
+
+
+def collect_undefined_objs(policies, objects):
+    """策略引用（组展开后）中未定义的地址/服务名。objects: VdomObjects"""
+    # 叶子对象名（VIP 与地址同列）
+    all_address_names = objects.names('address', 'vip')
+    all_service_names = objects.names('service')
+
+    # 先收集策略里出现过的不同名字，每个名字只展开一次
+    addr_refs, svc_refs = set(), set()
     for pol in policies:
-        for key in ('srcaddr', 'dstaddr'):
+        for key, refs in (('srcaddr', addr_refs), ('dstaddr', addr_refs), ('service', svc_refs)):
             val = pol.get(key)
             if not val:
                 continue
-            vals = val if isinstance(val, list) else [val]
-            for v in vals:
-                # 递归展开地址组成员
-                for member in get_all_members(v, address_groups, addrgrp_lookup):
-                    k = member.strip().lower()
-                    if k not in all_address_names and k not in {"any", "all"}:
-                        undefined_addr.add(member)
-        for key in ('service',):
-            val = pol.get(key)
-            if not val:
-                continue
-            vals = val if isinstance(val, list) else [val]
-            for v in vals:
-                for member in get_all_service_members(v, service_groups, svcgrp_lookup):
-                    k = member.strip().lower()
-                    if k not in all_service_names and k not in {"any", "all"}:
-                        undefined_svc.add(member)
+            refs.update(val if isinstance(val, list) else [val])
+
+    undefined_addr = set()
+    undefined_svc = set()
+    # 组成员展开走预先计算好的闭包
+    addr_closure = group_closure(objects.kind('addrgrp'), objects.lookup('addrgrp'))
+    for v in addr_refs:
+        for member in addr_closure.members(v):
+            k = member.strip().lower()
+            if k not in all_address_names and k not in {"any", "all"}:
+                undefined_addr.add(member)
+    svc_closure = group_closure(objects.kind('servicegrp'), objects.lookup('servicegrp'))
+    for v in svc_refs:
+        for member in svc_closure.members(v):
+            k = member.strip().lower()
+            if k not in all_service_names and k not in {"any", "all"}:
+                undefined_svc.add(member)
     return undefined_addr, undefined_svc
 
+def _json_text(data):
+    # 嵌进 <script type="application/json"> 的紧凑 JSON，"</" 转义以免提前结束脚本元素
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+
+class JsonPayload:
+    """
+    嵌入页面的 JSON 数据（<script type="application/json">），可分段写入。
+    compress=True 时内容流式 gzip 后按 base64 写出，由浏览器的 DecompressionStream 解压。
+    """
+    __slots__ = ('html', 'zobj', 'pending')
+
+    def __init__(self, html, element_id, compress=False):
+        self.html = html
+        self.zobj = zlib.compressobj(9, zlib.DEFLATED, 31) if compress else None   # wbits=31: gzip 格式
+        self.pending = b""
+        encoding = " data-encoding='gzip-base64'" if compress else ""
+        html.append(f"<script id='{element_id}' type='application/json'{encoding}>")
+
+    def write(self, text):
+        if self.zobj is None:
+            self.html.append(text)
+        else:
+            self._emit(self.zobj.compress(text.encode('utf-8')))
+
+    def _emit(self, data, final=False):
+        # base64 按 3 字节对齐分段，余下的留到下一段（atob 会忽略段间换行）
+        data = self.pending + data
+        cut = len(data) if final else len(data) - len(data) % 3
+        if cut:
+            self.html.append(base64.b64encode(data[:cut]).decode('ascii'))
+        self.pending = data[cut:]
+
+    def close(self):
+        if self.zobj is not None:
+            self._emit(self.zobj.flush(), final=True)
+        self.html.append("</script>")
+
+
+def _discard_stdout():
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+class ReportWriter:
+    """
+    流式输出报告: append/extend 的片段立即写出（片段之间换行，与原先 '\n'.join 的结果相同），
+    内存占用与策略数无关。out_file 为 '-' 时写到 stdout。
+    compress=True 时边写边 gzip 压缩（stdout 也一样）；为 None 时按 out_file 是否以 .gz 结尾决定。
+    """
+    __slots__ = ('stream', 'owned')
+
+    def __init__(self, out_file, compress=None):
+        if compress is None:
+            compress = out_file.endswith('.gz')
+        if out_file == '-':
+            raw = sys.stdout.buffer
+            if compress:
+                raw = gzip.GzipFile(filename='', fileobj=raw, mode='wb', compresslevel=9)
+            self.stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            self.owned = False
+        elif compress:
+            self.stream = gzip.open(out_file, "wt", encoding="utf-8", compresslevel=9)
+            self.owned = True
+        else:
+            self.stream = open(out_file, "w", encoding="utf-8")
+            self.owned = True
+
+    def append(self, part):
+        self.stream.write(part)
+        self.stream.write('\n')
+
+    def extend(self, parts):
+        for part in parts:
+            self.append(part)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+        else:
+            # stdout 不能关，只把包装层拆下来（gzip 层要关闭以写出尾部，它不会关闭 stdout）
+            try:
+                self.stream.flush()
+            except BrokenPipeError:
+                # 读取方（head 等）先退出了：stdout 接到 devnull，剩余输出丢弃，包装层照常拆下
+                _discard_stdout()
+            raw = self.stream.detach()
+            if raw is not sys.stdout.buffer:
+                raw.close()
+            sys.stdout.buffer.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 def generate_policy_table(
     policies,
-    addresses, address_lookup,
-    address_groups, addrgrp_lookup,
-    services, service_lookup,
-    service_groups, svcgrp_lookup,
+    objects,
     undefined_addr, undefined_svc,
-    addresses6, address6_lookup,
-    address_groups6, addrgrp6_lookup,
-    vips, vip_lookup,
-    vipgrps, vipgrp_lookup,
-    zones, interfaces,
-    out_file="policy_object_table.html"
+    out_file="policy_object_table.html",
+    group_cycles=None,
+    policy_anomalies=None,
+    lazy=False,
+    windowed=False,
+    compress_payload=False,
+    compress_output=None
+):
+    """
+    生成可视化 HTML，边渲染边写出。out_file 为 '-' 时写到 stdout。
+    compress_output=True 时输出 gzip（None 时按 out_file 是否以 .gz 结尾决定，见 ReportWriter）。
+    lazy=False: 对象树放在共享 <template> 里；
+    lazy=True:  只嵌入 JSON 对象图，每个引用只占一个元素，点开时才由 JS 生成分支（大配置用）。
+    windowed=True: 策略行数据放在 JS 数组里分页渲染，DOM 中只有当前页；审核结果与提交打印覆盖全部页。
+    compress_payload=True: 行数据与对象图 gzip+base64 嵌入，浏览器里解压（隐含 lazy 与 windowed），
+                           得到单个自包含的小文件。
+    """
+    if compress_payload:
+        lazy = windowed = True
+    with ReportWriter(out_file, compress_output) as html:
+        _write_policy_table(
+            html, policies, objects, undefined_addr, undefined_svc,
+            group_cycles, policy_anomalies, lazy, windowed, compress_payload,
+        )
+    if out_file != '-':
+        print("生成完了:", out_file)
+
+def _write_policy_table(
+    html, policies, objects, undefined_addr, undefined_svc,
+    group_cycles, policy_anomalies, lazy, windowed, compress_payload,
 ):
     fields = [
         'id', 'name', 'action', 'status', 'srcintf', 'dstintf',
@@ -743,14 +572,13 @@ def generate_policy_table(
         'logtraffic', 'comments', 'uuid', 'policyid'
     ]
     expand_fields = {"srcaddr", "dstaddr", "service","srcaddr", "dstaddr", "service", "srcintf", "dstintf"}
-    html = [
+    html.extend([
         "<!DOCTYPE html><html lang='ja'><head><meta charset='UTF-8'>",
         "<title>FortiGateポリシービジュアライズ</title>",
+        # 共用样式只输出这一次，提交后的打印页面从这个元素复制
+        "<style id='report-css'>" + REPORT_CSS + "</style>",
         """
         <style>
-        table { border-collapse: collapse; font-family: Consolas, monospace; font-size: 14px; min-width:1200px; }
-        th, td { border: 1px solid #ccc; padding: 6px 10px; vertical-align: top; }
-        th { background: #eee; font-weight: bold; }
             th { 
         background: #eee;
         font-weight: bold;
@@ -758,26 +586,10 @@ def generate_policy_table(
         top: 0;
         z-index: 2;
         }
-        .object-branch { display:none; margin-top:6px; margin-left:6px; border-left:2px solid #999; padding-left:8px; background:#f9f9f9;}
-        .object-level { margin-left:12px; }
-        .cell-flex {
-            display: flex;
-            flex-direction: row;
-            justify-content: space-between;
-            align-items: center;
-            min-width: 120px;
-        }
-        .obj-name { flex: 1; overflow: hidden; text-overflow: ellipsis; white-space: nowrap; }
-        .toggle-btn { flex-shrink: 0; margin-left: 10px; color: blue; cursor: pointer; }
-        .review-row {background:#f6f6fa;}
-        .review-cell {padding:6px 4px 10px 4px; border-bottom:1px solid #eee;}
-        .row-del {background: #ffdddd !important; color: red !important; text-decoration: line-through;}
-        .row-mod {background: #fff7cc !important;}
-        .warnbox {background:#ffeeee;border:2px solid #f44;padding:14px 16px;font-size:16px;margin:18px 0;}
         </style>
         """,
         "</head><body>",
-    ]
+    ])
 
     # --- 在HTML前面输出未定义对象报表
     if undefined_addr or undefined_svc:
@@ -800,6 +612,21 @@ def generate_policy_table(
     else:
         html.append("<div style='background:#eaffea;color:#097;padding:10px 18px;'>未定義のオブジェクトはありません。すべて問題ありません。</div>")
 
+    # --- 循环引用的组（成员已合算展开）
+    if group_cycles:
+        html.append("<div class='warnbox'><b>循環参照しているグループ：</b><ul>")
+        for label, cycle in group_cycles:
+            items = " ⇄ ".join('<span style="color:#b00">{}</span>'.format(x) for x in cycle)
+            html.append("<li><b>{}：</b> {}</li>".format(label, items))
+        html.append("</ul>メンバーは循環内のグループを合算して展開しています。</div>")
+
+    # --- 遮蔽/冗余的策略（anomaly_messages 生成的说明行）
+    if policy_anomalies:
+        html.append("<div class='warnbox'><b>到達しない・冗長なポリシー：</b><ul>")
+        for line in policy_anomalies:
+            html.append("<li>{}</li>".format(line))
+        html.append("</ul>アドレス・サービス・インターフェースの範囲で判定しています（FQDN などは対象外）。</div>")
+
     html.append("""<div style="margin:12px 0; text-align:center;">
     <button onclick="http.expandAllBranches()" style="margin-right:10px;">すべて展開</button>
     <button onclick="http.collapseAllBranches()" style="margin-right:10px;">すべて折りたたむ</button>
@@ -808,69 +635,126 @@ def generate_policy_table(
     <input type="file" id="importFile" style="display:none;" accept=".json" />
     <button onclick="document.getElementById('importFile').click()">記録をインポート</button>
     </div>""")
+    tree = ObjectTree(objects)
+    if windowed:
+        html.append("""<div class="pager">
+    <button data-page="-1">前へ</button>
+    <span id="page-info"></span>
+    <button data-page="1">次へ</button>
+    <select id="page-size">""" + "".join(
+            f"<option{' selected' if n == WINDOW_PAGE_SIZE else ''}>{n}</option>" for n in (100, 200, 500, 1000)
+        ) + """</select> 件/ページ
+    </div>""")
+    header = "<tr>" + "".join(f"<th>{f}</th>" for f in fields) + "<th>処理方法</th><th>コメント</th></tr>"
     html.append("<table>")
-    html.append("<tr>" + "".join(f"<th>{f}</th>" for f in fields) + "<th>処理方法</th><th>コメント</th></tr>")
+    if windowed:
+        # 行数据逐行写进 JSON 数组（脚本元素），tbody 由 JS 按页填充
+        html.append(f"<thead>{header}</thead><tbody id='policy-body'></tbody></table>")
+        rows = JsonPayload(html, 'policy-rows', compress_payload)
+        rows.write(_json_text({'review': REVIEW_CELLS, 'pageSize': WINDOW_PAGE_SIZE})[:-1] + ',"rows":[')
+    else:
+        html.append(header)
+    html.flush()    # 表头之前的部分先落盘
+    sep = ""
     for policy in policies:
-        html.append("<tr>")
+        cells = []
         for f in fields:
             val = policy.get(f, "")
             if f in expand_fields and val:
                 vals = val if isinstance(val, list) else [val]
                 cell_inner = []
-                for idx, v in enumerate(vals):
-                    cell_id = f"{f}-{policy.get('id','')}-{idx}"
-                    branch_html = render_obj_branch(
-                        v,
-                        addresses, address_lookup,
-                        address_groups, addrgrp_lookup,
-                        services, service_lookup,
-                        service_groups, svcgrp_lookup,
-                        addresses6, address6_lookup,
-                        address_groups6, addrgrp6_lookup,
-                        vips, vip_lookup,
-                        vipgrps, vipgrp_lookup,
-                        zones, interfaces,      # 👈 这两行一定要加
-                    )
+                for v in vals:
+                    # 子树只在模板/对象图里出现一次，这里只放编号
+                    if lazy:
+                        cell_inner.append(f"<div class='obj-ref' data-ref='{tree.ref(v)}'>{v}</div>")
+                        continue
                     cell_inner.append(
-                        f"""<div class='cell-flex'>
-                            <span class='obj-name'>{v}</span>
-                            <span class='toggle-btn' onclick="toggleBranch('{cell_id}')">[+]</span>
-                        </div>
-                        <div class='object-branch' id='{cell_id}'>
-                            {branch_html}
-                        </div>"""
+                        f"<div class='cell-flex'><span class='obj-name'>{v}</span>"
+                        f"<span class='toggle-btn'>[+]</span></div>"
+                        f"<div class='object-branch' data-ref='{tree.ref(v)}'></div>"
                     )
-                html.append(f"<td>{''.join(cell_inner)}</td>")
+                cells.append(f"<td>{''.join(cell_inner)}</td>")
             else:
-                html.append(f"<td>{val}</td>")
+                cells.append(f"<td>{val}</td>")
         pid = policy.get('id','')
-        html.append(
-            f"""<td class='review-cell'>
-                <select class="review-action" data-id="{pid}">
-                  <option value="">--選択--</option>
-                  <option value="allow">許可（残す）</option>
-                  <option value="delete">削除</option>
-                  <option value="modify">修正</option>
-                </select>
-            </td>
-            <td class='review-cell'>
-                <input class="review-comment" data-id="{pid}" placeholder="理由や補足" style="width:120px">
-            </td>"""
-        )
+        if windowed:
+            # 行数据留在 JS 数组里，只渲染当前页
+            rows.write(sep + _json_text([pid, ''.join(cells)]))
+            sep = ","
+            continue
+        html.append("<tr>")
+        html.extend(cells)
+        html.append(REVIEW_CELLS.replace('{pid}', str(pid)))
         html.append("</tr>")
-    html.append("</table>")
+    if windowed:
+        rows.write("]}")
+        rows.close()
+    else:
+        html.append("</table>")
+    if lazy:
+        graph = JsonPayload(html, 'obj-graph', compress_payload)
+        graph.write(_json_text(tree.graph()))
+        graph.close()
+    else:
+        html.append("<div id='obj-defs'>")
+        html.extend(tree.templates())
+        html.append("</div>")
     html.append("""
     <button id="big-submit" style="width:92%;height:40px;font-size:1.3em;margin:30px 4%;">全ての処理内容を提出する</button>
     <script>
     let review_result = {};
+    // windowed 模式: 全部行 [策略ID, 单元格HTML] 在这个数组里，tbody 只放当前页
+    // lazy 模式: 对象图 {nodes, members}；两者都在页面加载后由 readPayload 读入
+    let POLICY_DATA = null;
+    let OBJ_GRAPH = null;
+    let page = 0;
+    let pageSize = 0;
+    // 读嵌入的 JSON；data-encoding='gzip-base64' 的先在浏览器里解压
+    async function readPayload(id) {
+        const el = document.getElementById(id);
+        if (!el) return null;
+        if (el.dataset.encoding !== 'gzip-base64') return JSON.parse(el.textContent);
+        const bin = atob(el.textContent);
+        const bytes = new Uint8Array(bin.length);
+        for (let i = 0; i < bin.length; ++i) bytes[i] = bin.charCodeAt(i);
+        const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+        return JSON.parse(await new Response(stream).text());
+    }
+    function rowHtml(r) {
+        return '<tr>' + r[1] + POLICY_DATA.review.split('{pid}').join(r[0]) + '</tr>';
+    }
+    function renderPage() {
+        let total = POLICY_DATA.rows.length;
+        let pages = Math.max(1, Math.ceil(total / pageSize));
+        page = Math.min(Math.max(page, 0), pages - 1);
+        let body = document.getElementById('policy-body');
+        body.innerHTML = POLICY_DATA.rows.slice(page * pageSize, (page + 1) * pageSize).map(rowHtml).join('');
+        fillReviewInputs(body);
+        document.getElementById('page-info').textContent = `${page + 1} / ${pages} ページ（全 ${total} 件）`;
+    }
+    // 提交打印用: 按全部行数据重建完整表格（不依赖当前页的 DOM）
+    function fullTable() {
+        let table = document.createElement('table');
+        table.innerHTML = '<thead>' + document.querySelector('table thead').innerHTML + '</thead><tbody>'
+            + POLICY_DATA.rows.map(rowHtml).join('') + '</tbody>';
+        return table;
+    }
 
     // ----------------------
     // 展开/收缩
     window.http = window.http || {};
     window.http.expandAllBranches = function() {
-        document.querySelectorAll('.object-branch').forEach(div => {
+        // 逐层填充展开；祖先里已出现同一编号的（循环嵌套）不再展开
+        document.querySelectorAll('.obj-ref').forEach(branchOf);
+        let stack = Array.from(document.querySelectorAll('.object-branch'));
+        while (stack.length) {
+            let div = stack.pop();
+            if (isCyclic(div)) continue;
+            let fresh = !div.dataset.filled;
+            fillBranch(div);
             div.style.display = 'block';
-        });
+            if (fresh) div.querySelectorAll('.object-branch').forEach(d => stack.push(d));
+        }
     }
     window.http.collapseAllBranches = function() {
         document.querySelectorAll('.object-branch').forEach(div => {
@@ -882,46 +766,64 @@ def generate_policy_table(
     function saveToLocal() {
         localStorage.setItem("fgt_policy_review", JSON.stringify(review_result));
     }
+    // 把 review_result 回填到 root 下的输入（windowed 模式下只有当前页）
+    function fillReviewInputs(root) {
+        root.querySelectorAll('.review-action').forEach(sel => {
+            let pid = sel.getAttribute('data-id');
+            if (review_result[pid] && review_result[pid].action)
+                sel.value = review_result[pid].action;
+            else
+                sel.value = "";
+        });
+        root.querySelectorAll('.review-comment').forEach(inp => {
+            let pid = inp.getAttribute('data-id');
+            if (review_result[pid] && review_result[pid].comment)
+                inp.value = review_result[pid].comment;
+            else
+                inp.value = "";
+        });
+    }
     function loadFromLocal() {
         try {
             const saved = localStorage.getItem("fgt_policy_review");
             if (saved) {
                 review_result = JSON.parse(saved);
                 // 回填到UI
-                document.querySelectorAll('.review-action').forEach(sel => {
-                    let pid = sel.getAttribute('data-id');
-                    if (review_result[pid] && review_result[pid].action)
-                        sel.value = review_result[pid].action;
-                    else
-                        sel.value = "";
-                });
-                document.querySelectorAll('.review-comment').forEach(inp => {
-                    let pid = inp.getAttribute('data-id');
-                    if (review_result[pid] && review_result[pid].comment)
-                        inp.value = review_result[pid].comment;
-                    else
-                        inp.value = "";
-                });
+                fillReviewInputs(document);
             }
         } catch(e) { review_result = {}; }
     }
-    // 页面初始加载时自动恢复
-    loadFromLocal();
+    // 页面初始加载时读入数据并自动恢复
+    Promise.all([readPayload('policy-rows'), readPayload('obj-graph')]).then(([rows, graph]) => {
+        POLICY_DATA = rows;
+        OBJ_GRAPH = graph;
+        if (POLICY_DATA) {
+            pageSize = POLICY_DATA.pageSize;
+            renderPage();
+        }
+        loadFromLocal();
+    });
 
-    // --- 每次修改自动保存 ---
-    document.querySelectorAll('.review-action').forEach(sel => {
-        sel.onchange = function() {
-            let pid = this.getAttribute('data-id');
+    // --- 每次修改自动保存（在 document 上委托，不再逐行绑定） ---
+    document.addEventListener('change', function(e) {
+        let el = e.target;
+        if (el.classList.contains('review-action')) {
+            let pid = el.getAttribute('data-id');
             review_result[pid] = review_result[pid] || {};
-            review_result[pid].action = this.value;
+            review_result[pid].action = el.value;
             saveToLocal();
+        } else if (el.id === 'page-size') {
+            pageSize = +el.value;
+            page = 0;
+            renderPage();
         }
     });
-    document.querySelectorAll('.review-comment').forEach(inp => {
-        inp.oninput = function() {
-            let pid = inp.getAttribute('data-id');
+    document.addEventListener('input', function(e) {
+        let el = e.target;
+        if (el.classList.contains('review-comment')) {
+            let pid = el.getAttribute('data-id');
             review_result[pid] = review_result[pid] || {};
-            review_result[pid].comment = this.value;
+            review_result[pid].comment = el.value;
             saveToLocal();
         }
     });
@@ -961,20 +863,7 @@ def generate_policy_table(
                     review_result = imported;
                     localStorage.setItem("fgt_policy_review", JSON.stringify(review_result));
                     // 自动回填到页面
-                    document.querySelectorAll('.review-action').forEach(sel => {
-                        let pid = sel.getAttribute('data-id');
-                        if (review_result[pid] && review_result[pid].action)
-                            sel.value = review_result[pid].action;
-                        else
-                            sel.value = "";
-                    });
-                    document.querySelectorAll('.review-comment').forEach(inp => {
-                        let pid = inp.getAttribute('data-id');
-                        if (review_result[pid] && review_result[pid].comment)
-                            inp.value = review_result[pid].comment;
-                        else
-                            inp.value = "";
-                    });
+                    fillReviewInputs(document);
                     alert('インポートして自動的に復元しました。');
                 } else {
                     alert("インポートした内容は有効な記録形式ではありません。");
@@ -988,41 +877,64 @@ def generate_policy_table(
     });
 
     // ------ 还要保留 toggleBranch -----
-    function toggleBranch(id) {
-        var div = document.getElementById(id);
+    // 分支内容在 <template> 或 JSON 对象图里只有一份，第一次展开时才填进来
+    function fillBranch(div) {
+        if (div.dataset.ref && !div.dataset.filled) {
+            let ref = div.dataset.ref;
+            if (OBJ_GRAPH) {
+                let num = +ref.slice(1);
+                div.innerHTML = ref[0] === 'n'
+                    ? OBJ_GRAPH.nodes[num]
+                    : OBJ_GRAPH.members[num].map(k => OBJ_GRAPH.nodes[k]).join('');
+            } else {
+                let tpl = document.getElementById(ref);
+                if (tpl) div.appendChild(tpl.content.cloneNode(true));
+            }
+            div.dataset.filled = '1';
+        }
+    }
+    // [+] 所在行后面的分支；lazy 模式的单元格引用（.obj-ref）第一次点开时才建分支
+    function branchOf(btn) {
+        let host = btn.classList.contains('obj-ref') ? btn : btn.parentNode;
+        let div = host.nextElementSibling;
+        if (!div || !div.classList.contains('object-branch')) {
+            div = document.createElement('div');
+            div.className = 'object-branch';
+            div.dataset.ref = host.dataset.ref;
+            host.after(div);
+        }
+        return div;
+    }
+    function isCyclic(div) {
+        for (let p = div.parentElement; p; p = p.parentElement) {
+            if (p.classList.contains('object-branch') && p.dataset.ref === div.dataset.ref) return true;
+        }
+        return false;
+    }
+    function toggleBranch(btn) {
+        var div = branchOf(btn);
+        fillBranch(div);
         if (div.style.display === 'none' || div.style.display === '') {
             div.style.display = 'block';
         } else {
             div.style.display = 'none';
         }
     }
+    // [+] 按钮与翻页按钮不再各自绑定 onclick，统一在 document 上委托
+    document.addEventListener('click', function(e) {
+        let cls = e.target.classList;
+        if (cls && (cls.contains('toggle-btn') || cls.contains('obj-ref'))) {
+            toggleBranch(e.target);
+        } else if (POLICY_DATA && e.target.dataset && e.target.dataset.page) {
+            page += +e.target.dataset.page;
+            renderPage();
+        }
+    });
 
 
     document.getElementById('big-submit').onclick = function() {
-        let pageStyle = `
-        <style>
-        table { border-collapse: collapse; font-family: Consolas, monospace; font-size: 14px; min-width:1200px; }
-        th, td { border: 1px solid #ccc; padding: 6px 10px; vertical-align: top; }
-        th { background: #eee; font-weight: bold; }
-        .object-branch { display:none; margin-top:6px; margin-left:6px; border-left:2px solid #999; padding-left:8px; background:#f9f9f9;}
-        .object-level { margin-left:12px; }
-        .cell-flex {
-            display: flex;
-            flex-direction: row;
-            justify-content: space-between;
-            align-items: center;
-            min-width: 120px;
-        }
-        .obj-name { flex: 1; overflow: hidden; text-overflow: ellipsis; white-space: nowrap; }
-        .toggle-btn { flex-shrink: 0; margin-left: 10px; color: blue; cursor: pointer; }
-        .review-row {background:#f6f6fa;}
-        .review-cell {padding:6px 4px 10px 4px; border-bottom:1px solid #eee;}
-        .row-del {background: #ffdddd !important; color: red !important; text-decoration: line-through;}
-        .row-mod {background: #fff7cc !important;}
-        .warnbox {background:#ffeeee;border:2px solid #f44;padding:14px 16px;font-size:16px;margin:18px 0;}
-        </style>
-        `;
-        let table = document.querySelector("table").cloneNode(true);
+        let pageStyle = document.getElementById('report-css').outerHTML;
+        let table = POLICY_DATA ? fullTable() : document.querySelector("table").cloneNode(true);
         if (table.rows.length > 0 && table.rows[0].cells.length > 0) {
             table.rows[0].deleteCell(-1);
             table.rows[0].deleteCell(-1);
@@ -1067,69 +979,159 @@ def generate_policy_table(
     };
     </script>
     """)
-    with open(out_file, "w", encoding="utf-8") as f:
-        f.write('\n'.join(html))
-    print("生成完了:", out_file)
-
-def main():
-    conf_path = choose_conf_file()
-    with open(conf_path, "r", encoding="utf-8") as f:
-        conf_text = f.read()
-
-    # ====== 采集对象 ======
-    addresses, address_lookup = parse_firewall_address(conf_text)
-    address_groups, addrgrp_lookup = parse_firewall_addrgrp(conf_text)
-    services, service_lookup = parse_firewall_service_custom(conf_text)
-    service_groups, svcgrp_lookup = parse_firewall_service_group(conf_text)
-    policies = parse_firewall_policy(conf_text)
-
-    # --- 新增各类对象采集（没有采集时就是空字典/空映射，不报错） ---
-    # VIP对象
-    vips, vip_lookup = {}, {}
-    try:
-        vips, vip_lookup = parse_firewall_vip(conf_text)
-    except Exception:
-        pass
-
-    # VIP组（如果需要，提前留好）
-    vipgrps, vipgrp_lookup = {}, {}
-
-    # IPv6
-    addresses6, address6_lookup = {}, {}
-    address_groups6, addrgrp6_lookup = {}, {}
-
-    # Zone/interface（安全区域/接口映射）
-    zones, interfaces = {}, {}
-
-    # 合并VIP到IPv4地址对象（这样能兼容旧的递归方式，也能支持VIP专有显示）
-    addresses.update(vips)
-    address_lookup.update(vip_lookup)
+
+# 输出格式 -> (文件后缀, compress_payload, 输出整体 gzip 压缩)
+REPORT_FORMATS = {
+    'html': ('.html', False, False),
+    'html.gz': ('.html.gz', False, True),
+    'packed': ('.html', True, False),
+}
+
+def build_report(conf_path, out_file="policy_object_table.html", vdoms=None, fmt='html', cache=None):
+    """
+    一份配置 -> 一份 HTML 报告。vdoms 给出时只输出这些 vdom 的策略与遮蔽分析
+    （未分 vdom 的配置记为 global）。cache 为 ParseCache 时经磁盘解析缓存读取。返回输出的策略数。
+    """
+    if cache is not None:
+        model, conf_text = cache.load(conf_path)
+        return build_report_text(conf_text, out_file, vdoms, fmt, model)
+    # mmap 只读映射，按需解码用到的段
+    return build_report_text(open_config(conf_path), out_file, vdoms, fmt)
+
+
+def build_report_text(conf_text, out_file="policy_object_table.html", vdoms=None, fmt='html', model=None):
+    """build_report 的主体，输入为配置文本（或 mmap）；model 为已解析的 ParsedConfig 时不再解析"""
+    # ====== 采集对象（整份配置合并为一个大小写不敏感索引，VIP 与地址并列） ======
+    if model is not None:
+        objects = model.objects
+        policies = model.policies
+        matcher = model.matcher()
+    else:
+        objects = load_objects(conf_text)
+        policies = load_policies(conf_text)
+        matcher = PolicyMatcher(conf_text)
+    if vdoms:
+        policies = [p for p in policies if (p.vdom or 'global') in vdoms]
 
     # ====== 递归检测未定义对象 ======
-    undefined_addr, undefined_svc = collect_undefined_objs(
-        policies, addresses, address_lookup,
-        address_groups, addrgrp_lookup,
-        services, service_lookup,
-        service_groups, svcgrp_lookup
-    )
-    zones = parse_firewall_zone(conf_text)
-    interfaces = parse_firewall_interface(conf_text)
+    undefined_addr, undefined_svc = collect_undefined_objs(policies, objects)
+
+    # ====== 组的循环引用（强连通分量） ======
+    group_cycles = []
+    for label, kind in (
+        ("IPv4グループ", 'addrgrp'),
+        ("服务组", 'servicegrp'),
+        ("VIP组", 'vipgrp'),
+    ):
+        for cycle in group_closure(objects.kind(kind), objects.lookup(kind)).cycles:
+            group_cycles.append((label, cycle))
 
+    # ====== 遮蔽/冗余策略 ======
+    found = policy_anomalies(matcher)
+    if vdoms:
+        found = {v: f for v, f in found.items() if (v or 'global') in vdoms}
+    anomalies = anomaly_messages(found)
+
+    # ====== 生成可视化HTML ======
     generate_policy_table(
-        policies, addresses, address_lookup,
-        address_groups, addrgrp_lookup,
-        services, service_lookup,
-        service_groups, svcgrp_lookup,
+        policies, objects,
         undefined_addr, undefined_svc,
-        addresses6, address6_lookup,
-        address_groups6, addrgrp6_lookup,
-        vips, vip_lookup,
-        vipgrps, vipgrp_lookup,
-        zones, interfaces,
-        out_file="policy_object_table.html"
+        out_file=out_file,
+        group_cycles=group_cycles,
+        policy_anomalies=anomalies,
+        lazy=len(policies) >= LAZY_POLICY_THRESHOLD,
+        windowed=len(policies) >= WINDOWED_POLICY_THRESHOLD,
+        compress_payload=REPORT_FORMATS[fmt][1],
+        compress_output=REPORT_FORMATS[fmt][2],
     )
-    # ====== 生成可视化HTML，参数全部传递 ======
+    return len(policies)
+
+
+def _render_vdom(conf_text, vdom, targets, fmt):
+    # map_vdoms 的子进程任务: 小配置只含 global 对象与这个 vdom，输出一份报告
+    return targets[vdom], build_report_text(conf_text, targets[vdom], [vdom], fmt)
+
+
+def build_vdom_reports(conf_path, out_file, vdoms=None, fmt='html', jobs=None):
+    """
+    每个 vdom 一份报告（<主文件名>_<vdom名><后缀>），在进程池里并行解析与生成。
+    返回 [(vdom名, 输出文件, 策略数), ...]，按配置中的 vdom 顺序。
+    没有启用 vdom 的配置只输出一份 out_file。
+    """
+    suffix = REPORT_FORMATS[fmt][0]
+    stem = out_file[:-len(suffix)] if out_file.endswith(suffix) else out_file
+    # 输出文件名在分发前定好（map_vdoms 内部会再建一次段索引，开销很小）
+    _, per_vdom = vdom_spans(open_config(conf_path))
+    if not per_vdom:
+        return [(None, out_file, build_report(conf_path, out_file, vdoms, fmt))]
+    targets = {vdom: f"{stem}_{vdom}{suffix}" for vdom, _ in per_vdom}
+    results = map_vdoms(conf_path, _render_vdom, args=(targets, fmt), vdoms=vdoms, jobs=jobs)
+    return [(vdom, path, count) for vdom, (path, count) in results]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="FortiGate 設定ファイルからポリシーの可視化 HTML を生成します。"
+                    "ファイルを指定しない場合はファイル選択ダイアログを開きます。"
+    )
+    parser.add_argument('paths', nargs='*', help="設定ファイル・ワイルドカード・ディレクトリ（複数可）")
+    parser.add_argument('--gui', action='store_true', help="ファイル選択ダイアログで選ぶ")
+    parser.add_argument('-d', '--output-dir', default='.', help="出力ディレクトリ（既定: カレント）")
+    parser.add_argument('-o', '--output', help="出力ファイル名（入力が 1 つのときのみ。'-' で標準出力）")
+    parser.add_argument('-f', '--format', choices=sorted(REPORT_FORMATS),
+                        help="html / html.gz / packed（データを圧縮埋め込みした単一 HTML）。"
+                             "既定: -o が .gz で終わるときは html.gz、それ以外は html")
+    parser.add_argument('--vdom', action='append', default=[], metavar='NAME',
+                        help="対象 VDOM（複数可。VDOM なしの設定は global）")
+    add_cache_arguments(parser)
+    parser.add_argument('--incremental', action='store_true',
+                        help="前回の解析結果から変更されたブロックだけを再解析する（キャッシュを使用）")
+    parser.add_argument('--split-vdoms', action='store_true',
+                        help="VDOM ごとに別ファイルで出力（<出力名>_<VDOM名>）し、VDOM 単位で並列処理する")
+    parser.add_argument('-j', '--jobs', type=int, help="--split-vdoms の並列プロセス数（既定: CPU コア数）")
+    args = parser.parse_args(argv)
+    if args.format is None:
+        args.format = 'html.gz' if args.output and args.output.endswith('.gz') else 'html'
+    if args.split_vdoms and args.output == '-':
+        parser.error("--split-vdoms は標準出力には書き出せません。")
+    if args.split_vdoms and (args.cache or args.cache_dir or args.incremental):
+        # 按 vdom 分文件输出时在子进程里各自解析，用不上解析缓存
+        parser.error("--cache / --cache-dir / --incremental は --split-vdoms と同時に指定できません。")
+
+    cache = cache_from_args(args)
+    if args.incremental:
+        cache = IncrementalParser(cache)
+    if args.gui or not args.paths:
+        # tkinter はダイアログを使うときだけ読み込む
+        build_report(choose_conf_file(), args.output or "policy_object_table.html", args.vdom, args.format, cache)
+        return 0
+
+    inputs = expand_inputs(args.paths)
+    if args.output and len(inputs) != 1:
+        parser.error("--output は入力ファイルが 1 つのときだけ指定できます。")
+    if args.output:
+        targets = {inputs[0]: args.output}
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        targets = output_paths(inputs, args.output_dir, REPORT_FORMATS[args.format][0])
+
+    failed = 0
+    for conf_path, out_file in targets.items():
+        if not os.path.isfile(conf_path):
+            print(f"ファイルが見つかりません: {conf_path}", file=sys.stderr)
+            failed += 1
+            continue
+        if args.split_vdoms:
+            build_vdom_reports(conf_path, out_file, args.vdom, args.format, args.jobs)
+            continue
+        try:
+            build_report(conf_path, out_file, args.vdom, args.format, cache)
+        except BrokenPipeError:
+            # -o - 的读取方（head 等）先退出了
+            _discard_stdout()
+            return 0
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from fortigate_model import SECTION_CLASSES
+from fortigate_parser import OBJECT_SECTIONS, _decode_span, open_config, section_index
+
+
+# 各 vdom 都要带上的 global 段: 对象与策略（global 里的系统设置等不复制）
+SHARED_SECTIONS = frozenset(OBJECT_SECTIONS) | frozenset(SECTION_CLASSES) | {'firewall policy'}
+
+
+def group_by_vdom(policies, default='global'):
+    """策略一次遍历按 vdom 分组: {vdom名: [策略, ...]}，键按首次出现的顺序；没有 vdom 的记为 default"""
+    groups = {}
+    for pol in policies:
+        groups.setdefault(pol.get('vdom', default), []).append(pol)
+    return groups
+
+
+def vdom_spans(conf):
+    """
+    从段偏移索引取各 vdom 的段区间（文档顺序）:
+      (global 段区间, [(vdom名, [段区间, ...]), ...])
+    global 只取 SHARED_SECTIONS 里的段。
+    """
+    index = section_index(conf)
+    shared = []
+    per_vdom = {vdom: [] for vdom in index.vdoms()}
+    for start, end, vdom, path in index.order:
+        if vdom is None:
+            if path in SHARED_SECTIONS:
+                shared.append((start, end))
+        else:
+            per_vdom[vdom].append((start, end))
+    return shared, list(per_vdom.items())
+
+
+def vdom_config_text(conf, shared, vdom=None, spans=()):
+    """
+    拼出只含 global 共享段与一个 vdom 的小配置文本，交给原有的解析/检查函数。
+    vdom 为 None 时只含 global 段。
+    """
+    parts = [_decode_span(conf, s, e) for s, e in shared]
+    if vdom is not None:
+        parts.append(f"config vdom\nedit \"{vdom}\"")
+        parts.extend(_decode_span(conf, s, e) for s, e in spans)
+        parts.append("next\nend")
+    return "\n".join(parts) + "\n"
+
+
+def _run_vdom(conf_path, shared, vdom, spans, func, args):
+    # 子进程: 自己 mmap 打开文件，只解码 global 共享段与本 vdom 的段
+    conf = open_config(conf_path)
+    return func(vdom_config_text(conf, shared, vdom, spans), vdom, *args)
+
+
+def map_vdoms(conf_path, func, args=(), vdoms=None, include_global=False, jobs=None):
+    """
+    把一份配置按 vdom 分发到进程池: 每个 vdom 调用 func(小配置文本, vdom名, *args)。
+    func 必须是模块级函数（可 pickle）。只向子进程传文件路径和偏移，不传文本。
+    返回 [(vdom名, 结果), ...]，顺序固定为配置中的 vdom 顺序（include_global 时 global 在最前，vdom 名为 None），
+    与各子进程完成的先后无关。vdoms 给出时只处理这些 vdom（global 的名字为 'global'）。
+    没有启用 vdom 的配置只有 global 一个任务。
+    """
+    conf = open_config(conf_path)
+    shared, per_vdom = vdom_spans(conf)
+    tasks = []
+    if include_global or not per_vdom:
+        if not vdoms or 'global' in vdoms or not per_vdom:
+            tasks.append((None, ()))
+    tasks.extend((vdom, spans) for vdom, spans in per_vdom if not vdoms or vdom in vdoms)
+    if not tasks:
+        return []
+    workers = min(jobs or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        return [(vdom, _run_vdom(conf_path, shared, vdom, spans, func, args)) for vdom, spans in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_vdom, conf_path, shared, vdom, spans, func, args) for vdom, spans in tasks]
+        return [(vdom, future.result()) for (vdom, _), future in zip(tasks, futures)]
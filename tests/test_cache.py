@@ -0,0 +1,138 @@
+import os
+
+import pytest
+
+import fortigate_cache
+from fortigate_cache import ParseCache, ParsedConfig, config_digest
+from fortigate_groups import group_closure
+
+
+CONF = """
+config firewall address
+    edit "A"
+        set subnet 10.0.0.1 255.255.255.255
+    next
+    edit "B"
+        set subnet 10.0.0.2 255.255.255.255
+    next
+end
+config firewall addrgrp
+    edit "INNER"
+        set member "A"
+    next
+    edit "OUTER"
+        set member "INNER" "B"
+    next
+end
+config firewall service custom
+    edit "ALL"
+        set protocol IP
+    next
+end
+config firewall policy
+    edit 1
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "all"
+        set dstaddr "OUTER"
+        set action accept
+        set service "ALL"
+    next
+end
+"""
+
+
+def _write(tmp_path, name="a.conf", text=CONF):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def _dump(model):
+    return (
+        {scope: {kind: {n: o.to_dict() for n, o in items.items()} for kind, items in objs.by_kind.items()}
+         for scope, objs in model.vdom_objects.items()},
+        [p.to_dict() for p in model.policies],
+        [(list(c.groups), {g: sorted(c.members(g)) for g in c.groups}) for c in model.closures],
+    )
+
+
+def _snapshots(cache):
+    return [os.path.basename(path) for _, _, path in cache.entries()]
+
+
+def test_snapshot_round_trip(tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    path = _write(tmp_path)
+    model, _ = cache.load(path)
+    loaded, _ = cache.load(path)
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert loaded is not model
+    assert _dump(loaded) == _dump(model)
+    assert loaded.matcher().match('port1', 'port2', '1.1.1.1', '10.0.0.1', 'tcp', 80).id == '1'
+
+
+def test_parser_version_change_invalidates(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path / "cache"))
+    path = _write(tmp_path)
+    cache.load(path)
+    digest = config_digest(CONF)
+    assert cache.get(digest) is not None
+    monkeypatch.setattr(fortigate_cache, 'PARSER_VERSION', fortigate_cache.PARSER_VERSION + 1)
+    assert cache.get(digest) is None
+    cache.load(path)
+    assert cache.misses == 2
+
+
+def test_lru_eviction_honors_max_bytes(tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    model = ParsedConfig(CONF)
+    for i, digest in enumerate(("a", "b", "c")):
+        cache.put(digest, model)
+        os.utime(cache.path_for(digest), (1000 + i, 1000 + i))
+    size = cache.entries()[0][1]
+    cache.get("a")      # 最近用过，不淘汰
+    cache.max_bytes = size * 3
+    cache.put("d", model)
+    assert sorted(_snapshots(cache)) == [os.path.basename(cache.path_for(d)) for d in ("a", "c", "d")]
+    assert sum(s for _, s, _ in cache.entries()) <= cache.max_bytes
+    # 上限比单个快照还小时，刚写入的那个也保留
+    cache.max_bytes = 1
+    cache.put("e", model)
+    assert _snapshots(cache) == [os.path.basename(cache.path_for("e"))]
+
+
+def test_failed_write_leaves_no_partial_files(tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    cache.put("a", ParsedConfig(CONF))
+    before = sorted(os.listdir(cache.directory))
+    with pytest.raises(Exception):
+        cache.put("a", lambda: None)        # 不能 pickle
+    assert sorted(os.listdir(cache.directory)) == before
+    assert cache.get("a") is not None
+
+
+def test_corrupt_snapshot_falls_back_to_parsing(tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    path = _write(tmp_path)
+    cache.load(path)
+    snap = cache.path_for(config_digest(CONF))
+    with open(snap, "r+b") as f:
+        f.seek(len(fortigate_cache._MAGIC) + 4)
+        f.write(b"\xff" * 16)
+    assert cache.get(config_digest(CONF)) is None
+    assert not os.path.exists(snap)
+    model, _ = cache.load(path)
+    assert cache.misses == 2
+    assert [p.id for p in model.policies] == ['1']
+    assert os.path.exists(snap)
+
+
+def test_loaded_closures_are_registered(tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    path = _write(tmp_path)
+    cache.load(path)
+    loaded, _ = cache.load(path)
+    assert loaded.closures
+    for closure in loaded.closures:
+        assert group_closure(closure.groups, closure.lookup) is closure
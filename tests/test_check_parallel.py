@@ -0,0 +1,94 @@
+from fortigate import check_config, check_config_parallel
+from fortigate_cache import ParsedConfig
+from fortigate_parser import open_config
+
+
+# v1 的策略引用了只在 v2 定义的 B2，v2 的策略引用了只在 v1 定义的 A1
+MULTI_VDOM_CONF = """
+config vdom
+edit v1
+next
+edit v2
+next
+end
+config global
+config firewall address
+    edit "G1"
+        set subnet 10.9.0.0 255.255.0.0
+    next
+end
+end
+config vdom
+edit v1
+config firewall address
+    edit "A1"
+        set subnet 10.1.0.0 255.255.0.0
+    next
+end
+config firewall policy
+    edit 1
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "A1"
+        set dstaddr "B2"
+        set action accept
+        set schedule "always"
+        set service "ALL"
+    next
+    edit 2
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "G1"
+        set dstaddr "A1"
+        set action accept
+        set schedule "always"
+        set service "ALL"
+    next
+end
+next
+edit v2
+config firewall address
+    edit "B2"
+        set subnet 10.2.0.0 255.255.0.0
+    next
+end
+config firewall addrgrp
+    edit "GR"
+        set member "B2"
+    next
+end
+config firewall policy
+    edit 5
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "GR"
+        set dstaddr "A1"
+        set action deny
+        set schedule "always"
+        set service "ALL"
+    next
+end
+next
+end
+"""
+
+
+def _write(tmp_path):
+    path = tmp_path / "multi.conf"
+    path.write_text(MULTI_VDOM_CONF, encoding="utf-8")
+    return str(path)
+
+
+def test_serial_parallel_and_cached_results_are_identical(tmp_path):
+    path = _write(tmp_path)
+    conf = open_config(path)
+    serial = check_config(conf)
+    assert serial == check_config_parallel(path, jobs=2)
+    assert serial == check_config(conf, model=ParsedConfig(conf))
+
+
+def test_other_vdom_objects_are_not_global(tmp_path):
+    issues, summary = check_config(open_config(_write(tmp_path)))
+    assert "ポリシーID 1: アドレス「B2」が v1 または global に未定義" in issues
+    assert "ポリシーID 2: アドレス「G1」は global 定義" in issues
+    assert not any(line.startswith("global:") for line in summary)
@@ -0,0 +1,97 @@
+from fortigate_cache import ParsedConfig
+from fortigate_diff import diff_models, match_policies
+from fortigate_model import Policy
+from fortigate_parser import build_tree
+
+
+def _policies(text):
+    sec = build_tree("config firewall policy\n" + text + "end\n").sections[0]
+    return [Policy.from_entry(entry) for entry in sec.entries.values()]
+
+
+def _ids(pairs):
+    return [(old.id, new.id) for old, new in pairs]
+
+
+def test_match_policies_prefers_uuid_over_id():
+    old = _policies('edit 1\nset uuid "u1"\nnext\nedit 2\nset uuid "u2"\nnext\n')
+    # 重新编号: uuid 相同的是同一条策略
+    new = _policies('edit 2\nset uuid "u1"\nnext\nedit 3\nset uuid "u2"\nnext\n')
+    pairs, added, removed = match_policies(old, new)
+    assert _ids(pairs) == [('1', '2'), ('2', '3')]
+    assert added == [] and removed == []
+
+
+def test_match_policies_falls_back_to_id():
+    old = _policies('edit 1\nset name "a"\nnext\nedit 2\nset uuid "u2"\nnext\n')
+    new = _policies('edit 1\nset uuid "u1"\nnext\nedit 2\nnext\n')
+    pairs, added, removed = match_policies(old, new)
+    assert _ids(pairs) == [('1', '1'), ('2', '2')]
+    assert added == [] and removed == []
+
+
+def test_different_uuids_are_delete_and_add():
+    old = _policies('edit 1\nset uuid "u1"\nnext\n')
+    new = _policies('edit 1\nset uuid "u9"\nnext\n')
+    pairs, added, removed = match_policies(old, new)
+    assert pairs == []
+    assert [p.uuid for p in added] == ['u9']
+    assert [p.uuid for p in removed] == ['u1']
+
+
+CONF = """
+config firewall address
+    edit "A"
+        set subnet 10.0.0.1 255.255.255.255
+    next
+    edit "B"
+        set subnet 10.0.0.2 255.255.255.255
+    next
+end
+config firewall addrgrp
+    edit "G"
+        set member "A"
+    next
+end
+config firewall policy
+    edit 1
+        set uuid "u1"
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "all"
+        set dstaddr "G"
+        set action accept
+        set service "ALL"
+    next
+end
+"""
+
+
+def test_membership_only_change_is_effective_not_modified():
+    old = ParsedConfig(CONF)
+    new = ParsedConfig(CONF.replace('set member "A"', 'set member "A" "B"'))
+    (vdom,) = diff_models(old, new)
+    assert vdom['objects'] == {
+        'addrgrp': {'added': [], 'removed': [], 'modified': [
+            {'name': 'G', 'changes': {'members': [['A'], ['A', 'B']]}},
+        ]},
+    }
+    policies = vdom['policies']
+    assert policies['modified'] == [] and policies['added'] == [] and policies['removed'] == []
+    assert [(e['id'], e['field'], e['via'], e['added'], e['removed']) for e in policies['effective']] == [
+        ('1', 'dstaddr', ['G'], ['B'], []),
+    ]
+
+
+def test_unchanged_content_is_skipped_by_digest():
+    old = ParsedConfig(CONF)
+    new = ParsedConfig(CONF)
+    assert old.policies[0] is not new.policies[0]
+    assert old.policies[0].digest == new.policies[0].digest
+    assert diff_models(old, new) == []
+    # 只差不显示的 set 项: 哈希不同，但没有可报告的字段变化
+    changed = ParsedConfig(CONF.replace(
+        'set subnet 10.0.0.2 255.255.255.255\n', 'set subnet 10.0.0.2 255.255.255.255\n        set color 3\n'
+    ))
+    assert changed.objects.find('B').digest != old.objects.find('B').digest
+    assert diff_models(old, changed) == []
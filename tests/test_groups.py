@@ -0,0 +1,12 @@
+from fortigate_groups import vdom_closures
+
+
+def test_vdom_closures_are_cached_without_leaf_kind():
+    # vipgrp 有组但没有 vip 叶子字典: 两次调用应命中同一个闭包
+    all_objs = {'global': {'addrgrp': {'G': ['A']}, 'address': {'A': True}, 'vipgrp': {'V': ['x']}}}
+    first = vdom_closures(all_objs, 'global')
+    second = vdom_closures(all_objs, 'global')
+    assert first.keys() == {'addrgrp', 'vipgrp'}
+    assert all(second[kind] is closure for kind, closure in first.items())
+    assert first['vipgrp'].members('V') == frozenset()
+    assert first['addrgrp'].members('G') == {'A'}
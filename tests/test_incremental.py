@@ -0,0 +1,151 @@
+from fortigate_cache import CLOSURE_KINDS, ParseCache, ParsedConfig
+from fortigate_groups import group_closure
+from fortigate_incremental import IncrementalParser
+from fortigate_parser import open_config
+
+
+BASE_CONF = """
+config vdom
+edit root
+next
+end
+config global
+config firewall address
+    edit "G1"
+        set subnet 10.9.0.0 255.255.0.0
+    next
+end
+end
+config vdom
+edit root
+config firewall address
+    edit "A"
+        set subnet 10.1.0.0 255.255.0.0
+    next
+    edit "B"
+        set subnet 10.2.0.0 255.255.0.0
+    next
+    edit "C"
+        set subnet 10.3.0.0 255.255.0.0
+    next
+end
+config firewall addrgrp
+    edit "INNER"
+        set member "A" "B"
+    next
+    edit "OUTER"
+        set member "INNER" "C"
+    next
+end
+config firewall service custom
+    edit "ALL"
+        set protocol IP
+    next
+end
+config firewall policy
+    edit 1
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "all"
+        set dstaddr "OUTER"
+        set action deny
+        set schedule "always"
+        set service "ALL"
+    next
+    edit 2
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "all"
+        set dstaddr "C"
+        set action accept
+        set schedule "always"
+        set service "ALL"
+    next
+    edit 3
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "all"
+        set dstaddr "NEW"
+        set action accept
+        set schedule "always"
+        set service "ALL"
+    next
+end
+next
+end
+"""
+
+QUERY_DSTS = ['10.1.0.1', '10.2.0.1', '10.3.0.1', '10.7.0.1', '10.9.0.1']
+
+
+def _snapshot(model):
+    """对象、策略、组闭包与查询结果，用来比较增量结果与整份重新解析"""
+    objects = {
+        scope: {kind: {n: o.to_dict() for n, o in items.items()} for kind, items in objs.by_kind.items()}
+        for scope, objs in model.vdom_objects.items()
+    }
+    closures = {}
+    for scope, objs in model.vdom_objects.items():
+        for kind in CLOSURE_KINDS:
+            groups = objs.kind(kind)
+            closure = group_closure(groups, objs.lookup(kind))
+            closures[scope, kind] = {g: sorted(closure.members(g)) for g in groups}
+    matches = {}
+    for vdom, rb in model.matcher().rulebases.items():
+        for dst in QUERY_DSTS:
+            pol, pending = rb.lookup('port1', 'port2', '192.0.2.1', dst, 'tcp', 80)
+            matches[vdom, dst] = (pol and pol.id, [p.id for p in pending])
+        matches[vdom] = {pid: sorted(names) for pid, names in rb.unresolved.items()}
+    policies = [(p.vdom, p.to_dict()) for p in model.policies]
+    return objects, closures, matches, policies
+
+
+def _steps(tmp_path, *edits):
+    """依次写入各版本配置，每一步都比较增量解析与整份重新解析，返回各步的快照"""
+    path = tmp_path / "inc.conf"
+    parser = IncrementalParser(ParseCache(str(tmp_path / "cache")))
+    text = BASE_CONF
+    result = []
+    for old, new in (None, None), *edits:
+        if old is not None:
+            assert old in text
+            text = text.replace(old, new)
+        path.write_text(text, encoding="utf-8")
+        model, conf = parser.load(str(path))
+        snapshot = _snapshot(model)
+        assert snapshot == _snapshot(ParsedConfig(open_config(str(path))))
+        result.append(snapshot)
+    return result
+
+
+def test_object_deleted_while_referenced(tmp_path):
+    before, after = _steps(tmp_path, (
+        '    edit "C"\n        set subnet 10.3.0.0 255.255.0.0\n    next\n', ''
+    ))
+    assert before[2]['root', '10.3.0.1'] == ('1', [])
+    assert after[2]['root', '10.3.0.1'] == (None, [])
+    assert after[2]['root']['2'] == ['C']
+    # 组闭包不查叶子是否定义，成员名原样保留
+    assert after[1]['root', 'addrgrp']['OUTER'] == ['A', 'B', 'C']
+
+
+def test_member_removed_from_nested_group(tmp_path):
+    before, after = _steps(tmp_path, ('set member "A" "B"', 'set member "A"'))
+    assert before[1]['root', 'addrgrp']['OUTER'] == ['A', 'B', 'C']
+    assert after[1]['root', 'addrgrp']['OUTER'] == ['A', 'C']
+    assert after[2]['root', '10.1.0.1'] == ('1', [])
+    assert after[2]['root', '10.2.0.1'] == (None, [])
+
+
+def test_previously_undefined_name_added(tmp_path):
+    steps = _steps(
+        tmp_path,
+        ('    edit "G1"\n', '    edit "NEW"\n        set subnet 10.7.0.0 255.255.0.0\n    next\n    edit "G1"\n'),
+        ('set dstaddr "C"\n', 'set dstaddr "C" "G1"\n'),
+    )
+    assert steps[0][2]['root'] == {'3': ['NEW']}
+    assert steps[0][2]['root', '10.7.0.1'] == (None, [])
+    assert steps[1][2]['root'] == {}
+    assert steps[1][2]['root', '10.7.0.1'] == ('3', [])
+    assert steps[1][2]['root', '10.9.0.1'] == (None, [])
+    assert steps[2][2]['root', '10.9.0.1'] == ('2', [])
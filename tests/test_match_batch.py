@@ -0,0 +1,37 @@
+import io
+from fortigate_match import PolicyMatcher, run_batch
+
+
+CONF = """
+config firewall service custom
+    edit "ALL"
+        set protocol IP
+    next
+end
+config firewall policy
+    edit 1
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "all"
+        set dstaddr "all"
+        set action accept
+        set schedule "always"
+        set service "ALL"
+    next
+end
+"""
+
+
+def test_bad_lines_are_reported_and_batch_continues():
+    lines = [
+        "port1 port2 10.0.0.1 8.8.8.8 tcp 8x\n",
+        "port1 port2 10.0.0.1 999.8.8.8 tcp 80\n",
+        "port1 port2 10.0.0.1\n",
+        "# comment\n",
+        "port1 port2 10.0.0.1 8.8.8.8 tcp 443\n",
+    ]
+    out = io.StringIO()
+    assert run_batch(PolicyMatcher(CONF), lines, out) == 4
+    results = [line.split(' -> ', 1)[1] for line in out.getvalue().splitlines()]
+    assert [r.startswith('error: ') for r in results] == [True, True, True, False]
+    assert results[3] == '1 accept'
@@ -0,0 +1,85 @@
+import io
+import json
+
+import fortigate_ndjson
+from fortigate_ndjson import write_ndjson
+
+
+CONF = """
+config firewall address
+    edit "A"
+        set subnet 10.0.0.1 255.255.255.255
+    next
+    edit "B"
+        set subnet 10.0.0.2 255.255.255.255
+    next
+end
+config firewall addrgrp
+    edit "INNER"
+        set member "A"
+    next
+    edit "OUTER"
+        set member "INNER" "B"
+    next
+end
+config firewall policy
+    edit 1
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "OUTER"
+        set dstaddr "all" "B"
+        set action accept
+        set service "HTTP"
+    next
+end
+config firewall service group
+    edit "LATE"
+        set member "HTTP"
+    next
+end
+"""
+
+
+def _records(tmp_path, **kwargs):
+    path = tmp_path / "a.conf"
+    path.write_text(CONF, encoding="utf-8")
+    out = io.StringIO()
+    counts = write_ndjson([str(path)], out, **kwargs)
+    return counts, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_records_in_document_order(tmp_path):
+    counts, records = _records(tmp_path)
+    assert counts == {'object': 5, 'policy': 1}
+    assert [(r['record'], r.get('kind'), r['data'].get('name') or r['data']['id']) for r in records] == [
+        ('object', 'address', 'A'),
+        ('object', 'address', 'B'),
+        ('object', 'addrgrp', 'INNER'),
+        ('object', 'addrgrp', 'OUTER'),
+        ('policy', None, '1'),
+        ('object', 'servicegrp', 'LATE'),
+    ]
+    assert all('leaves' not in r for r in records)
+
+
+def test_flatten_leaves(tmp_path):
+    _, records = _records(tmp_path, flatten=True, objects=False)
+    (policy,) = records
+    assert policy['record'] == 'policy' and policy['vdom'] is None
+    assert policy['data']['srcaddr'] == 'OUTER'
+    # 组展开到叶子；不是组的名字（all、B、在策略之后才定义的服务组成员）原样保留
+    assert policy['leaves'] == {'srcaddr': ['A', 'B'], 'dstaddr': ['B', 'all'], 'service': ['HTTP']}
+
+
+def test_mmaps_are_closed_after_each_file(tmp_path, monkeypatch):
+    opened = []
+
+    def open_config(path):
+        conf = original(path)
+        opened.append(conf)
+        return conf
+
+    original = fortigate_ndjson.open_config
+    monkeypatch.setattr(fortigate_ndjson, 'open_config', open_config)
+    _records(tmp_path, flatten=True)
+    assert len(opened) == 1 and opened[0].closed
@@ -0,0 +1,60 @@
+from fortigate_match import PolicyMatcher
+from fortigate_shadow import analyze_rulebase
+
+
+# 策略 1 否定了一个 FQDN 地址（无法转换为 IP 范围），策略 2 为 all/all
+NEGATED_FQDN_CONF = """
+config firewall address
+    edit "web"
+        set type fqdn
+        set fqdn "www.example.com"
+    next
+end
+config firewall service custom
+    edit "ALL"
+        set protocol IP
+    next
+end
+config firewall policy
+    edit 1
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "all"
+        set dstaddr "web"
+        set dstaddr-negate enable
+        set action deny
+        set schedule "always"
+        set service "ALL"
+    next
+    edit 2
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "all"
+        set dstaddr "all"
+        set action accept
+        set schedule "always"
+        set service "ALL"
+    next
+end
+"""
+
+
+def _rulebase():
+    return PolicyMatcher(NEGATED_FQDN_CONF).rulebase()
+
+
+def test_negated_unresolved_rule_is_inexact():
+    rb = _rulebase()
+    assert rb.indeterminate == 0b01
+    assert rb.inexact & 0b01
+
+
+def test_negated_unresolved_rule_does_not_shadow():
+    # www.example.com 的流量会到达策略 2，不能报告为遮蔽
+    assert analyze_rulebase(_rulebase()) == []
+
+
+def test_negated_unresolved_rule_is_not_a_definite_match():
+    pol, pending = _rulebase().lookup('port1', 'port2', '10.0.0.1', '8.8.8.8', 'tcp', 443)
+    assert pol.id == '2'
+    assert [p.id for p in pending] == ['1']
@@ -0,0 +1,77 @@
+import io
+
+from fortigate_match import PolicyMatcher, run_batch
+from fortigate_shadow import analyze_rulebase
+
+
+# 策略 1 的目的地址为 FQDN（已定义但无法转换为 IP 范围），策略 2 为 all/all
+FQDN_CONF = """
+config firewall address
+    edit "web"
+        set type fqdn
+        set fqdn "www.example.com"
+    next
+end
+config firewall service custom
+    edit "ALL"
+        set protocol IP
+    next
+end
+config firewall policy
+    edit 1
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "all"
+        set dstaddr "web"
+        set action deny
+        set schedule "always"
+        set service "ALL"
+    next
+    edit 2
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "all"
+        set dstaddr "all"
+        set action accept
+        set schedule "always"
+        set service "ALL"
+    next
+end
+"""
+
+
+def _rulebase(conf=FQDN_CONF):
+    return PolicyMatcher(conf).rulebase()
+
+
+def test_unconvertible_object_is_indeterminate_and_inexact():
+    rb = _rulebase()
+    assert rb.indeterminate == 0b01
+    assert rb.inexact & 0b01
+    assert rb.unresolved == {'1': {'web'}}
+
+
+def test_unconvertible_object_is_pending_in_lookup():
+    pol, pending = _rulebase().lookup('port1', 'port2', '10.0.0.1', '8.8.8.8', 'tcp', 443)
+    assert pol.id == '2'
+    assert [p.id for p in pending] == ['1']
+
+
+def test_unconvertible_object_in_batch():
+    out = io.StringIO()
+    run_batch(PolicyMatcher(FQDN_CONF), ["port1 port2 10.0.0.1 8.8.8.8 tcp 443\n"], out)
+    assert out.getvalue().endswith("-> 2 accept (indeterminate: 1)\n")
+
+
+def test_unconvertible_object_does_not_shadow():
+    # 策略 1 的区域是放大后的近似，既不能遮蔽策略 2，也不能被当作确定的冗余
+    assert analyze_rulebase(_rulebase()) == []
+
+
+def test_undefined_name_still_matches_nothing():
+    rb = _rulebase(FQDN_CONF.replace('set dstaddr "web"', 'set dstaddr "nowhere"'))
+    assert rb.indeterminate == 0
+    assert rb.unresolved == {'1': {'nowhere'}}
+    pol, pending = rb.lookup('port1', 'port2', '10.0.0.1', '8.8.8.8', 'tcp', 443)
+    assert pol.id == '2'
+    assert pending == []
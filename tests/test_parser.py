@@ -0,0 +1,106 @@
+from fortigate_parser import (
+    _iter_statements, build_tree, edit_spans, open_config, parse_config, parse_edit, section_index, split_vdoms,
+)
+
+
+CONF = """config system interface
+    edit "port1"
+        set ip 192.0.2.1 255.255.255.0
+        config ipv6
+            set ip6-address 2001:db8::1/64
+        end
+        set alias "uplink"
+    next
+    edit "port2"
+        set alias "dmz"
+    next
+end
+# 注释行
+config firewall address
+    edit "A"
+        set subnet 10.0.0.1 255.255.255.255
+        set comment "web # front end"
+    next
+    edit "B"
+        set comment "old"
+    next
+    edit "A"
+        set subnet 10.0.0.2 255.255.255.255
+        set comment "two words"
+    next
+end
+config vpn certificate local
+    edit "cert"
+        set certificate "-----BEGIN-----
+abc # not a comment
+-----END-----"
+    next
+end
+"""
+
+
+def _dump(node):
+    return (
+        node.kind, node.name, dict(node.settings), node.start, node.end,
+        {k: _dump(v) for k, v in node.entries.items()},
+        [_dump(s) for s in node.sections],
+    )
+
+
+def test_nested_config_inside_edit():
+    port1 = build_tree(CONF).sections[0].entries['port1']
+    assert [s.name for s in port1.sections] == ['ipv6']
+    assert port1.sections[0].get('ip6-address') == '2001:db8::1/64'
+    # 嵌套段的 end 之后的 set 仍属于 edit
+    assert port1.value('alias') == 'uplink'
+    start, end = section_index(CONF).get('system interface')[0]
+    assert [name for name, _, _ in edit_spans(CONF, start, end)] == ['port1', 'port2']
+
+
+def test_quoted_values_with_spaces_and_hash():
+    root = build_tree(CONF)
+    addr = root.sections[1]
+    assert addr.entries['A'].value('comment') == 'two words'
+    assert addr.entries['B'].value('comment') == 'old'
+    cert = root.sections[2].entries['cert'].value('certificate')
+    assert cert == "-----BEGIN-----\nabc # not a comment\n-----END-----"
+    assert build_tree('config a\nedit "x"\nset comment "web # front end"\nnext\nend\n') \
+        .sections[0].entries['x'].value('comment') == 'web # front end'
+
+
+def test_duplicate_edit_names_last_wins():
+    addr = build_tree(CONF).sections[1]
+    assert list(addr.entries) == ['A', 'B']
+    assert addr.entries['A'].value('subnet') == '10.0.0.2'
+    start, end = section_index(CONF).get('firewall address')[0]
+    spans = edit_spans(CONF, start, end)
+    assert [name for name, _, _ in spans] == ['A', 'B', 'A']
+    name, s, e = spans[2]
+    assert _dump(parse_edit(CONF, s, e, 'firewall address')) == _dump(addr.entries['A'])
+
+
+def test_str_bytes_and_mmap_inputs_agree(tmp_path):
+    # 纯 ASCII 的配置: 字符偏移与字节偏移相同，三种输入的结果应完全一致
+    path = tmp_path / "a.conf"
+    text = CONF.replace("# 注释行", "# comment")
+    path.write_text(text, encoding="utf-8")
+    inputs = [text, text.encode("utf-8"), open_config(str(path))]
+    trees = [_dump(parse_config(conf)) for conf in inputs]
+    assert trees[0] == trees[1] == trees[2]
+    statements = [[(kw, start, end) for kw, _, start, end in _iter_statements(conf)] for conf in inputs]
+    assert statements[0] == statements[1] == statements[2]
+    for path_name in ('system interface', 'firewall address'):
+        spans = [edit_spans(conf, *section_index(conf).get(path_name)[0]) for conf in inputs]
+        assert spans[0] == spans[1] == spans[2]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.conf"
+    path.write_bytes(b"")
+    conf = open_config(str(path))
+    assert conf == b""
+    root = parse_config(conf)
+    assert root.sections == [] and root.entries == {}
+    assert section_index(conf).order == []
+    assert split_vdoms(conf) == {None: []}
+    assert list(_iter_statements("")) == []
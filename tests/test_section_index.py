@@ -0,0 +1,51 @@
+import os
+
+from fortigate_parser import find_sections, open_config, section_index, vdom_scopes
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONF = """config firewall address6
+    edit "v6"
+        set ip6 2001:db8::/32
+    next
+end
+config firewall address
+    edit "v4"
+        set subnet 10.0.0.0 255.0.0.0
+    next
+end
+config firewall addrgrp
+    edit "grp"
+        set member "v4"
+    next
+end
+"""
+
+
+def test_exact_section_paths():
+    index = section_index(CONF)
+    assert [path for _, _, _, path in index.order] == ['firewall address6', 'firewall address', 'firewall addrgrp']
+    assert len(index.get('firewall address')) == 1
+    assert list(index.node(*index.get('firewall address')[0]).entries) == ['v4']
+    assert list(find_sections(CONF, 'firewall address6')[0].entries) == ['v6']
+    assert index.get('firewall addr') == []
+    assert index.text('firewall address')[0].startswith('config firewall address\n')
+
+
+def test_per_vdom_spans():
+    conf = open_config(os.path.join(ROOT, 'vdom.conf'))
+    index = section_index(conf)
+    assert index.vdoms() == ['vdom1', 'vdom2']
+    assert sorted(index.spans[None]) == [
+        'firewall address', 'firewall addrgrp', 'firewall service custom', 'firewall service group',
+    ]
+    assert list(index.spans['vdom1']) == ['firewall policy']
+    assert list(index.spans['vdom2']) == ['firewall address', 'firewall policy']
+    assert list(index.node(*index.get('firewall address', 'vdom2')[0]).entries) == ['Internal-Network']
+    assert list(index.node(*index.get('firewall policy', 'vdom1')[0]).entries) == ['1']
+    # 不同 vdom 的同名段互不混入
+    assert index.get('firewall address', 'vdom1') == []
+    scopes = vdom_scopes(conf, ('firewall address',))
+    assert [list(sec.entries) for sec in scopes['vdom2'].sections] == [['Internal-Network']]
+    assert [list(sec.entries) for sec in scopes[None].sections] == [['Web-Server-1', 'Web-Server-2', 'DB-Server']]
@@ -0,0 +1,111 @@
+import random
+
+import fortigate_shadow
+from fortigate_match import PolicyMatcher
+from fortigate_shadow import _interval_masks, analyze_rulebase, dominance_or
+
+
+ADDRESSES = """
+config firewall address
+    edit "NET"
+        set subnet 10.0.0.0 255.255.0.0
+    next
+    edit "LO"
+        set subnet 10.0.0.0 255.255.128.0
+    next
+    edit "HI"
+        set subnet 10.0.128.0 255.255.128.0
+    next
+    edit "SUB"
+        set subnet 10.0.1.0 255.255.255.0
+    next
+    edit "OTHER"
+        set subnet 192.168.0.0 255.255.255.0
+    next
+end
+config firewall service custom
+    edit "ALL"
+        set protocol IP
+    next
+end
+"""
+
+
+def _rulebase(*rules):
+    """rules: (目的地址, action) 的列表，策略 ID 依次为 1, 2, ..."""
+    lines = [ADDRESSES, "config firewall policy"]
+    for pid, (dst, action) in enumerate(rules, 1):
+        lines.append(f"""    edit {pid}
+        set srcintf "port1"
+        set dstintf "port2"
+        set srcaddr "all"
+        set dstaddr "{dst}"
+        set action {action}
+        set schedule "always"
+        set service "ALL"
+    next""")
+    lines.append("end")
+    return PolicyMatcher("\n".join(lines)).rulebase()
+
+
+def test_shadowed_by_single_earlier_rule():
+    rb = _rulebase(("NET", "accept"), ("SUB", "deny"))
+    assert analyze_rulebase(rb) == [('shadowed', '2', ['1'])]
+
+
+def test_disjoint_rule_is_not_shadowed():
+    assert analyze_rulebase(_rulebase(("NET", "accept"), ("OTHER", "deny"))) == []
+
+
+def test_shadowed_by_union_of_earlier_rules():
+    rb = _rulebase(("LO", "accept"), ("HI", "accept"), ("NET", "deny"))
+    assert analyze_rulebase(rb) == [('shadowed-union', '3', ['1', '2'])]
+
+
+def test_partial_union_is_not_shadowed():
+    assert analyze_rulebase(_rulebase(("LO", "accept"), ("OTHER", "accept"), ("NET", "deny"))) == []
+
+
+def test_union_check_over_budget_reports_nothing(monkeypatch):
+    monkeypatch.setattr(fortigate_shadow, 'UNION_BUDGET', 1)
+    assert analyze_rulebase(_rulebase(("LO", "accept"), ("HI", "accept"), ("NET", "deny"))) == []
+
+
+def test_redundant_with_later_same_action_rule():
+    rb = _rulebase(("SUB", "accept"), ("OTHER", "deny"), ("NET", "accept"))
+    assert analyze_rulebase(rb) == [('redundant', '1', ['3'])]
+
+
+def test_not_redundant_when_different_action_intersects_in_between():
+    # 策略 2 与策略 1 相交且 action 不同，去掉策略 1 会改变结果
+    assert analyze_rulebase(_rulebase(("SUB", "accept"), ("LO", "deny"), ("NET", "accept"))) == []
+
+
+def _brute_dominance(intervals, queries):
+    return [
+        sum(bit for lo, hi, bit in intervals if lo <= a and hi >= b)
+        for a, b in queries
+    ]
+
+
+def test_dominance_or_matches_brute_force():
+    rng = random.Random(7)
+    intervals = []
+    for pos in range(40):
+        lo = rng.randrange(100)
+        intervals.append((lo, lo + rng.randrange(30), 1 << pos))
+    queries = [(rng.randrange(130), rng.randrange(130)) for _ in range(200)]
+    # 同一位只出现一次，OR 与求和相同
+    assert dominance_or(intervals, queries) == _brute_dominance(intervals, queries)
+
+
+def test_interval_masks_cover_and_overlap():
+    regions = [
+        (None, None, [(0, 99)], [], []),
+        (None, None, [(10, 19), (50, 59)], [], []),
+        (None, None, [(15, 55)], [], []),
+        (None, None, [(200, 300)], [], []),
+    ]
+    cover, overlap = _interval_masks(regions, 2, 0b1111)
+    assert cover == [0b0001, 0b0011, 0b0101, 0b1000]
+    assert overlap == [0b0111, 0b0111, 0b0111, 0b1000]
@@ -0,0 +1,42 @@
+import os
+
+from fortigate_parser import build_tree, open_config, split_vdoms, vdom_slices
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _slices(conf):
+    return {vdom: vdom_slices(conf, spans) for vdom, spans in split_vdoms(conf).items()}
+
+
+def test_vdom_bodies_on_vdom_conf():
+    conf = open_config(os.path.join(ROOT, 'vdom.conf'))
+    slices = _slices(conf)
+    assert list(slices) == [None, 'vdom1', 'vdom2']
+    # 开头声明 vdom 的空 edit 没有正文，不产生区间
+    assert len(slices['vdom1']) == len(slices['vdom2']) == 1
+    vdom1 = build_tree(bytes(slices['vdom1'][0]).decode())
+    vdom2 = build_tree(bytes(slices['vdom2'][0]).decode())
+    assert [s.name for s in vdom1.sections] == ['firewall policy']
+    assert [s.name for s in vdom2.sections] == ['firewall address', 'firewall policy']
+    assert list(vdom2.sections[1].entries) == ['10']
+    # 'config vdom' 容器之外的部分（global 的对象段）归 None
+    outside = "".join(bytes(s).decode() for s in slices[None])
+    assert 'edit "Web-Server-1"' in outside
+    assert 'Internal-Network' not in outside and 'edit 1\n' not in outside
+
+
+def test_slices_are_zero_copy_views():
+    conf = open_config(os.path.join(ROOT, 'vdom.conf'))
+    for views in _slices(conf).values():
+        assert all(isinstance(v, memoryview) for v in views)
+    text = bytes(conf).decode()
+    assert _slices(text).keys() == _slices(conf).keys()
+    for vdom, views in _slices(conf).items():
+        assert [bytes(v).decode() for v in views] == _slices(text)[vdom]
+
+
+def test_config_without_vdoms():
+    text = "config firewall address\n    edit \"a\"\n    next\nend\n"
+    assert split_vdoms(text) == {None: [(0, len(text))]}
@@ -0,0 +1,94 @@
+import os
+import sqlite3
+
+import pytest
+
+from fortigate_sqlite import export_sqlite
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VDOM_CONF = os.path.join(ROOT, 'vdom.conf')
+
+
+def _query(db, sql, *args):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute(sql, args).fetchall()
+    finally:
+        conn.close()
+
+
+def _fail(path, count):
+    raise RuntimeError("stop")
+
+
+def test_schema_and_policy_leaves(tmp_path):
+    db = str(tmp_path / "fg.db")
+    counts = export_sqlite([VDOM_CONF], db)
+    assert counts['configs'] == 1 and counts['policies'] == 2
+    names = {row[0] for row in _query(db, "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+    assert {'configs', 'objects', 'members', 'flat_members', 'policies', 'policy_refs', 'policy_leaves'} <= names
+    leaves = _query(db, "SELECT field, ref, leaf FROM policy_leaves WHERE vdom = 'vdom1' AND policy_id = '1'"
+                        " AND field IN ('dstaddr', 'service') ORDER BY field, leaf")
+    assert leaves == [
+        ('dstaddr', 'App-Zone', 'DB-Server'),
+        ('dstaddr', 'App-Zone', 'Web-Server-1'),
+        ('dstaddr', 'App-Zone', 'Web-Server-2'),
+        ('service', 'Web-Services', 'My-HTTP'),
+        ('service', 'Web-Services', 'My-HTTPS'),
+    ]
+
+
+def test_policy_refs_scope_resolution(tmp_path):
+    db = str(tmp_path / "fg.db")
+    export_sqlite([VDOM_CONF], db)
+    refs = _query(db, "SELECT vdom, policy_id, field, name, scope, kind FROM policy_refs"
+                      " WHERE field IN ('srcaddr', 'dstaddr') ORDER BY vdom, field")
+    assert refs == [
+        ('vdom1', '1', 'dstaddr', 'App-Zone', 'global', 'addrgrp'),     # vdom 里没有，取 global 的定义
+        ('vdom1', '1', 'srcaddr', 'all', None, None),
+        ('vdom2', '10', 'dstaddr', 'all', None, None),
+        ('vdom2', '10', 'srcaddr', 'Internal-Network', 'vdom2', 'address'),
+    ]
+
+
+def test_flat_members_of_nested_group(tmp_path):
+    db = str(tmp_path / "fg.db")
+    export_sqlite([VDOM_CONF], db)
+    assert _query(db, "SELECT member, member_kind FROM members WHERE grp = 'App-Zone' ORDER BY position") == [
+        ('Server-Group', 'addrgrp'), ('DB-Server', 'address'),
+    ]
+    assert _query(db, "SELECT vdom, leaf FROM flat_members WHERE grp = 'App-Zone' ORDER BY leaf") == [
+        ('global', 'DB-Server'), ('global', 'Web-Server-1'), ('global', 'Web-Server-2'),
+    ]
+
+
+def test_append_adds_config_id(tmp_path):
+    db = str(tmp_path / "fg.db")
+    export_sqlite([VDOM_CONF], db, append=True)
+    counts = export_sqlite([VDOM_CONF], db, append=True)
+    assert counts['configs'] == 2 and counts['policies'] == 4
+    assert _query(db, "SELECT DISTINCT config_id FROM policies ORDER BY 1") == [(1,), (2,)]
+
+
+def test_failed_rebuild_keeps_existing_database(tmp_path):
+    db = str(tmp_path / "fg.db")
+    export_sqlite([VDOM_CONF], db)
+    with open(db + '.tmp', 'wb') as f:
+        f.write(b"stale")           # 上次中断留下的临时文件
+    with pytest.raises(RuntimeError):
+        export_sqlite([VDOM_CONF, VDOM_CONF], db, progress=_fail)
+    assert not os.path.exists(db + '.tmp')
+    assert _query(db, "SELECT COUNT(*) FROM configs") == [(1,)]
+    export_sqlite([VDOM_CONF], db)
+    assert not os.path.exists(db + '.tmp')
+    assert _query(db, "SELECT COUNT(*) FROM configs") == [(1,)]
+
+
+def test_failed_append_rolls_back(tmp_path):
+    db = str(tmp_path / "fg.db")
+    export_sqlite([VDOM_CONF], db)
+    with pytest.raises(RuntimeError):
+        export_sqlite([VDOM_CONF], db, append=True, progress=_fail)
+    assert _query(db, "SELECT COUNT(*) FROM configs") == [(1,)]
+    assert _query(db, "SELECT COUNT(*) FROM policies") == [(2,)]